@@ -0,0 +1,243 @@
+# core/pdf.py
+"""
+Warm WeasyPrint rendering service.
+
+Starting WeasyPrint cold (font discovery, Pango setup, stylesheet parsing)
+costs more than laying out a small invoice. Rendering goes through a pool of
+long-lived worker processes instead; each one loads fonts once and keeps
+parsed `CSS` objects for the shared stylesheets, keyed by path and mtime.
+
+- render_pdf(html, stylesheets=...) renders one document.
+- render_many(documents) renders a batch across the pool, in order.
+- render_stream(documents) does the same lazily, with a bounded number of
+  documents in flight, for chunked renders of very large reports.
+- merge_pdfs(parts, number_pages=True) stitches rendered chunks together and
+  stamps continuous "Page i of N" footers (needs the optional pypdf).
+
+Stylesheets are static paths such as "reports/report.css"; templates that
+use one should leave their <link> out when rendering for PDF. Workers are
+recycled after PDF_POOL_MAX_TASKS renders or once their peak RSS passes
+PDF_WORKER_MAX_RSS_MB. The pool is billiard's (Celery's fork of
+multiprocessing), which unlike the standard library lets daemonic processes
+such as Celery prefork children start one, so each worker child gets its own
+PDF_POOL_WORKERS renderers. With PDF_POOL_WORKERS = 0 documents render
+in-process with the same warm caches.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from collections import deque
+from functools import lru_cache
+from io import BytesIO
+from itertools import chain
+from typing import Iterable, Iterator, Optional, Sequence
+
+import billiard
+from billiard.exceptions import WorkerLostError
+from billiard.pool import Pool
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Optional PDF engine
+try:
+    from weasyprint import CSS, HTML
+    from weasyprint.text.fonts import FontConfiguration
+    AVAILABLE = True
+except Exception:
+    AVAILABLE = False
+
+# Optional PDF merging
+try:
+    from pypdf import PdfReader, PdfWriter
+    CAN_MERGE = True
+except Exception:
+    CAN_MERGE = False
+
+
+# ---------- worker side (no Django access: arguments are plain paths) ----------
+_font_config = None
+_css_cache: dict[str, tuple[float, object]] = {}
+
+
+def _fonts():
+    global _font_config
+    if _font_config is None:
+        _font_config = FontConfiguration()
+    return _font_config
+
+
+def _stylesheet(path: str):
+    mtime = os.path.getmtime(path)
+    cached = _css_cache.get(path)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, CSS(filename=path, font_config=_fonts()))
+        _css_cache[path] = cached
+    return cached[1]
+
+
+def _warm_up(stylesheet_paths: Sequence[str] = ()) -> None:
+    """Pool initializer: loads fonts and Pango with a throwaway render, then parses stylesheets."""
+    HTML(string="<p>warm-up</p>").write_pdf(font_config=_fonts())
+    for path in stylesheet_paths:
+        try:
+            _stylesheet(path)
+        except Exception as e:
+            logger.warning("Could not preload stylesheet %s: %s", path, e)
+
+
+def _render(html: str, stylesheet_paths: Sequence[str], base_url: str) -> bytes:
+    return HTML(string=html, base_url=base_url).write_pdf(
+        stylesheets=[_stylesheet(p) for p in stylesheet_paths],
+        font_config=_fonts(),
+    )
+
+
+# ---------- parent side ----------
+_pool: Optional[Pool] = None
+_pool_lock = threading.Lock()
+_warmed_in_process = False
+
+
+@lru_cache(maxsize=None)
+def _resolve(stylesheet: str) -> str:
+    if os.path.isabs(stylesheet):
+        return stylesheet
+    from django.contrib.staticfiles import finders
+    path = finders.find(stylesheet)
+    if not path:
+        raise FileNotFoundError(f"Stylesheet '{stylesheet}' not found in static files")
+    return path
+
+
+def _pool_size() -> int:
+    return int(getattr(settings, "PDF_POOL_WORKERS", 0))
+
+
+def _preload_paths() -> list[str]:
+    paths = []
+    for name in getattr(settings, "PDF_PRELOAD_STYLESHEETS", ()):
+        try:
+            paths.append(_resolve(name))
+        except FileNotFoundError as e:
+            logger.warning("%s", e)
+    return paths
+
+
+def _get_pool() -> Optional[Pool]:
+    global _pool
+    workers = _pool_size()
+    if not workers:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # Spawned, not forked: a fork would copy the parent's database
+            # connections and Celery state into every renderer.
+            _pool = Pool(
+                workers,
+                initializer=_warm_up,
+                initargs=(_preload_paths(),),
+                maxtasksperchild=int(getattr(settings, "PDF_POOL_MAX_TASKS", 200)),
+                max_memory_per_child=int(getattr(settings, "PDF_WORKER_MAX_RSS_MB", 512)) * 1024,  # KiB
+                context=billiard.get_context("spawn"),
+            )
+        return _pool
+
+
+def close_pool() -> None:
+    """
+    Stops the renderers once in-flight documents finish; the next render
+    starts a fresh pool. Closing rather than terminating also stops the pool
+    from replacing recycled workers while it shuts down.
+    """
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+
+def _in_process(html: str, paths: Sequence[str], base_url: str) -> bytes:
+    global _warmed_in_process
+    if not _warmed_in_process:
+        _warm_up(_preload_paths())
+        _warmed_in_process = True
+    return _render(html, paths, base_url)
+
+
+def render_stream(documents: Iterable[tuple[str, Sequence[str]]], base_url: Optional[str] = None,
+                  window: Optional[int] = None) -> Iterator[bytes]:
+    """
+    Lazily renders (html, stylesheets) pairs, yielding PDFs in input order.
+    At most `window` documents (default: twice the pool size) are pulled
+    from `documents` ahead of the consumer, so memory stays bounded.
+    """
+    if not AVAILABLE:
+        raise RuntimeError("WeasyPrint is not installed")
+    base_url = base_url or str(settings.BASE_DIR)
+    jobs = ((html, tuple(_resolve(s) for s in stylesheets)) for html, stylesheets in documents)
+
+    pool = _get_pool()
+    if pool is None:
+        for html, paths in jobs:
+            yield _in_process(html, paths, base_url)
+        return
+
+    window = max(1, window or 2 * _pool_size())
+    pending: deque = deque()
+    # The trailing None flushes whatever is still in flight.
+    for job in chain(jobs, [None]):
+        if job is not None:
+            pending.append((pool.apply_async(_render, (*job, base_url)), job))
+        while pending and (job is None or len(pending) >= window):
+            result, (html, paths) = pending.popleft()
+            try:
+                yield result.get()
+            except WorkerLostError:
+                # The pool replaces the worker; this document renders here.
+                logger.warning("PDF worker was lost; rendering the document in-process")
+                yield _in_process(html, paths, base_url)
+
+
+def render_many(documents: Iterable[tuple[str, Sequence[str]]], base_url: Optional[str] = None) -> list[bytes]:
+    """Renders (html, stylesheets) pairs and returns the PDFs in input order."""
+    documents = list(documents)
+    return list(render_stream(documents, base_url=base_url, window=len(documents)))
+
+
+def render_pdf(html: str, stylesheets: Sequence[str] = (), base_url: Optional[str] = None) -> bytes:
+    return render_many([(html, stylesheets)], base_url=base_url)[0]
+
+
+# Blank pages carrying only the footer; stamped over the merged document.
+PAGE_NUMBER_CSS = """
+@page { @bottom-right { content: "Page " counter(page) " of " counter(pages); font-size: 9pt; color: #666; } }
+div { height: 1px; }
+div + div { break-before: page; }
+"""
+
+
+def merge_pdfs(parts: Iterable[bytes], number_pages: bool = False, page_css: str = PAGE_NUMBER_CSS) -> bytes:
+    """
+    Concatenates PDFs (consumed one at a time) into one document. With
+    `number_pages`, every page gets a continuous "Page i of N" footer from a
+    cheap overlay render; `page_css` must use the same page size as the parts.
+    """
+    if not CAN_MERGE:
+        raise RuntimeError("pypdf is not installed")
+    writer = PdfWriter()
+    for part in parts:
+        writer.append(PdfReader(BytesIO(part)))
+
+    if number_pages and writer.pages:
+        total = len(writer.pages)
+        overlay = render_pdf(f"<html><head><style>{page_css}</style></head><body>{'<div></div>' * total}</body></html>")
+        for page, stamp in zip(writer.pages, PdfReader(BytesIO(overlay)).pages):
+            page.merge_page(stamp)
+
+    out = BytesIO()
+    writer.write(out)
+    return out.getvalue()
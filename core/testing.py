@@ -0,0 +1,31 @@
+# core/testing.py
+"""Fixture factories shared by the app test suites."""
+from datetime import date
+from decimal import Decimal
+
+from finance.models import Invoice
+from hr.models import Staff
+from student.models import Student
+
+
+def make_student(n=0, **kwargs):
+    fields = dict(
+        first_name=f"Student{n}", last_name="Test", gender="M", date_of_birth=date(2020, 1, 1),
+        guardian_name="Guardian", guardian_phone="0500000000", parent_id_number=f"P-{n}",
+        parent_id_expiry=date(2030, 1, 1),
+    )
+    return Student.objects.create(**{**fields, **kwargs})
+
+
+def make_staff(n=0, **kwargs):
+    fields = dict(
+        first_name=f"Staff{n}", last_name="Member", role="TEACHER", email=f"staff{n}@example.com",
+        phone="0500000000", id_number=f"ID-{n}", id_expiry=date(2030, 1, 1), hire_date=date(2020, 1, 1),
+    )
+    return Staff.objects.create(**{**fields, **kwargs})
+
+
+def make_invoice(student, amount="100.00", issued=date(2025, 3, 1), due=date(2025, 3, 15), **kwargs):
+    """A SENT invoice unless `status` is given"""
+    return Invoice.objects.create(student=student, amount=Decimal(amount), issue_date=issued, due_date=due,
+                                  **{"status": "SENT", **kwargs})
@@ -1,3 +1,47 @@
-from django.test import TestCase
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import billiard
+from billiard.exceptions import WorkerLostError
+from django.test import SimpleTestCase, override_settings
+
+from . import pdf
+
+
+def _render_in_daemon(queue):
+    out = list(pdf.render_stream((f"<p>{i}</p>", ()) for i in range(3)))
+    queue.put((billiard.current_process().daemon, pdf._pool is not None, [o[:4] for o in out]))
+
+
+@skipUnless(pdf.AVAILABLE, "needs WeasyPrint")
+@override_settings(PDF_POOL_WORKERS=2)
+class RenderPoolTests(SimpleTestCase):
+    def tearDown(self):
+        pdf.close_pool()
+
+    def test_batch_renders_through_the_pool_in_order(self):
+        with mock.patch.object(pdf, "_in_process") as in_process:
+            out = pdf.render_many((f"<p>{i}</p>", ["reports/report.css"]) for i in range(5))
+        self.assertEqual(len(out), 5)
+        self.assertTrue(all(o.startswith(b"%PDF") for o in out))
+        self.assertIsNotNone(pdf._pool)
+        in_process.assert_not_called()
+
+    def test_celery_style_daemonic_process_starts_its_own_pool(self):
+        queue = billiard.Queue()
+        child = billiard.Process(target=_render_in_daemon, args=(queue,), daemon=True)
+        child.start()
+        self.assertEqual(queue.get(timeout=60), (True, True, [b"%PDF"] * 3))
+        child.join(30)
+
+    def test_lost_worker_renders_that_document_in_process(self):
+        lost, fine = mock.Mock(), mock.Mock()
+        lost.get.side_effect = WorkerLostError("killed")
+        fine.get.return_value = b"pooled"
+        pool = mock.Mock(**{"apply_async.side_effect": [fine, lost, fine]})
+
+        with mock.patch.object(pdf, "_get_pool", return_value=pool), \
+                mock.patch.object(pdf, "_in_process", return_value=b"local") as in_process:
+            out = list(pdf.render_stream((f"<p>{i}</p>", ()) for i in range(3)))
+
+        self.assertEqual(out, [b"pooled", b"local", b"pooled"])
+        self.assertEqual(in_process.call_args.args[0], "<p>1</p>")
@@ -3,6 +3,7 @@ from django.contrib import admin
 from .models import (
     Treasury,
     TreasuryTransaction,
+    TreasuryBalanceSnapshot,
     Invoice,
     Payment,
     Expense,
@@ -13,16 +14,33 @@ from .models import (
 # ───────── Treasury ─────────
 @admin.register(Treasury)
 class TreasuryAdmin(admin.ModelAdmin):
-    list_display  = ("id", "name", "balance")
+    list_display  = ("id", "name", "current_balance")
     search_fields = ("name",)
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_balance()
+
+
+@admin.register(TreasuryBalanceSnapshot)
+class TreasuryBalanceSnapshotAdmin(admin.ModelAdmin):
+    list_display  = ("id", "treasury", "date", "balance", "taken_at")
+    list_filter   = ("treasury",)
+    date_hierarchy = "date"
+
 
 @admin.register(TreasuryTransaction)
 class TreasuryTransactionAdmin(admin.ModelAdmin):
-    list_display        = ("id", "treasury", "date", "amount", "is_inflow", "reference")
-    list_filter         = ("treasury", "is_inflow", "date")
+    list_display        = ("id", "treasury", "date", "amount", "is_inflow", "source_type", "reference", "compacted")
+    list_filter         = ("treasury", "is_inflow", "source_type", "compacted", "date")
     search_fields       = ("reference", "description")
     autocomplete_fields = ("treasury",)
+    readonly_fields     = ("source_type", "source_id")
+
+    def has_change_permission(self, request, obj=None):
+        return obj is None and super().has_change_permission(request)
+
+    def has_delete_permission(self, request, obj=None):
+        return False
 
 
 # ───────── Invoices & Payments ─────────
@@ -41,14 +41,26 @@ class PurchaseOrderSerializer(serializers.ModelSerializer):
         read_only_fields = ['po_number']
 
 class TreasurySerializer(serializers.ModelSerializer):
+    """`balance` is the opening balance on create and the current (ledger) balance on read"""
     class Meta:
         model = Treasury
         fields = "__all__"
 
+    def update(self, instance, validated_data):
+        # Balances only move through ledger entries.
+        validated_data.pop("balance", None)
+        return super().update(instance, validated_data)
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        data["balance"] = serializers.DecimalField(max_digits=12, decimal_places=2).to_representation(instance.current_balance)
+        return data
+
 class TreasuryTransactionSerializer(serializers.ModelSerializer):
     class Meta:
         model = TreasuryTransaction
         fields = "__all__"
+        read_only_fields = ("source_type", "source_id", "compacted")
 
 class SalaryPaymentSerializer(serializers.ModelSerializer):
     staff_name = serializers.CharField(source='salary_record.staff.full_name', read_only=True)
@@ -16,7 +16,9 @@ from finance.views import (
     PurchaseOrderPDFView,
     InvoicePDFView,
     InvoiceEmailView,
-    PaymentReceiptEmailView
+    PaymentReceiptPDFView,
+    PaymentReceiptEmailView,
+    PaymentImportView
 )
 
 router = DefaultRouter()
@@ -30,12 +32,15 @@ router.register("treasury-transactions", TreasuryTransactionViewSet)
 router.register("salary-payments", SalaryPaymentViewSet)
 
 urlpatterns = [
+    # Before the router, whose payments/<pk>/ route would swallow it
+    path("payments/import/", PaymentImportView.as_view(), name="payment_import"),
     path("", include(router.urls)),
     
     # PDF and Email endpoints
     path("purchase-orders/<int:pk>/pdf/", PurchaseOrderPDFView.as_view(), name="po_pdf"),
     path("invoices/<int:pk>/pdf/",   InvoicePDFView.as_view(),    name="invoice_pdf"),
     path("invoices/<int:pk>/email/", InvoiceEmailView.as_view(),  name="invoice_email"),
+    path("payments/<int:pk>/receipt.pdf", PaymentReceiptPDFView.as_view(), name="payment_receipt_pdf"),
     path("payments/<int:pk>/email/", PaymentReceiptEmailView.as_view(), name="payment_receipt_email"),
     
     # API endpoint
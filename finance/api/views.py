@@ -50,7 +50,7 @@ class PurchaseOrderViewSet(viewsets.ModelViewSet):
     module_name = 'finance'
 
 class TreasuryViewSet(viewsets.ModelViewSet):
-    queryset = Treasury.objects.all()
+    queryset = Treasury.objects.with_balance()
     serializer_class = TreasurySerializer
     permission_classes = [IsAuthenticated, ModulePermission]
     module_name = 'finance'
@@ -58,6 +58,8 @@ class TreasuryViewSet(viewsets.ModelViewSet):
 class TreasuryTransactionViewSet(viewsets.ModelViewSet):
     queryset = TreasuryTransaction.objects.all()
     serializer_class = TreasuryTransactionSerializer
+    # The ledger is append-only: corrections are new entries.
+    http_method_names = ["get", "post", "head", "options"]
     permission_classes = [IsAuthenticated, ModulePermission]
     module_name = 'finance'
 
@@ -0,0 +1,134 @@
+# finance/balances.py
+"""
+Point-in-time treasury balances.
+
+Every movement is a TreasuryTransaction ledger entry (see finance.ledger), and
+Treasury.current_balance is the live total. The closing balance of any past
+day is that total minus the entries dated after the day. TreasuryBalanceSnapshot stores these
+closing balances daily, so an as-of lookup needs the latest snapshot on or
+before the date plus the movements dated after it (normally a day or two),
+instead of replaying the whole history.
+
+Appending a back-dated entry drops the snapshots it affects. The next
+snapshot_balances() run fills them back in.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Optional
+
+from django.db.models import Max, Q, Sum
+
+from .models import Treasury, TreasuryBalanceSnapshot, TreasuryTransaction
+
+ZERO = Decimal("0.00")
+
+
+def movements_by_day(after: date, upto: Optional[date] = None, treasury_ids=None) -> dict[int, dict[date, Decimal]]:
+    """{treasury_id: {day: net movement}} for days in (after, upto]; one grouped ledger query."""
+    window = Q(date__gt=after)
+    if upto is not None:
+        window &= Q(date__lte=upto)
+    if treasury_ids is not None:
+        window &= Q(treasury_id__in=treasury_ids)
+    net = defaultdict(dict)
+    for treasury_id, day, total in (
+        TreasuryTransaction.objects.filter(window).order_by().values("treasury_id", "date")
+        .annotate(total=Sum(TreasuryTransaction.SIGNED_AMOUNT)).values_list("treasury_id", "date", "total")
+    ):
+        net[treasury_id][day] = total or ZERO
+    return net
+
+
+def _movement_totals(window: Q) -> dict[int, Decimal]:
+    return {
+        treasury_id: total or ZERO
+        for treasury_id, total in (
+            TreasuryTransaction.objects.filter(window).order_by().values("treasury_id")
+            .annotate(total=Sum(TreasuryTransaction.SIGNED_AMOUNT)).values_list("treasury_id", "total")
+        )
+    }
+
+
+def snapshot_balances(upto: Optional[date] = None, since: Optional[date] = None) -> int:
+    """
+    Stores closing balances for every missing day in [since, upto] (`upto`
+    defaults to yesterday). `since` defaults to the day after each treasury's
+    latest snapshot, or `upto` itself for a treasury without any. Balances
+    are walked backwards from the current balance over one grouped ledger
+    scan. Returns the number of snapshots written.
+    """
+    upto = upto or date.today() - timedelta(days=1)
+    treasuries = list(
+        Treasury.objects.with_balance()
+        .annotate(last=Max("snapshots__date", filter=Q(snapshots__date__lte=upto)))
+        .values_list("pk", "_current_balance", "last")
+    )
+    if not treasuries:
+        return 0
+    first = {
+        pk: since or (last + timedelta(days=1) if last else upto)
+        for pk, _balance, last in treasuries
+    }
+    earliest = min(first.values())
+    if earliest > upto:
+        return 0
+    net = movements_by_day(earliest - timedelta(days=1))
+    existing = set(
+        TreasuryBalanceSnapshot.objects.filter(date__range=(earliest, upto)).values_list("treasury_id", "date")
+    )
+
+    snapshots = []
+    for pk, balance, _last in treasuries:
+        days = net.get(pk, {})
+        # Close of `upto`: the live balance minus everything dated later.
+        closing = balance - sum((v for d, v in days.items() if d > upto), ZERO)
+        day = upto
+        while day >= first[pk]:
+            if (pk, day) not in existing:
+                snapshots.append(TreasuryBalanceSnapshot(treasury_id=pk, date=day, balance=closing))
+            closing -= days.get(day, ZERO)
+            day -= timedelta(days=1)
+    TreasuryBalanceSnapshot.objects.bulk_create(snapshots, ignore_conflicts=True)
+    return len(snapshots)
+
+
+def balances_as_of(as_of: date) -> list[dict]:
+    """
+    Closing balance of every treasury at the end of `as_of`: the latest
+    snapshot on or before it plus the movements dated after the snapshot.
+    A treasury with no snapshot that early falls back to its live balance
+    minus the movements dated after `as_of`.
+    """
+    treasuries = list(
+        Treasury.objects.with_balance()
+        .annotate(snap_date=Max("snapshots__date", filter=Q(snapshots__date__lte=as_of)))
+        .order_by("name").values("pk", "name", "snap_date", "_current_balance")
+    )
+    anchored = [t for t in treasuries if t["snap_date"]]
+    snaps = {}
+    if anchored:
+        snaps = dict(
+            TreasuryBalanceSnapshot.objects.filter(
+                Q(*[Q(treasury_id=t["pk"], date=t["snap_date"]) for t in anchored], _connector=Q.OR)
+            ).values_list("treasury_id", "balance")
+        )
+        since = min(t["snap_date"] for t in anchored)
+        forward = movements_by_day(since, as_of, [t["pk"] for t in anchored])
+    unanchored = [t["pk"] for t in treasuries if not t["snap_date"]]
+    backward = _movement_totals(Q(date__gt=as_of, treasury_id__in=unanchored)) if unanchored else {}
+
+    for t in treasuries:
+        if t["snap_date"]:
+            days = forward.get(t["pk"], {})
+            t["balance"] = snaps[t["pk"]] + sum((v for d, v in days.items() if d > t["snap_date"]), ZERO)
+        else:
+            t["balance"] = t["_current_balance"] - backward.get(t["pk"], ZERO)
+    return [{"id": t["pk"], "name": t["name"], "balance": t["balance"], "snapshot": t["snap_date"]} for t in treasuries]
+
+
+def invalidate_snapshots(treasury_id: int, day: date) -> None:
+    """An entry dated `day` was appended: every later closing balance is stale."""
+    TreasuryBalanceSnapshot.objects.filter(treasury_id=treasury_id, date__gte=day).delete()
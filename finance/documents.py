@@ -0,0 +1,250 @@
+# finance/documents.py
+"""
+Versioned cache of rendered invoice, receipt and purchase-order PDFs.
+
+Every rendered PDF is kept in media storage as a RenderedDocument, keyed by
+kind and primary key and tagged with a version token: a hash of what the
+PDF shows that can change. That covers the updated_at of the row and its
+relations, plus the invoice's paid_total and status, which payments move
+with F() updates that leave updated_at alone. The template and stylesheet
+mtimes are also in the token, so a redesign re-renders too. A download or
+email whose token still matches is served from the stored file. Anything
+else renders again and replaces the entry.
+
+Downloads (finance.views) and the email tasks share the cache. evict()
+keeps it under DOCUMENT_CACHE_MAX_BYTES and drops entries unused for
+DOCUMENT_CACHE_MAX_AGE.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+from datetime import timedelta
+from functools import lru_cache
+from typing import Callable, NamedTuple, Optional
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.template.loader import get_template
+from django.utils import timezone
+
+from core.pdf import render_many
+
+from .models import Invoice, Payment, PurchaseOrder, RenderedDocument
+
+logger = logging.getLogger(__name__)
+
+COMPANY = {
+    "company_name": "Lu-mino Education",
+    "company_address": "123 Education Street, Dubai, UAE",
+    "company_phone": "+971 4 123 4567",
+}
+
+
+def invoice_context(invoice):
+    """Template context for finance/invoice_template.html"""
+    return {
+        "invoice": invoice,
+        "student": invoice.student,
+        "paid_total": invoice.paid_total,
+        "balance": invoice.balance,
+        "status_display": invoice.get_status_display(),
+        **COMPANY,
+        "company_email": "accounts@luminoschool.com",
+    }
+
+
+def receipt_context(payment):
+    """Template context for finance/payment_receipt_template.html"""
+    invoice = payment.invoice
+    return {
+        "payment": payment,
+        "invoice": invoice,
+        "student": invoice.student,
+        "paid_total": invoice.paid_total,
+        "balance": invoice.balance,
+        "treasury": payment.treasury,
+        **COMPANY,
+    }
+
+
+def purchase_order_context(po):
+    """Template context for finance/po_template.html"""
+    return {
+        "po": po,
+        "vendor": po.vendor,
+        "item": po.item,
+        "company_name": COMPANY["company_name"],
+        "company_address": COMPANY["company_address"],
+    }
+
+
+class DocumentKind(NamedTuple):
+    queryset: Callable          # () -> queryset with what the template reads
+    template: str
+    stylesheet: str
+    context: Callable           # obj -> template context
+    version: Callable           # obj -> tuple of everything the PDF shows that can change
+    filename: Callable          # obj -> download name
+
+
+KINDS = {
+    "invoice": DocumentKind(
+        lambda: Invoice.objects.select_related("student"),
+        "finance/invoice_template.html", "finance/invoice.css", invoice_context,
+        lambda i: (i.updated_at, i.paid_total, i.status, i.student.updated_at),
+        lambda i: f"invoice_{i.pk}.pdf",
+    ),
+    "receipt": DocumentKind(
+        lambda: Payment.objects.select_related("invoice__student", "treasury"),
+        "finance/payment_receipt_template.html", "finance/payment_receipt.css", receipt_context,
+        lambda p: (p.updated_at, p.invoice.updated_at, p.invoice.paid_total, p.invoice.status,
+                   p.invoice.student.updated_at, p.treasury.updated_at),
+        lambda p: f"receipt_{p.pk}.pdf",
+    ),
+    "po": DocumentKind(
+        lambda: PurchaseOrder.objects.select_related("vendor", "item"),
+        "finance/po_template.html", "finance/po.css", purchase_order_context,
+        lambda po: (po.updated_at, po.vendor.updated_at, po.item.updated_at),
+        lambda po: f"po_{po.pk}.pdf",
+    ),
+}
+
+
+@lru_cache(maxsize=None)
+def _design_version(kind: str) -> tuple:
+    """Template and stylesheet mtimes, read once per process (deploys restart it)"""
+    spec = KINDS[kind]
+    paths = [getattr(get_template(spec.template).origin, "name", None), finders.find(spec.stylesheet)]
+    return tuple(os.path.getmtime(p) if p and os.path.exists(p) else None for p in paths)
+
+
+def version_token(kind: str, obj) -> str:
+    parts = (kind, obj.pk, *_design_version(kind), *KINDS[kind].version(obj))
+    return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+
+def load(kind: str, pk):
+    return KINDS[kind].queryset().filter(pk=pk).first()
+
+
+def pdfs(kind: str, objects: list) -> list[bytes]:
+    """
+    PDFs for already loaded `objects` (from KINDS[kind].queryset()), in
+    order. Cached entries are looked up in one query and current ones are
+    read from storage. The rest render in one pass over the PDF pool and
+    are stored for next time.
+    """
+    if not objects:
+        return []
+    spec = KINDS[kind]
+    versions = [version_token(kind, obj) for obj in objects]
+    cached = {
+        doc.object_id: doc
+        for doc in RenderedDocument.objects.filter(kind=kind, object_id__in=[o.pk for o in objects])
+    }
+
+    out, misses, hits = [None] * len(objects), [], []
+    for i, (obj, version) in enumerate(zip(objects, versions)):
+        doc = cached.get(obj.pk)
+        if doc and doc.version == version:
+            try:
+                with doc.file.open("rb") as fh:
+                    out[i] = fh.read()
+                hits.append(doc)
+                continue
+            except Exception as e:
+                logger.warning("Cached %s PDF %s is unreadable, rendering again: %s", kind, obj.pk, e)
+        misses.append(i)
+
+    _touch(hits)
+    if misses:
+        template = get_template(spec.template)
+        rendered = render_many(
+            (template.render({**spec.context(objects[i]), "pdf": True}), [spec.stylesheet]) for i in misses
+        )
+        for i, pdf in zip(misses, rendered):
+            out[i] = pdf
+            _store(kind, objects[i].pk, versions[i], pdf, cached.get(objects[i].pk))
+    return out
+
+
+def pdf(kind: str, pk) -> Optional[bytes]:
+    """The PDF of one document, or None when it does not exist."""
+    obj = load(kind, pk)
+    return pdfs(kind, [obj])[0] if obj else None
+
+
+def open_pdf(kind: str, pk):
+    """
+    (file, filename) for a download: the stored file when the cached
+    version is current (rendering and storing it first otherwise), or
+    (None, None) when the document does not exist.
+    """
+    obj = load(kind, pk)
+    if not obj:
+        return None, None
+    version = version_token(kind, obj)
+    doc = RenderedDocument.objects.filter(kind=kind, object_id=pk, version=version).first()
+    if doc:
+        try:
+            fh = doc.file.open("rb")
+            _touch([doc])
+            return fh, KINDS[kind].filename(obj)
+        except Exception as e:
+            logger.warning("Cached %s PDF %s is unreadable, rendering again: %s", kind, pk, e)
+    return ContentFile(pdfs(kind, [obj])[0]), KINDS[kind].filename(obj)
+
+
+def _touch(docs) -> None:
+    # Recency only matters to eviction, so it is refreshed at most hourly.
+    stale = [d.pk for d in docs if d.last_used_at < timezone.now() - timedelta(hours=1)]
+    if stale:
+        RenderedDocument.objects.filter(pk__in=stale).update(last_used_at=timezone.now())
+
+
+def _store(kind: str, object_id, version: str, data: bytes, previous: Optional[RenderedDocument]) -> None:
+    """Saves a rendered PDF over the previous version; a failed write only costs a re-render later."""
+    try:
+        doc = previous or RenderedDocument(kind=kind, object_id=object_id)
+        old_name = doc.file.name if previous else None
+        doc.version, doc.size, doc.last_used_at = version, len(data), timezone.now()
+        doc.file.save(f"{kind}/{kind}_{object_id}_{version[:12]}.pdf", ContentFile(data), save=False)
+        with transaction.atomic():
+            doc.save()
+        if old_name and old_name != doc.file.name:
+            doc.file.storage.delete(old_name)
+    except Exception as e:
+        # e.g. a concurrent render of the same document won the insert
+        logger.warning("Could not cache %s PDF %s: %s", kind, object_id, e)
+
+
+def evict(max_age: timedelta | None = None, max_bytes: int | None = None) -> int:
+    """
+    Drops documents unused for `max_age`, then the least recently used
+    ones until the stored files fit in `max_bytes`.
+    """
+    if max_age is None:
+        max_age = timedelta(seconds=getattr(settings, "DOCUMENT_CACHE_MAX_AGE", 30 * 24 * 3600))
+    if max_bytes is None:
+        max_bytes = getattr(settings, "DOCUMENT_CACHE_MAX_BYTES", 512 * 1024 ** 2)
+
+    expired = set(
+        RenderedDocument.objects.filter(last_used_at__lt=timezone.now() - max_age).values_list("pk", flat=True)
+    )
+    used = 0
+    for pk, size in RenderedDocument.objects.exclude(pk__in=expired).order_by("-last_used_at").values_list("pk", "size"):
+        used += size
+        if used > max_bytes:
+            expired.add(pk)
+
+    for doc in RenderedDocument.objects.filter(pk__in=expired).only("pk", "file"):
+        try:
+            doc.file.delete(save=False)
+        except Exception as e:
+            logger.warning("Could not delete cached document %s: %s", doc.file.name, e)
+    RenderedDocument.objects.filter(pk__in=expired).delete()
+    return len(expired)
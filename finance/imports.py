@@ -0,0 +1,213 @@
+# finance/imports.py
+"""
+Bulk payment import (bank statements as CSV or XLSX).
+
+The rows are checked in memory against invoice numbers and treasuries
+fetched up front, so validating 500 rows costs a handful of queries. The
+payments then go in with one bulk_create inside one transaction. bulk_create
+skips the Payment signals, so their work is done here as grouped statements:
+the ledger entries in one insert, and the invoices' paid totals and
+statuses in one UPDATE per batch. Receipts go out as one batched task once
+the transaction commits.
+"""
+from __future__ import annotations
+
+import csv
+import io
+import logging
+import os
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from typing import Optional
+
+from django.db import transaction
+
+from . import ledger
+from .models import Invoice, Payment, Treasury
+from .tasks import email_invoices_batch, email_payment_receipts_batch, queue_mail_batch
+
+REQUIRED_COLUMNS = ("invoice_number", "amount", "date")  # plus optional "treasury" and "reference"
+DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y")
+BATCH_SIZE = 500
+
+logger = logging.getLogger(__name__)
+
+
+def _column(name) -> str:
+    return str(name or "").strip().lower().replace(" ", "_")
+
+
+def read_rows(file, filename: str) -> list[dict]:
+    """
+    Rows of a CSV or XLSX upload as dicts keyed by normalised header
+    ("Invoice Number" -> "invoice_number"). Raises ValueError for an
+    unsupported file type or missing columns.
+    """
+    ext = os.path.splitext(filename or "")[1].lower()
+    if ext == ".csv":
+        raw = file.read()
+        text = raw.decode("utf-8-sig") if isinstance(raw, bytes) else raw
+        reader = csv.reader(io.StringIO(text))
+        header = next(reader, [])
+        body = reader
+    elif ext in (".xlsx", ".xlsm"):
+        from openpyxl import load_workbook
+
+        # A read-only workbook keeps the file open until closed.
+        workbook = load_workbook(file, read_only=True, data_only=True)
+        try:
+            values = workbook.active.iter_rows(values_only=True)
+            header = next(values, ())
+            body = list(values)
+        finally:
+            workbook.close()
+    else:
+        raise ValueError("Unsupported file type; upload a .csv or .xlsx file.")
+
+    header = [_column(h) for h in header]
+    missing = [c for c in REQUIRED_COLUMNS if c not in header]
+    if missing:
+        raise ValueError(f"Missing column(s): {', '.join(missing)}")
+    return [
+        dict(zip(header, row))
+        for row in body
+        if any(v not in (None, "") for v in row)
+    ]
+
+
+def _parse_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = str(value or "").strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognised date '{text}'")
+
+
+def _parse_amount(value) -> Decimal:
+    try:
+        amount = Decimal(str(value).replace(",", "").strip()).quantize(Decimal("0.01"))
+    except (InvalidOperation, ValueError):
+        raise ValueError(f"Invalid amount '{value}'")
+    if amount <= 0:
+        raise ValueError("Amount must be positive")
+    return amount
+
+
+def import_payments(
+    rows: list[dict],
+    treasury: Optional[str | int] = None,
+    dry_run: bool = False,
+    allow_duplicates: bool = False,
+    send_receipts: bool = True,
+) -> dict:
+    """
+    Validates and records payment rows, all or nothing. `treasury` (a name
+    or id) is used for rows without a treasury column. A row matching an
+    existing payment (same invoice, amount and date), or repeating an earlier
+    row of the file (same invoice, amount, date and reference), is rejected
+    unless `allow_duplicates`, so re-importing a statement is harmless.
+
+    Returns {"rows", "created", "invoices", "total", "paid", "errors",
+    "unqueued"}; nothing is written when there are errors or on a dry run.
+    "unqueued" lists the payments and invoices whose emails could not be
+    queued once the import committed (filled in at commit).
+    """
+    treasuries = {}
+    for pk, name in Treasury.objects.values_list("pk", "name"):
+        treasuries[str(pk)] = treasuries[name.strip().lower()] = pk
+    default_treasury = treasuries.get(str(treasury).strip().lower()) if treasury not in (None, "") else None
+    errors = []
+    if treasury not in (None, "") and default_treasury is None:
+        errors.append({"row": None, "error": f"Unknown treasury '{treasury}'"})
+
+    numbers = {str(r.get("invoice_number") or "").strip() for r in rows}
+    invoices = {
+        number: (pk, status)
+        for number, pk, status in Invoice.objects.filter(invoice_number__in=numbers)
+        .values_list("invoice_number", "pk", "status")
+    }
+    existing = set()
+    if not allow_duplicates and invoices:
+        existing = set(
+            Payment.objects.filter(invoice_id__in=[pk for pk, _s in invoices.values()])
+            .values_list("invoice_id", "amount", "date")
+        )
+
+    payments = []
+    seen = {}
+    for line, row in enumerate(rows, start=2):  # line 1 is the header
+        try:
+            number = str(row.get("invoice_number") or "").strip()
+            if number not in invoices:
+                raise ValueError(f"Unknown invoice '{number}'")
+            amount = _parse_amount(row.get("amount"))
+            day = _parse_date(row.get("date"))
+            name = str(row.get("treasury") or "").strip().lower()
+            treasury_id = treasuries.get(name) if name else default_treasury
+            if treasury_id is None:
+                raise ValueError(f"Unknown treasury '{row.get('treasury')}'" if name else "No treasury given")
+            invoice_id = invoices[number][0]
+            if (invoice_id, amount, day) in existing:
+                raise ValueError(f"Payment of {amount} on {day} already recorded for {number}")
+            key = (invoice_id, amount, day, str(row.get("reference") or "").strip())
+            if not allow_duplicates and key in seen:
+                raise ValueError(f"Duplicate of row {seen[key]}")
+            seen.setdefault(key, line)
+        except ValueError as e:
+            errors.append({"row": line, "error": str(e)})
+            continue
+        payments.append(Payment(invoice_id=invoice_id, amount=amount, treasury_id=treasury_id, date=day))
+
+    deltas = defaultdict(Decimal)
+    for payment in payments:
+        deltas[payment.invoice_id] += payment.amount
+    result = {
+        "rows": len(rows),
+        "created": 0,
+        "invoices": len(deltas),
+        "total": sum(deltas.values(), Decimal("0.00")),
+        "paid": 0,
+        "errors": errors,
+        "unqueued": {"payments": [], "invoices": []},
+    }
+    if errors or dry_run or not payments:
+        return result
+
+    was_paid = {pk for pk, status in invoices.values() if status == "PAID"}
+    with transaction.atomic():
+        created = Payment.objects.bulk_create(payments, batch_size=BATCH_SIZE)
+        ledger.record(created)
+        Invoice.objects.apply_payments(deltas, batch_size=BATCH_SIZE)
+        newly_paid = [
+            pk for pk in Invoice.objects.filter(pk__in=list(deltas), status="PAID").values_list("pk", flat=True)
+            if pk not in was_paid
+        ]
+        payment_ids = [p.pk for p in created]
+        transaction.on_commit(lambda: _queue_emails(payment_ids, newly_paid, send_receipts, result["unqueued"]))
+
+    result.update(created=len(created), paid=len(newly_paid))
+    return result
+
+
+def _queue_emails(payment_ids, paid_invoice_ids, send_receipts, unqueued):
+    # The payments are committed by now: a broker or cache outage is
+    # reported in `unqueued`, not raised as a failed import.
+    def queue(task, ids, kind):
+        try:
+            queue_mail_batch(task, ids)
+        except Exception as e:
+            logger.error(f"Could not queue emails for {kind} {ids}: {e}")
+            unqueued[kind].extend(ids)
+
+    if send_receipts and payment_ids:
+        queue(email_payment_receipts_batch, payment_ids, "payments")
+    # Same as a single payment: an invoice that is now fully paid is re-sent as paid.
+    if paid_invoice_ids:
+        queue(email_invoices_batch, paid_invoice_ids, "invoices")
@@ -0,0 +1,132 @@
+# finance/ledger.py
+"""
+Append-only treasury ledger.
+
+Every movement of money is one TreasuryTransaction insert. Inserts take no
+lock on the Treasury row, so concurrent cashiers do not queue behind each
+other the way they did with UPDATE treasury SET balance = balance + x. A
+treasury's current balance is Treasury.balance (the compacted part) plus
+the sum of its uncompacted entries (see Treasury.current_balance).
+compact() periodically folds that tail into Treasury.balance, which keeps
+the tail short.
+
+Payments, expenses and salary payments keep their entries in step with
+sync_entries(): editing or deleting one appends the difference (a reversal
+at the old treasury/date plus a new entry) instead of rewriting history.
+"""
+from __future__ import annotations
+
+import logging
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Sum
+
+from .models import Expense, Payment, SalaryPayment, Treasury, TreasuryTransaction
+
+logger = logging.getLogger(__name__)
+
+ZERO = Decimal("0.00")
+
+# model -> (source_type, is_inflow, reference)
+SOURCES = {
+    Payment:       ("PAYMENT", True,  lambda p: f"PAY-{p.pk}"),
+    Expense:       ("EXPENSE", False, lambda e: e.reference or f"EXP-{e.pk}"),
+    SalaryPayment: ("SALARY",  False, lambda s: f"SAL-{s.pk}"),
+}
+
+
+def append(entries: list[TreasuryTransaction]) -> None:
+    """Inserts ledger entries and drops the balance snapshots they make stale."""
+    if not entries:
+        return
+    from .balances import invalidate_snapshots
+
+    TreasuryTransaction.objects.bulk_create(entries, batch_size=1000)
+    earliest = {}
+    for e in entries:
+        earliest[e.treasury_id] = min(e.date, earliest.get(e.treasury_id, e.date))
+    for treasury_id, day in earliest.items():
+        invalidate_snapshots(treasury_id, day)
+
+
+def sync_entries(instance, created: bool = False, deleted: bool = False) -> None:
+    """
+    Appends whatever entries make the ledger net for `instance` match its
+    current treasury, date and amount (nothing, once deleted). A new
+    movement needs no lookup; an edit reads its posted entries once.
+    """
+    source_type, inflow, reference = SOURCES[type(instance)]
+    sign = 1 if inflow else -1
+    wanted = defaultdict(Decimal)
+    if not deleted:
+        wanted[(instance.treasury_id, instance.date)] = sign * instance.amount
+
+    if not created:
+        for treasury_id, day, net in (
+            TreasuryTransaction.objects.filter(source_type=source_type, source_id=instance.pk)
+            .order_by().values("treasury_id", "date")
+            .annotate(net=Sum(TreasuryTransaction.SIGNED_AMOUNT))
+            .values_list("treasury_id", "date", "net")
+        ):
+            wanted[(treasury_id, day)] -= net or ZERO
+
+    label = dict(TreasuryTransaction.SOURCES)[source_type]
+    description = f"{label} #{instance.pk}" if created else f"Adjustment for {'deleted' if deleted else 'edited'} {label.lower()} #{instance.pk}"
+    append([
+        TreasuryTransaction(
+            treasury_id=treasury_id, date=day, amount=abs(diff), is_inflow=diff > 0,
+            source_type=source_type, source_id=instance.pk,
+            reference=reference(instance)[:50], description=description,
+        )
+        for (treasury_id, day), diff in wanted.items() if diff
+    ])
+
+
+def record(instances) -> None:
+    """Appends the entries of freshly bulk-created movements, which skip the signals."""
+    entries = []
+    for instance in instances:
+        source_type, inflow, reference = SOURCES[type(instance)]
+        entries.append(TreasuryTransaction(
+            treasury_id=instance.treasury_id, date=instance.date, amount=instance.amount, is_inflow=inflow,
+            source_type=source_type, source_id=instance.pk,
+            reference=reference(instance)[:50], description=f"{dict(TreasuryTransaction.SOURCES)[source_type]} #{instance.pk}",
+        ))
+    append(entries)
+
+
+def compact(batch_size: int = 10000) -> int:
+    """
+    Folds uncompacted entries into Treasury.balance, at most `batch_size`
+    per treasury per call. Returns the number of entries folded.
+
+    The treasury row is locked FOR NO KEY UPDATE, which serializes
+    compactions but not ledger inserts (their foreign key check only takes
+    KEY SHARE). The entries are read after the lock, and only those exact
+    rows are flagged, so an entry committed mid-compaction waits for the
+    next run instead of being flagged without being summed.
+    """
+    folded = 0
+    treasury_ids = (
+        TreasuryTransaction.objects.filter(compacted=False)
+        .order_by().values_list("treasury_id", flat=True).distinct()
+    )
+    for treasury_id in list(treasury_ids):
+        with transaction.atomic():
+            Treasury.objects.select_for_update(no_key=True).filter(pk=treasury_id).values_list("pk").first()
+            tail = list(
+                TreasuryTransaction.objects.filter(treasury_id=treasury_id, compacted=False)
+                .order_by("pk").annotate(signed=TreasuryTransaction.SIGNED_AMOUNT)
+                .values_list("pk", "signed")[:batch_size]
+            )
+            if not tail:
+                continue
+            net = sum((signed for _pk, signed in tail), ZERO)
+            TreasuryTransaction.objects.filter(pk__in=[pk for pk, _s in tail]).update(compacted=True)
+            Treasury.objects.filter(pk=treasury_id).update(balance=F("balance") + net)
+        folded += len(tail)
+    if folded:
+        logger.info("Compacted %s treasury ledger entries", folded)
+    return folded
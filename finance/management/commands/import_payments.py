@@ -0,0 +1,43 @@
+# finance/management/commands/import_payments.py
+from django.core.management.base import BaseCommand, CommandError
+
+from finance.imports import import_payments, read_rows
+
+
+class Command(BaseCommand):
+    help = "Record the payments in a bank-statement CSV/XLSX (invoice_number, amount, date[, treasury])."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or XLSX file")
+        parser.add_argument("--treasury", help="Treasury name or id for rows without a treasury column")
+        parser.add_argument("--dry-run", action="store_true", help="Validate only, write nothing")
+        parser.add_argument("--allow-duplicates", action="store_true",
+                            help="Accept rows matching an existing payment (same invoice, amount and date)")
+        parser.add_argument("--no-receipts", action="store_true", help="Do not email payment receipts")
+
+    def handle(self, *args, **opts):
+        try:
+            with open(opts["path"], "rb") as fh:
+                rows = read_rows(fh, opts["path"])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        result = import_payments(
+            rows,
+            treasury=opts["treasury"],
+            dry_run=opts["dry_run"],
+            allow_duplicates=opts["allow_duplicates"],
+            send_receipts=not opts["no_receipts"],
+        )
+        for error in result["errors"]:
+            where = f"row {error['row']}: " if error["row"] else ""
+            self.stderr.write(f"{where}{error['error']}")
+        if result["errors"]:
+            raise CommandError(f"{len(result['errors'])} invalid row(s); nothing was imported.")
+
+        verb = "Would import" if opts["dry_run"] else "Imported"
+        count = len(rows) if opts["dry_run"] else result["created"]
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {count} payment(s) totalling {result['total']} across {result['invoices']} invoice(s)"
+            + ("" if opts["dry_run"] else f"; {result['paid']} now fully paid")
+        ))
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Frozen copy of finance.numbering as of this migration:
+# kind -> (settings prefix name, default prefix, model name, number field)
+KINDS = {
+    "invoice": ("INVOICE_NUMBER", "INV-", "Invoice", "invoice_number"),
+    "po":      ("PO_NUMBER", "PO-", "PurchaseOrder", "po_number"),
+}
+
+
+def highest_number(model, field, prefix):
+    """Largest number among the values that are `prefix` followed by digits"""
+    highest = 0
+    values = model._base_manager.filter(**{f"{field}__startswith": prefix}).values_list(field, flat=True)
+    for value in values.iterator():
+        digits = value[len(prefix):]
+        if digits.isascii() and digits.isdigit():
+            highest = max(highest, int(digits))
+    return highest
+
+
+def create_sequences(apps, schema_editor):
+    """Sequences on PostgreSQL, counter rows elsewhere; both start after the highest existing number"""
+    connection = schema_editor.connection
+    for kind, (setting, default_prefix, model_name, field) in KINDS.items():
+        prefix = getattr(settings, f"{setting}_PREFIX", default_prefix)
+        start = highest_number(apps.get_model("finance", model_name), field, prefix) + 1
+        if connection.vendor == "postgresql":
+            sequence = f"finance_{kind}_number_seq"
+            schema_editor.execute(f"CREATE SEQUENCE IF NOT EXISTS {schema_editor.quote_name(sequence)}")
+            schema_editor.execute("SELECT setval(%s, %s, false)", [sequence, start])
+        else:
+            apps.get_model("finance", "DocumentCounter").objects.update_or_create(
+                kind=kind, defaults={"last": start - 1},
+            )
+
+
+def drop_sequences(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        for kind in KINDS:
+            schema_editor.execute(f"DROP SEQUENCE IF EXISTS {schema_editor.quote_name(f'finance_{kind}_number_seq')}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0007_treasurybalancesnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentCounter',
+            fields=[
+                ('kind', models.CharField(max_length=20, primary_key=True, serialize=False)),
+                ('last', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_sequences, drop_sequences),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:22
+
+from django.db import migrations, models
+from django.db.models import Case, F, Sum, When
+
+SOURCES = (("Payment", "PAYMENT", True), ("Expense", "EXPENSE", False), ("SalaryPayment", "SALARY", False))
+
+
+def backfill_ledger(apps, schema_editor):
+    """
+    Existing balances already include every payment, expense and salary
+    payment, so their ledger entries go in compacted. Manual transactions
+    never moved a balance and become memos.
+    """
+    TreasuryTransaction = apps.get_model("finance", "TreasuryTransaction")
+    TreasuryTransaction.objects.update(source_type="MEMO", compacted=True)
+    for model_name, source_type, is_inflow in SOURCES:
+        rows = apps.get_model("finance", model_name).objects.values_list("pk", "treasury_id", "date", "amount").iterator()
+        TreasuryTransaction.objects.bulk_create(
+            (
+                TreasuryTransaction(
+                    treasury_id=treasury_id, date=day, amount=amount, is_inflow=is_inflow,
+                    source_type=source_type, source_id=pk, compacted=True,
+                    reference=f"{source_type[:3]}-{pk}", description=f"{model_name} #{pk}",
+                )
+                for pk, treasury_id, day, amount in rows
+            ),
+            batch_size=1000,
+        )
+
+
+def fold_ledger(apps, schema_editor):
+    """Folds the ledger tail into Treasury.balance and drops the generated entries"""
+    Treasury = apps.get_model("finance", "Treasury")
+    TreasuryTransaction = apps.get_model("finance", "TreasuryTransaction")
+    tail = (
+        TreasuryTransaction.objects.filter(compacted=False).exclude(source_type="MEMO")
+        .values("treasury_id")
+        .annotate(net=Sum(Case(When(is_inflow=True, then=F("amount")), default=-F("amount"))))
+    )
+    for row in tail:
+        Treasury.objects.filter(pk=row["treasury_id"]).update(balance=F("balance") + row["net"])
+    TreasuryTransaction.objects.filter(source_type__in=[s for _m, s, _i in SOURCES]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0008_document_numbering'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='treasurytransaction',
+            name='compacted',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='treasurytransaction',
+            name='source_id',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='treasurytransaction',
+            name='source_type',
+            field=models.CharField(choices=[('MANUAL', 'Manual'), ('PAYMENT', 'Payment'), ('EXPENSE', 'Expense'), ('SALARY', 'Salary Payment'), ('MEMO', 'Memo (no balance effect)')], default='MANUAL', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='treasurytransaction',
+            index=models.Index(fields=['source_type', 'source_id'], name='treasurytx_source_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='treasurytransaction',
+            index=models.Index(condition=models.Q(('compacted', False)), fields=['treasury'], name='treasurytx_tail_idx'),
+        ),
+        migrations.RunPython(backfill_ledger, fold_ledger),
+    ]
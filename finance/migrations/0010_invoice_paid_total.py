@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:24
+
+import django.db.models.expressions
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_paid_totals(apps, schema_editor):
+    Invoice = apps.get_model("finance", "Invoice")
+    Payment = apps.get_model("finance", "Payment")
+    paid = (
+        Payment.objects.filter(invoice=OuterRef("pk")).order_by().values("invoice")
+        .annotate(total=Sum("amount")).values("total")
+    )
+    Invoice.objects.update(paid_total=Coalesce(Subquery(paid), Value(Decimal("0.00"))))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0009_treasury_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='paid_total',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='balance',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(models.F('amount'), '-', models.F('paid_total')), output_field=models.DecimalField(decimal_places=2, max_digits=10)),
+        ),
+        migrations.RunPython(backfill_paid_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:30
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0010_invoice_paid_total'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RenderedDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('invoice', 'Invoice'), ('receipt', 'Payment Receipt'), ('po', 'Purchase Order')], max_length=10)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('version', models.CharField(max_length=64)),
+                ('file', models.FileField(upload_to='documents/')),
+                ('size', models.PositiveIntegerField(default=0)),
+                ('rendered_at', models.DateTimeField(auto_now=True)),
+                ('last_used_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id'), name='rendereddocument_kind_object')],
+            },
+        ),
+    ]
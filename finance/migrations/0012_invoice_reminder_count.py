@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0011_rendereddocument'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='reminder_count',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -1,40 +1,184 @@
 # finance/models.py
-from django.db import models
+from decimal import Decimal
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import GreaterThan, LessThanOrEqual
 from core.models import TimestampMixin
 from student.models import Student
 from inventory.models import Vendor, Item
 from hr.models import SalaryRecord
 from django.utils import timezone
+from .numbering import allocate_numbers
 # Helper Functions
 def next_invoice_number():
-    last = Invoice.objects.order_by("-id").first()
-    if not last or not last.invoice_number: return "INV-0001"
-    num = int(last.invoice_number.split("-")[-1]) + 1
-    return f"INV-{num:04d}"
+    return allocate_numbers("invoice")[0]
+
+def next_invoice_numbers(count):
+    """`count` invoice numbers for bulk inserts, reserved in one round trip"""
+    return allocate_numbers("invoice", count)
 
 def next_po_number():
-    last = PurchaseOrder.objects.order_by("-id").first()
-    if not last or not last.po_number: return "PO-0001"
-    num = int(last.po_number.split("-")[-1]) + 1
-    return f"PO-{num:04d}"
+    return allocate_numbers("po")[0]
 
 # Models
+class DocumentCounter(models.Model):
+    """Number allocator for databases without sequences (see finance.numbering)"""
+    kind = models.CharField(max_length=20, primary_key=True)
+    last = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self): return f"{self.kind}: {self.last}"
+
+class TreasuryQuerySet(models.QuerySet):
+    def with_balance(self):
+        """Annotates current_balance: the compacted balance plus the uncompacted ledger tail"""
+        tail = (
+            TreasuryTransaction.objects.filter(treasury=models.OuterRef("pk"), compacted=False)
+            .order_by().values("treasury")
+            .annotate(total=models.Sum(TreasuryTransaction.SIGNED_AMOUNT)).values("total")
+        )
+        return self.annotate(_current_balance=models.F("balance") + Coalesce(
+            models.Subquery(tail, output_field=models.DecimalField(max_digits=12, decimal_places=2)),
+            models.Value(Decimal("0.00")),
+        ))
+
 class Treasury(TimestampMixin):
     name    = models.CharField(max_length=100, unique=True)
+    # Balance as of the last ledger compaction (the opening balance before
+    # any); the current balance adds the uncompacted ledger entries.
     balance = models.DecimalField(max_digits=12, decimal_places=2)
+
+    objects = TreasuryQuerySet.as_manager()
+
     def __str__(self): return self.name
 
+    @property
+    def current_balance(self):
+        if hasattr(self, "_current_balance"):
+            return self._current_balance
+        tail = self.transactions.filter(compacted=False).aggregate(total=models.Sum(TreasuryTransaction.SIGNED_AMOUNT))["total"]
+        return self.balance + (tail or Decimal("0.00"))
+
+class TreasuryBalanceSnapshot(models.Model):
+    """Closing balance of a treasury at the end of `date` (see finance.balances)."""
+    treasury = models.ForeignKey('Treasury', on_delete=models.CASCADE, related_name="snapshots")
+    date     = models.DateField()
+    balance  = models.DecimalField(max_digits=12, decimal_places=2)
+    taken_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["-date"]
+        constraints = [
+            models.UniqueConstraint(fields=["treasury", "date"], name="treasurysnapshot_treasury_date"),
+        ]
+
+    def __str__(self): return f"{self.treasury} @ {self.date}: {self.balance}"
+
 class TreasuryTransaction(TimestampMixin):
+    """
+    Append-only treasury ledger (see finance.ledger). Payments, expenses and
+    salary payments add their entries through signals, edits and deletes
+    append reversals, and MANUAL entries come from the API. Entries are never
+    updated except for the compacted flag, set when they are folded into
+    Treasury.balance.
+    """
+    SOURCES = [
+        ("MANUAL", "Manual"), ("PAYMENT", "Payment"),
+        ("EXPENSE", "Expense"), ("SALARY", "Salary Payment"),
+        ("MEMO", "Memo (no balance effect)"),  # records from before the ledger
+    ]
+    SIGNED_AMOUNT = models.Case(
+        models.When(source_type="MEMO", then=models.Value(Decimal("0.00"))),
+        models.When(is_inflow=True, then=models.F("amount")),
+        default=-models.F("amount"),
+        output_field=models.DecimalField(max_digits=12, decimal_places=2),
+    )
+
     treasury = models.ForeignKey('Treasury', on_delete=models.PROTECT, related_name="transactions")
     reference = models.CharField(max_length=50, blank=True)
     description = models.TextField(blank=True)
     amount = models.DecimalField(max_digits=12, decimal_places=2)
     is_inflow = models.BooleanField()
     date = models.DateField()
+    source_type = models.CharField(max_length=10, choices=SOURCES, default="MANUAL")
+    source_id = models.PositiveBigIntegerField(null=True, blank=True)
+    compacted = models.BooleanField(default=False, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["source_type", "source_id"], name="treasurytx_source_idx"),
+            models.Index(fields=["treasury"], condition=models.Q(compacted=False), name="treasurytx_tail_idx"),
+        ]
+
+    @property
+    def signed_amount(self):
+        if self.source_type == "MEMO":
+            return Decimal("0.00")
+        return self.amount if self.is_inflow else -self.amount
+
     def __str__(self):
         sign = "+" if self.is_inflow else "-"
         return f"{sign}{self.amount} {self.treasury} {self.reference}"
 
+def payment_status(paid):
+    """
+    Invoice status once `paid` (any expression) has been received: PAID when
+    it covers the amount, otherwise PARTIAL or SENT (a draft stays a draft
+    until money comes in), and OVERDUE past the due date.
+    """
+    paid = models.ExpressionWrapper(paid, output_field=models.DecimalField(max_digits=12, decimal_places=2))
+    zero = models.Value(Decimal("0.00"))
+    return models.Case(
+        models.When(LessThanOrEqual(models.F("amount"), paid), then=models.Value("PAID")),
+        models.When(models.Q(status="DRAFT") & LessThanOrEqual(paid, zero), then=models.Value("DRAFT")),
+        models.When(due_date__lt=timezone.now().date(), then=models.Value("OVERDUE")),
+        models.When(GreaterThan(paid, zero), then=models.Value("PARTIAL")),
+        default=models.Value("SENT"),
+    )
+
+class InvoiceQuerySet(models.QuerySet):
+    def apply_payment(self, invoice_id, delta):
+        """
+        Moves paid_total (and with it balance and status) by `delta` in one
+        UPDATE, without reading the invoice or its payments. Returns the new
+        status.
+        """
+        self.apply_payments({invoice_id: delta})
+        return self.filter(pk=invoice_id).values_list("status", flat=True).first()
+
+    def apply_payments(self, deltas, batch_size=500):
+        """apply_payment() for many invoices: one UPDATE per `batch_size` invoices, {invoice_id: delta}"""
+        items = [(pk, delta) for pk, delta in deltas.items() if delta]
+        for start in range(0, len(items), batch_size):
+            batch = items[start:start + batch_size]
+            if len(batch) == 1:
+                paid = models.F("paid_total") + batch[0][1]
+            else:
+                paid = models.F("paid_total") + models.Case(
+                    *[models.When(pk=pk, then=models.Value(delta)) for pk, delta in batch],
+                    output_field=models.DecimalField(max_digits=12, decimal_places=2),
+                )
+            self.filter(pk__in=[pk for pk, _d in batch]).update(paid_total=paid, status=payment_status(paid))
+
+    def paid_sums(self):
+        return Coalesce(
+            models.Subquery(
+                Payment.objects.filter(invoice=models.OuterRef("pk")).order_by().values("invoice")
+                .annotate(total=models.Sum("amount")).values("total"),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2),
+            ),
+            models.Value(Decimal("0.00")),
+        )
+
+    def repair_paid_totals(self):
+        """Recomputes paid_total from the payments wherever it drifted; returns the invoices fixed"""
+        paid = self.paid_sums()
+        drifted = list(self.alias(_paid=paid).exclude(paid_total=models.F("_paid")).values_list("pk", flat=True))
+        for start in range(0, len(drifted), 1000):
+            self.model.objects.filter(pk__in=drifted[start:start + 1000]).update(
+                paid_total=paid, status=payment_status(paid),
+            )
+        return drifted
+
 class Invoice(TimestampMixin):
     invoice_number = models.CharField(max_length=20, unique=True, default=next_invoice_number)
     student        = models.ForeignKey(Student, on_delete=models.PROTECT, related_name="invoices")
@@ -50,28 +194,41 @@ class Invoice(TimestampMixin):
         ("OVERDUE", "Overdue")
     ]
     status = models.CharField(max_length=10, choices=STATUS, default="DRAFT")
-    
+    # Kept in step with the payments by F() deltas (InvoiceQuerySet.apply_payment)
+    # and checked nightly by finance.tasks.verify_invoice_balances.
+    paid_total = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal("0.00"), editable=False)
+    balance    = models.GeneratedField(
+        expression=models.F("amount") - models.F("paid_total"),
+        output_field=models.DecimalField(max_digits=10, decimal_places=2),
+        db_persist=True,
+    )
+    # Payment reminders sent so far (finance.tasks.send_invoice_reminders stops at 3)
+    reminder_count = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    objects = InvoiceQuerySet.as_manager()
+
     def __str__(self): 
         return self.invoice_number
-    
+
+    def save(self, *args, **kwargs):
+        # A stale instance must not write back paid_total over concurrent
+        # deltas, nor leave a status that disagrees with it: the status is
+        # derived again from the stored paid_total right after the save.
+        full_update = not self._state.adding and kwargs.get("update_fields") is None and not kwargs.get("force_insert")
+        if full_update:
+            kwargs["update_fields"] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and not f.generated and f.name != "paid_total"
+            ]
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if full_update:
+                self.update_status_based_on_payments()
+
     def update_status_based_on_payments(self):
-        """Update invoice status based on payment amounts"""
-        paid_total = self.payments.aggregate(total=models.Sum('amount'))['total'] or Decimal('0.00')
-        
-        if paid_total >= self.amount:
-            self.status = 'PAID'
-        elif paid_total > Decimal('0.00'):
-            self.status = 'PARTIAL'  # Changed from SENT to PARTIAL
-        elif self.status != 'DRAFT':
-            self.status = 'SENT'
-        else:
-            self.status = 'DRAFT'
-        
-        # Check if overdue for non-paid invoices
-        if self.status in ['SENT', 'PARTIAL'] and self.due_date < timezone.now().date():
-            self.status = 'OVERDUE'
-        
-        self.save()
+        """Re-derive the status from the stored paid_total (no Payment query)"""
+        type(self).objects.filter(pk=self.pk).update(status=payment_status(models.F("paid_total")))
+        self.refresh_from_db(fields=["status", "paid_total"])
         return self.status
     
 
@@ -120,3 +277,21 @@ class SalaryPayment(TimestampMixin):
     def __str__(self):
         return f"Salary Payment for {self.salary_record.staff.full_name} - {self.amount}"
 
+
+class RenderedDocument(models.Model):
+    """Cached PDF of an invoice, receipt or purchase order at one version (see finance.documents)"""
+    KINDS = [("invoice", "Invoice"), ("receipt", "Payment Receipt"), ("po", "Purchase Order")]
+    kind         = models.CharField(max_length=10, choices=KINDS)
+    object_id    = models.PositiveBigIntegerField()
+    version      = models.CharField(max_length=64)
+    file         = models.FileField(upload_to="documents/")
+    size         = models.PositiveIntegerField(default=0)
+    rendered_at  = models.DateTimeField(auto_now=True)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["kind", "object_id"], name="rendereddocument_kind_object"),
+        ]
+
+    def __str__(self): return f"{self.kind} #{self.object_id} ({self.version[:8]})"
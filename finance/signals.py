@@ -1,38 +1,34 @@
 # finance/signals.py - COMPLETE FIXED VERSION
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
-from django.db.models import F
 from django.apps import apps  # ← ADD THIS
 import logging  # ← ADD THIS
 
-from .models import Payment, Expense, SalaryPayment, Treasury, Invoice
+from . import ledger
+from .models import Payment, Expense, SalaryPayment, TreasuryTransaction, Invoice
 from .tasks import email_invoice
 
 logger = logging.getLogger(__name__)  # ← ADD THIS
 
-@receiver([post_save, post_delete], sender=Payment)
-def update_treasury_on_payment(sender, instance, **kwargs):
-    # This logic runs when a Payment is created or deleted
-    if kwargs.get('created', True): # True on create, not present on delete
-        Treasury.objects.filter(id=instance.treasury.id).update(balance=F('balance') + instance.amount)
-    else: # This is a delete signal
-        Treasury.objects.filter(id=instance.treasury.id).update(balance=F('balance') - instance.amount)
+@receiver(post_save, sender=Payment)
+@receiver(post_save, sender=Expense)
+@receiver(post_save, sender=SalaryPayment)
+def post_treasury_movement(sender, instance, created, **kwargs):
+    """Appends the movement (or, on edit, the difference) to the treasury ledger"""
+    ledger.sync_entries(instance, created=created)
 
-@receiver([post_save, post_delete], sender=Expense)
-def update_treasury_on_expense(sender, instance, **kwargs):
-    # This logic runs when an Expense is created or deleted
-    if kwargs.get('created', True):
-        Treasury.objects.filter(id=instance.treasury.id).update(balance=F('balance') - instance.amount)
-    else:
-        Treasury.objects.filter(id=instance.treasury.id).update(balance=F('balance') + instance.amount)
+@receiver(post_delete, sender=Payment)
+@receiver(post_delete, sender=Expense)
+@receiver(post_delete, sender=SalaryPayment)
+def reverse_treasury_movement(sender, instance, **kwargs):
+    ledger.sync_entries(instance, deleted=True)
 
-@receiver([post_save, post_delete], sender=SalaryPayment)
-def update_treasury_on_salary(sender, instance, **kwargs):
-    # This logic runs when a SalaryPayment is created or deleted
-    if kwargs.get('created', True):
-        Treasury.objects.filter(id=instance.treasury.id).update(balance=F('balance') - instance.amount)
-    else:
-        Treasury.objects.filter(id=instance.treasury.id).update(balance=F('balance') + instance.amount)
+@receiver(post_save, sender=TreasuryTransaction)
+def invalidate_treasury_snapshots(sender, instance, created, **kwargs):
+    """Back-dated manual entries make the stored closing balances from their date on stale"""
+    if created:
+        from .balances import invalidate_snapshots
+        invalidate_snapshots(instance.treasury_id, instance.date)
 
 @receiver(post_save, sender=SalaryPayment)
 def mark_salary_record_as_paid(sender, instance, created, **kwargs):
@@ -49,23 +45,35 @@ def mark_salary_record_as_paid(sender, instance, created, **kwargs):
             salary_record.save()
             logger.info(f"Marked salary record {salary_record.id} as paid for staff {salary_record.staff.full_name}")
 
+@receiver(pre_save, sender=Payment)
+def remember_posted_payment(sender, instance, **kwargs):
+    """Edits move paid_total by the difference, so keep what was posted before"""
+    if instance.pk:
+        instance._posted = Payment.objects.filter(pk=instance.pk).values_list("invoice_id", "amount").first()
+
 @receiver(post_save, sender=Payment)
 def update_invoice_status_on_payment(sender, instance, created, **kwargs):
     """
-    Automatically update invoice status when payments are made
+    Moves the invoice's paid_total and status by the payment (one UPDATE,
+    no aggregate over its payments) and emails it once fully paid.
     """
     if created:
-        invoice = instance.invoice
-        new_status = invoice.update_status_based_on_payments()
+        new_status = Invoice.objects.apply_payment(instance.invoice_id, instance.amount)
         
         # If invoice just became PAID, trigger email
         if new_status == 'PAID':
-            email_invoice.delay(invoice.id)
+            email_invoice.delay(instance.invoice_id)
+        return
+
+    posted = getattr(instance, "_posted", None)
+    if posted and posted != (instance.invoice_id, instance.amount):
+        invoice_id, amount = posted
+        Invoice.objects.apply_payment(invoice_id, -amount)
+        Invoice.objects.apply_payment(instance.invoice_id, instance.amount)
 
 @receiver(post_delete, sender=Payment)
 def update_invoice_status_on_payment_delete(sender, instance, **kwargs):
     """
     Update invoice status when payments are deleted
     """
-    invoice = instance.invoice
-    invoice.update_status_based_on_payments()
+    Invoice.objects.apply_payment(instance.invoice_id, -instance.amount)
@@ -7,11 +7,14 @@ from datetime import date, timedelta
 
 from django.conf import settings
 from django.core.mail import EmailMessage
-from django.template.loader import render_to_string
 from django.apps import apps
-from django.db.models import Sum, Q
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Sum, Q
 from django.utils import timezone
-from weasyprint import HTML
+
+from notifications.utils import reserve_send_slot, send_batched
+
+from . import documents
 
 logger = logging.getLogger(__name__)
 
@@ -34,15 +37,6 @@ def _get_invoice_contact_details(invoice):
         return name, email
     return "Valued Customer", None
 
-def _render_pdf(template_path, context):
-    """Render HTML template to PDF"""
-    try:
-        html_string = render_to_string(template_path, context)
-        return HTML(string=html_string, base_url=str(settings.BASE_DIR)).write_pdf()
-    except Exception as e:
-        logger.error(f"Error rendering PDF: {e}")
-        return None
-
 def _get_default_invoice_amount(student):
     """Get default invoice amount based on student grade or other criteria"""
     # You can customize this based on your business logic
@@ -57,6 +51,88 @@ def _get_default_invoice_amount(student):
     else:
         return Decimal('800.00')
 
+def _invoice_email(invoice, contact_name, recipients, pdf_data):
+    """Invoice email with the PDF attached; wording depends on the invoice status"""
+    if invoice.status == 'PAID':
+        subject = f"Paid Invoice {invoice.invoice_number} - Lu-mino Education"
+        body = f"""Dear {contact_name},
+
+Thank you for your payment. Invoice #{invoice.invoice_number} is now marked as paid.
+
+Amount: {invoice.amount} AED
+Payment Date: {timezone.now().strftime('%Y-%m-%d')}
+
+Thank you for choosing Lu-mino Education.
+
+Best regards,
+Accounts Department
+Lu-mino Education ERP
+"""
+    else:
+        subject = f"Invoice {invoice.invoice_number} - Payment Due - Lu-mino Education"
+        body = f"""Dear {contact_name},
+
+Please find your attached invoice for {invoice.description}.
+
+Invoice Number: {invoice.invoice_number}
+Amount Due: {invoice.amount} AED
+Due Date: {invoice.due_date}
+
+Please make payment by the due date to avoid late fees.
+
+Thank you,
+Accounts Department
+Lu-mino Education ERP
+"""
+
+    email = EmailMessage(subject, body, settings.DEFAULT_FROM_EMAIL, recipients)
+    email.attach(f"Invoice-{invoice.invoice_number}.pdf", pdf_data, "application/pdf")
+    return email
+
+def _receipt_email(payment, contact_name, recipients, pdf_data):
+    """Payment receipt email with the PDF attached"""
+    invoice = payment.invoice
+    subject = f"Payment Receipt for Invoice {invoice.invoice_number} - Lu-mino Education"
+    body = f"""Dear {contact_name},
+
+Thank you for your payment. Your receipt is attached.
+
+Payment Details:
+- Invoice: {invoice.invoice_number}
+- Amount: {payment.amount} AED
+- Date: {payment.date}
+- Payment Method: Bank Transfer
+
+Thank you for your prompt payment.
+
+Best regards,
+Accounts Department
+Lu-mino Education ERP
+"""
+    email = EmailMessage(subject, body, settings.DEFAULT_FROM_EMAIL, recipients)
+    email.attach(f"Receipt-{invoice.invoice_number}.pdf", pdf_data, "application/pdf")
+    return email
+
+def _chunked(ids, size):
+    ids = list(ids)
+    return [ids[i:i + size] for i in range(0, len(ids), size)]
+
+def queue_mail_batch(task, ids):
+    """Queue a bulk-mail task for `ids` at the next free send slot (see notifications.utils.reserve_send_slot)"""
+    return task.apply_async((list(ids),), countdown=reserve_send_slot())
+
+def _take_mail_batch(task, ids):
+    """
+    The ids one run of a bulk-mail task sends: a single EMAIL_BATCH_SIZE
+    batch, so no run sleeps between batches. The rest is queued again at
+    the next free send slot.
+    """
+    ids = list(ids)
+    size = getattr(settings, "EMAIL_BATCH_SIZE", 30)
+    if len(ids) > size:
+        queue_mail_batch(task, ids[size:])
+    return ids[:size]
+
 # --- PDF Generation Tasks ---
 @shared_task
 def generate_invoice_pdf(invoice_id: int):
@@ -67,22 +143,9 @@ def generate_invoice_pdf(invoice_id: int):
         return None
     
     try:
-        invoice = Invoice.objects.select_related("student").get(pk=invoice_id)
-        paid_total = invoice.payments.aggregate(total=Sum("amount"))["total"] or Decimal("0.00")
-        
-        context = {
-            "invoice": invoice,
-            "student": invoice.student,
-            "paid_total": paid_total,
-            "balance": invoice.amount - paid_total,
-            "status_display": invoice.get_status_display(),
-            "company_name": "Lu-mino Education",
-            "company_address": "123 Education Street, Dubai, UAE",
-            "company_phone": "+971 4 123 4567",
-            "company_email": "accounts@luminoschool.com",
-        }
-        
-        pdf_data = _render_pdf("finance/invoice_template.html", context)
+        pdf_data = documents.pdf("invoice", invoice_id)
+        if pdf_data is None:
+            raise Invoice.DoesNotExist
         if not pdf_data:
             logger.error(f"Failed to render PDF for invoice {invoice_id}")
         
@@ -104,23 +167,9 @@ def generate_payment_receipt_pdf(payment_id: int):
         return None
     
     try:
-        payment = Payment.objects.select_related("invoice__student", "treasury").get(pk=payment_id)
-        invoice = payment.invoice
-        paid_total = invoice.payments.aggregate(total=Sum("amount"))["total"] or Decimal("0.00")
-        
-        context = {
-            "payment": payment,
-            "invoice": invoice,
-            "student": invoice.student,
-            "paid_total": paid_total,
-            "balance": invoice.amount - paid_total,
-            "treasury": payment.treasury,
-            "company_name": "Lu-mino Education",
-            "company_address": "123 Education Street, Dubai, UAE",
-            "company_phone": "+971 4 123 4567",
-        }
-        
-        pdf_data = _render_pdf("finance/payment_receipt_template.html", context)
+        pdf_data = documents.pdf("receipt", payment_id)
+        if pdf_data is None:
+            raise Payment.DoesNotExist
         if not pdf_data:
             logger.error(f"Failed to render PDF for payment {payment_id}")
         
@@ -142,17 +191,9 @@ def generate_purchase_order_pdf(po_id: int):
         return None
     
     try:
-        po = PurchaseOrder.objects.select_related("vendor", "item").get(pk=po_id)
-        
-        context = {
-            "po": po,
-            "vendor": po.vendor,
-            "item": po.item,
-            "company_name": "Lu-mino Education",
-            "company_address": "123 Education Street, Dubai, UAE",
-        }
-        
-        pdf_data = _render_pdf("finance/po_template.html", context)
+        pdf_data = documents.pdf("po", po_id)
+        if pdf_data is None:
+            raise PurchaseOrder.DoesNotExist
         if not pdf_data:
             logger.error(f"Failed to render PDF for PO {po_id}")
         
@@ -189,45 +230,9 @@ def email_invoice(self, invoice_id: int, to_override: Optional[list[str]] = None
             logger.error(f"Failed to generate PDF for Invoice ID: {invoice_id}.")
             return f"Failed: PDF generation for Invoice {invoice.invoice_number}"
 
-        # Customize email based on invoice status
-        if invoice.status == 'PAID':
-            subject = f"Paid Invoice {invoice.invoice_number} - Lu-mino Education"
-            body = f"""Dear {contact_name},
-
-Thank you for your payment. Invoice #{invoice.invoice_number} is now marked as paid.
-
-Amount: {invoice.amount} AED
-Payment Date: {timezone.now().strftime('%Y-%m-%d')}
-
-Thank you for choosing Lu-mino Education.
-
-Best regards,
-Accounts Department
-Lu-mino Education ERP
-"""
-        else:
-            subject = f"Invoice {invoice.invoice_number} - Payment Due - Lu-mino Education"
-            body = f"""Dear {contact_name},
-
-Please find your attached invoice for {invoice.description}.
-
-Invoice Number: {invoice.invoice_number}
-Amount Due: {invoice.amount} AED
-Due Date: {invoice.due_date}
-
-Please make payment by the due date to avoid late fees.
-
-Thank you,
-Accounts Department
-Lu-mino Education ERP
-"""
-
-        from_email = settings.DEFAULT_FROM_EMAIL
-        
         # Create and send email
-        email = EmailMessage(subject, body, from_email, recipients)
-        email.attach(f"Invoice-{invoice.invoice_number}.pdf", pdf_data, "application/pdf")
-        email.send(fail_silently=False)
+        if send_batched([_invoice_email(invoice, contact_name, recipients, pdf_data)]):
+            raise RuntimeError(f"Could not send Invoice {invoice.invoice_number}")
         
         logger.info(f"Successfully emailed Invoice {invoice.invoice_number} to {recipients}")
         return f"Successfully emailed Invoice {invoice.invoice_number}"
@@ -236,6 +241,53 @@ Lu-mino Education ERP
         logger.error(f"Error emailing invoice {invoice_id}: {e}")
         raise self.retry(exc=e, countdown=60)
 
+@shared_task(bind=True, max_retries=3)
+def email_invoices_batch(self, invoice_ids: list[int]):
+    """
+    Email a batch of invoices: one query for the invoices, one for their
+    cached PDFs, one pass over the PDF pool for the rest and one SMTP
+    connection. Past one mail batch the rest goes out from a later run;
+    invoices that fail to send are retried on their own.
+    """
+    Invoice = _get_model("finance", "Invoice")
+    if not Invoice:
+        return "Failed: Invoice model not found."
+
+    invoice_ids = _take_mail_batch(email_invoices_batch, invoice_ids)
+    invoices = list(
+        Invoice.objects.filter(pk__in=invoice_ids)
+        .select_related("student")
+        .order_by("pk")
+    )
+    outgoing = []
+    for invoice in invoices:
+        contact_name, contact_email = _get_invoice_contact_details(invoice)
+        if not contact_email:
+            logger.error(f"No recipient email found for Invoice ID: {invoice.id}.")
+            continue
+        outgoing.append((invoice, contact_name, contact_email))
+
+    try:
+        pdfs = documents.pdfs("invoice", [invoice for invoice, _name, _email in outgoing])
+    except Exception as e:
+        logger.error(f"Error rendering invoice batch {invoice_ids[:1]}...: {e}")
+        raise self.retry(exc=e, countdown=60)
+
+    failed = [
+        outgoing[i][0].id
+        for i in send_batched(
+            _invoice_email(invoice, contact_name, [contact_email], pdf_data)
+            for (invoice, contact_name, contact_email), pdf_data in zip(outgoing, pdfs)
+        )
+    ]
+    sent = len(outgoing) - len(failed)
+
+    if failed:
+        raise self.retry(args=[failed], countdown=reserve_send_slot())
+    result = f"Emailed {sent} of {len(invoice_ids)} invoices"
+    logger.info(result)
+    return result
+
 @shared_task(bind=True, max_retries=3)
 def email_payment_receipt(self, payment_id: int, to_override: Optional[list[str]] = None):
     """Email payment receipt to student/guardian"""
@@ -259,29 +311,8 @@ def email_payment_receipt(self, payment_id: int, to_override: Optional[list[str]
             logger.error(f"Failed to generate PDF for payment {payment_id}")
             return f"Failed: PDF generation for Payment {payment.id}"
             
-        subject = f"Payment Receipt for Invoice {invoice.invoice_number} - Lu-mino Education"
-        body = f"""Dear {contact_name},
-
-Thank you for your payment. Your receipt is attached.
-
-Payment Details:
-- Invoice: {invoice.invoice_number}
-- Amount: {payment.amount} AED
-- Date: {payment.date}
-- Payment Method: Bank Transfer
-
-Thank you for your prompt payment.
-
-Best regards,
-Accounts Department
-Lu-mino Education ERP
-"""
-
-        from_email = settings.DEFAULT_FROM_EMAIL
-        
-        email = EmailMessage(subject, body, from_email, recipients)
-        email.attach(f"Receipt-{invoice.invoice_number}.pdf", pdf_data, "application/pdf")
-        email.send(fail_silently=False)
+        if send_batched([_receipt_email(payment, contact_name, recipients, pdf_data)]):
+            raise RuntimeError(f"Could not send receipt for Payment {payment.id}")
         
         logger.info(f"Successfully emailed receipt for Payment {payment.id}")
         return f"Successfully emailed Receipt for Payment {payment.id}"
@@ -290,6 +321,49 @@ Lu-mino Education ERP
         logger.error(f"Error emailing payment receipt {payment_id}: {e}")
         raise self.retry(exc=e, countdown=60)
 
+@shared_task(bind=True, max_retries=3)
+def email_payment_receipts_batch(self, payment_ids: list[int]):
+    """
+    Email receipts for a batch of payments (e.g. one bank-statement import)
+    with one query, cached PDFs where current, one pass over the PDF pool
+    for the rest and one SMTP connection. Past one mail batch the rest goes
+    out from a later run; receipts that fail to send are retried on their own.
+    """
+    Payment = _get_model("finance", "Payment")
+    if not Payment:
+        return "Failed: Payment model not found."
+
+    payment_ids = _take_mail_batch(email_payment_receipts_batch, payment_ids)
+
+    outgoing = []
+    for payment in Payment.objects.filter(pk__in=payment_ids).select_related("invoice__student", "treasury").order_by("pk"):
+        contact_name, contact_email = _get_invoice_contact_details(payment.invoice)
+        if not contact_email:
+            logger.error(f"No recipient found for payment {payment.id}")
+            continue
+        outgoing.append((payment, contact_name, contact_email))
+
+    try:
+        pdfs = documents.pdfs("receipt", [payment for payment, _name, _email in outgoing])
+    except Exception as e:
+        logger.error(f"Error rendering receipt batch {payment_ids[:1]}...: {e}")
+        raise self.retry(exc=e, countdown=60)
+
+    failed = [
+        outgoing[i][0].id
+        for i in send_batched(
+            _receipt_email(payment, contact_name, [contact_email], pdf_data)
+            for (payment, contact_name, contact_email), pdf_data in zip(outgoing, pdfs)
+        )
+    ]
+    sent = len(outgoing) - len(failed)
+
+    if failed:
+        raise self.retry(args=[failed], countdown=reserve_send_slot())
+    result = f"Emailed {sent} of {len(payment_ids)} payment receipts"
+    logger.info(result)
+    return result
+
 # --- Automation Tasks ---
 @shared_task
 def generate_monthly_invoices_for_active_students():
@@ -319,44 +393,64 @@ def generate_monthly_invoices_for_active_students():
             first_of_month = next_month.replace(day=1)
             due_date = first_of_month.replace(day=15)
         
-        for student in active_students:
-            # Check if student already has an invoice for this billing period
-            existing_invoice = Invoice.objects.filter(
-                student=student,
-                issue_date__month=first_of_month.month,
-                issue_date__year=first_of_month.year,
-                description__icontains=first_of_month.strftime('%B %Y')
-            ).first()
-            
-            if existing_invoice:
-                logger.info(f"Invoice already exists for student {student.id} for {first_of_month.strftime('%B %Y')}")
-                continue
-            
-            # Get appropriate amount based on student
-            amount = _get_default_invoice_amount(student)
-            
-            # Create new invoice
-            invoice = Invoice.objects.create(
+        period = first_of_month.strftime('%B %Y')
+        
+        # One query: active students without an invoice for this billing period
+        already_billed = Invoice.objects.filter(
+            student=OuterRef("pk"),
+            issue_date__month=first_of_month.month,
+            issue_date__year=first_of_month.year,
+            description__icontains=period,
+        )
+        students = list(active_students.filter(~Exists(already_billed)).order_by("pk"))
+        if not students:
+            logger.info(f"All active students are already billed for {period}")
+            return "Created 0 invoices, scheduled 0 emails"
+        
+        from .models import next_invoice_numbers
+        numbers = next_invoice_numbers(len(students))
+        invoices = [
+            Invoice(
+                invoice_number=number,
                 student=student,
                 issue_date=first_of_month,
                 due_date=due_date,
-                description=f"Monthly tuition fee for {first_of_month.strftime('%B %Y')}",
-                amount=amount,
-                status='SENT'  # Automatically mark as sent
+                description=f"Monthly tuition fee for {period}",
+                amount=_get_default_invoice_amount(student),
+                status='SENT',  # Automatically mark as sent
             )
-            
-            created_count += 1
-            logger.info(f"Created invoice {invoice.invoice_number} for student {student.name}")
-            
-            # Email the invoice immediately
+            for student, number in zip(students, numbers)
+        ]
+
+        # A broker outage must not read as failed billing: the invoices are
+        # committed by then, so queueing errors are collected and reported apart.
+        unqueued = []
+
+        def queue_emails(chunk):
             try:
-                email_invoice.delay(invoice.id)
-                emailed_count += 1
-                logger.info(f"Scheduled email for invoice {invoice.invoice_number}")
+                queue_mail_batch(email_invoices_batch, chunk)
             except Exception as e:
-                logger.error(f"Failed to schedule email for invoice {invoice.id}: {e}")
-        
+                logger.error(f"Could not queue invoice emails for {chunk}: {e}")
+                unqueued.extend(chunk)
+
+        with transaction.atomic():
+            Invoice.objects.bulk_create(invoices, batch_size=getattr(settings, "INVOICE_BULK_BATCH_SIZE", 500))
+
+            # Backends that don't return primary keys from bulk_create
+            invoice_ids = [invoice.pk for invoice in invoices]
+            if None in invoice_ids:
+                invoice_ids = list(Invoice.objects.filter(invoice_number__in=numbers).values_list("pk", flat=True))
+
+            # Email the invoices in batches once they are committed
+            for chunk in _chunked(invoice_ids, getattr(settings, "INVOICE_EMAIL_BATCH_SIZE", 50)):
+                transaction.on_commit(lambda chunk=chunk: queue_emails(chunk))
+        created_count = len(invoices)
+        logger.info(f"Created {created_count} invoices for {period} ({numbers[0]} to {numbers[-1]})")
+
+        emailed_count = len(invoice_ids) - len(unqueued)
         result = f"Created {created_count} invoices, scheduled {emailed_count} emails"
+        if unqueued:
+            result += f"; could not queue emails for invoices {unqueued}"
         logger.info(result)
         return result
         
@@ -390,31 +484,66 @@ def check_overdue_invoices():
         logger.error(error_msg)
         return f"Failed: {error_msg}"
 
+def _reminders_due(Invoice):
+    """Unpaid invoices overdue or due within 3 days that have had fewer than 3 reminders"""
+    today = timezone.now().date()
+    return Invoice.objects.filter(
+        Q(status='SENT') | Q(status='PARTIAL') | Q(status='OVERDUE'),
+        due_date__lte=today + timedelta(days=3),  # Due in next 3 days or overdue
+        reminder_count__lt=3  # Max 3 reminders
+    )
+
 @shared_task
 def send_invoice_reminders():
-    """Send reminder emails for overdue or upcoming due invoices"""
+    """
+    Queue reminder emails for overdue or upcoming due invoices, one task
+    per mail batch, each at its own send slot
+    """
     Invoice = _get_model("finance", "Invoice")
     if not Invoice:
         return "Failed: Invoice model not found"
     
     try:
-        today = timezone.now().date()
-        reminder_invoices = Invoice.objects.filter(
-            Q(status='SENT') | Q(status='PARTIAL') | Q(status='OVERDUE'),
-            due_date__lte=today + timedelta(days=3),  # Due in next 3 days or overdue
-            reminder_count__lt=3  # Max 3 reminders
-        )
+        invoice_ids = [
+            invoice.id
+            for invoice in _reminders_due(Invoice).select_related("student").order_by("pk")
+            if _get_invoice_contact_details(invoice)[1]
+        ]
+        batches = _chunked(invoice_ids, getattr(settings, "EMAIL_BATCH_SIZE", 30))
+        for batch in batches:
+            queue_mail_batch(send_invoice_reminder_batch, batch)
+        
+        result = f"Scheduled {len(invoice_ids)} invoice reminders in {len(batches)} batches"
+        logger.info(result)
+        return result
         
-        sent_count = 0
-        for invoice in reminder_invoices:
-            try:
-                # Custom reminder email
-                contact_name, contact_email = _get_invoice_contact_details(invoice)
-                if not contact_email:
-                    continue
-                
-                subject = f"Reminder: Invoice {invoice.invoice_number} - Payment Due"
-                body = f"""Dear {contact_name},
+    except Exception as e:
+        error_msg = f"Error sending invoice reminders: {e}"
+        logger.error(error_msg)
+        return f"Failed: {error_msg}"
+
+@shared_task
+def send_invoice_reminder_batch(invoice_ids: list[int]):
+    """
+    Send one mail batch of reminders over one SMTP connection and count
+    them straight away, so a reminder that went out is never sent again
+    by a later batch or run
+    """
+    Invoice = _get_model("finance", "Invoice")
+    if not Invoice:
+        return "Failed: Invoice model not found"
+
+    invoice_ids = _take_mail_batch(send_invoice_reminder_batch, invoice_ids)
+    outgoing, messages = [], []
+    # Paid or already reminded since it was queued: skipped
+    for invoice in _reminders_due(Invoice).filter(pk__in=invoice_ids).select_related("student").order_by("pk"):
+        # Custom reminder email
+        contact_name, contact_email = _get_invoice_contact_details(invoice)
+        if not contact_email:
+            continue
+        
+        subject = f"Reminder: Invoice {invoice.invoice_number} - Payment Due"
+        body = f"""Dear {contact_name},
 
 This is a friendly reminder that your invoice #{invoice.invoice_number} is {'overdue' if invoice.status == 'OVERDUE' else 'due soon'}.
 
@@ -429,29 +558,51 @@ Thank you,
 Accounts Department
 Lu-mino Education ERP
 """
+        outgoing.append(invoice.id)
+        messages.append(EmailMessage(subject, body, settings.DEFAULT_FROM_EMAIL, [contact_email]))
+    
+    failed = {outgoing[i] for i in send_batched(messages)}
+    sent_ids = [pk for pk in outgoing if pk not in failed]
+    if failed:
+        logger.error(f"Failed to send reminders for invoices {sorted(failed)[:20]}")
+    
+    # Update reminder counts
+    Invoice.objects.filter(pk__in=sent_ids).update(reminder_count=F("reminder_count") + 1)
+    
+    result = f"Sent {len(sent_ids)} invoice reminders"
+    logger.info(result)
+    return result
 
-                from_email = settings.DEFAULT_FROM_EMAIL
-                email = EmailMessage(subject, body, from_email, [contact_email])
-                email.send(fail_silently=False)
-                
-                # Update reminder count
-                invoice.reminder_count += 1
-                invoice.save(update_fields=['reminder_count'])
-                
-                sent_count += 1
-                logger.info(f"Sent reminder for invoice {invoice.invoice_number}")
-                
-            except Exception as e:
-                logger.error(f"Failed to send reminder for invoice {invoice.id}: {e}")
-        
-        result = f"Sent {sent_count} invoice reminders"
-        logger.info(result)
-        return result
-        
-    except Exception as e:
-        error_msg = f"Error sending invoice reminders: {e}"
-        logger.error(error_msg)
-        return f"Failed: {error_msg}"
+@shared_task
+def snapshot_treasury_balances():
+    """Store yesterday's closing treasury balances (and any days missing since the last run)"""
+    from .balances import snapshot_balances
+    written = snapshot_balances()
+    logger.info(f"Stored {written} treasury balance snapshots")
+    return written
+
+@shared_task
+def compact_treasury_ledger():
+    """Fold new treasury ledger entries into Treasury.balance so balance reads stay a short tail sum"""
+    from .ledger import compact
+    return compact(getattr(settings, "TREASURY_COMPACT_BATCH_SIZE", 10000))
+
+@shared_task
+def evict_document_cache():
+    """Age- and size-based eviction of cached invoice, receipt and PO PDFs."""
+    evicted = documents.evict()
+    return f"Evicted {evicted} cached document(s)"
+
+@shared_task
+def verify_invoice_balances():
+    """Recompute invoice paid totals from their payments in bulk and repair any drift"""
+    Invoice = _get_model("finance", "Invoice")
+    if not Invoice:
+        return 0
+    repaired = Invoice.objects.repair_paid_totals()
+    if repaired:
+        logger.warning(f"Repaired paid_total drift on {len(repaired)} invoices: {repaired[:20]}")
+    return len(repaired)
 
 @shared_task
 def generate_finance_reports():
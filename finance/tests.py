@@ -1,3 +1,488 @@
-from django.test import TestCase
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from importlib import import_module
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.core import mail
+from django.core.cache import cache
+from django.db import connection
+from django.core.files.storage import default_storage
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from core.testing import make_invoice, make_student
+
+from . import balances, documents, imports, ledger, numbering, tasks
+from .models import (
+    DocumentCounter, Expense, Invoice, Payment, RenderedDocument, Treasury, TreasuryBalanceSnapshot,
+    TreasuryTransaction, next_invoice_number,
+)
+
+
+def entry(treasury, amount, day, inflow=True):
+    return TreasuryTransaction.objects.create(treasury=treasury, amount=Decimal(amount), is_inflow=inflow, date=day)
+
+
+class BalanceSnapshotTests(TestCase):
+    def setUp(self):
+        self.cash = Treasury.objects.create(name="Cash", balance=Decimal("100.00"))
+        self.bank = Treasury.objects.create(name="Bank", balance=Decimal("0.00"))
+        entry(self.cash, "50.00", date(2025, 3, 2))
+        entry(self.cash, "20.00", date(2025, 3, 4), inflow=False)
+        entry(self.cash, "5.00", date(2025, 3, 6))
+        entry(self.bank, "300.00", date(2025, 3, 3))
+
+    def as_of(self, day):
+        return {b["name"]: b["balance"] for b in balances.balances_as_of(day)}
+
+    def test_snapshots_walk_back_from_the_live_balance(self):
+        self.assertEqual(balances.snapshot_balances(upto=date(2025, 3, 5), since=date(2025, 3, 1)), 10)
+        closing = dict(
+            TreasuryBalanceSnapshot.objects.filter(treasury=self.cash).values_list("date", "balance")
+        )
+        self.assertEqual(closing, {
+            date(2025, 3, 1): Decimal("100.00"), date(2025, 3, 2): Decimal("150.00"),
+            date(2025, 3, 3): Decimal("150.00"), date(2025, 3, 4): Decimal("130.00"),
+            date(2025, 3, 5): Decimal("130.00"),
+        })
+        # Only missing days are written
+        self.assertEqual(balances.snapshot_balances(upto=date(2025, 3, 6)), 2)
+
+    def test_as_of_matches_with_and_without_snapshots(self):
+        expected = [
+            {"Cash": Decimal("100.00"), "Bank": Decimal("0.00")},
+            {"Cash": Decimal("150.00"), "Bank": Decimal("300.00")},
+            {"Cash": Decimal("130.00"), "Bank": Decimal("300.00")},
+            {"Cash": Decimal("135.00"), "Bank": Decimal("300.00")},
+        ]
+        days = [date(2025, 3, 1), date(2025, 3, 3), date(2025, 3, 5), date(2025, 3, 9)]
+        self.assertEqual([self.as_of(d) for d in days], expected)
+
+        balances.snapshot_balances(upto=date(2025, 3, 4), since=date(2025, 2, 28))
+        with self.assertNumQueries(3):
+            self.as_of(date(2025, 3, 5))
+        self.assertEqual([self.as_of(d) for d in days], expected)
+
+    def test_back_dated_entries_drop_the_snapshots_they_make_stale(self):
+        balances.snapshot_balances(upto=date(2025, 3, 5), since=date(2025, 3, 1))
+        entry(self.cash, "1.00", date(2025, 3, 3))
+
+        kept = TreasuryBalanceSnapshot.objects.filter(treasury=self.cash).values_list("date", flat=True)
+        self.assertEqual(sorted(kept), [date(2025, 3, 1), date(2025, 3, 2)])
+        self.assertEqual(self.as_of(date(2025, 3, 4))["Cash"], Decimal("131.00"))
+
+    def test_payments_move_the_balance_through_the_ledger(self):
+        invoice = make_invoice(make_student(), amount="500.00")
+        Payment.objects.create(invoice=invoice, amount=Decimal("40.00"), treasury=self.bank, date=date(2025, 3, 8))
+        self.assertEqual(self.as_of(date(2025, 3, 7))["Bank"], Decimal("300.00"))
+        self.assertEqual(self.as_of(date(2025, 3, 8))["Bank"], Decimal("340.00"))
+
+
+class LedgerTests(TestCase):
+    def setUp(self):
+        self.cash = Treasury.objects.create(name="Cash", balance=Decimal("100.00"))
+        self.bank = Treasury.objects.create(name="Bank", balance=Decimal("0.00"))
+        self.invoice = make_invoice(make_student(), amount="500.00")
+
+    def balance(self, treasury):
+        return Treasury.objects.get(pk=treasury.pk).current_balance
+
+    def entries(self, source):
+        return list(TreasuryTransaction.objects.filter(source_id=source.pk).order_by("pk")
+                    .values_list("treasury__name", "date", "amount", "is_inflow"))
+
+    def test_edits_append_the_difference_instead_of_rewriting(self):
+        payment = Payment.objects.create(invoice=self.invoice, amount=Decimal("40.00"), treasury=self.cash,
+                                         date=date(2025, 3, 2))
+        payment.amount = Decimal("60.00")
+        payment.save()
+        payment.treasury, payment.date = self.bank, date(2025, 3, 5)
+        payment.save()
+        payment.save()  # unchanged: nothing to append
+
+        self.assertCountEqual(self.entries(payment), [
+            ("Cash", date(2025, 3, 2), Decimal("40.00"), True),
+            ("Cash", date(2025, 3, 2), Decimal("20.00"), True),
+            ("Cash", date(2025, 3, 2), Decimal("60.00"), False),
+            ("Bank", date(2025, 3, 5), Decimal("60.00"), True),
+        ])
+        self.assertEqual((self.balance(self.cash), self.balance(self.bank)), (Decimal("100.00"), Decimal("60.00")))
+
+    def test_deleting_reverses_the_net_entry(self):
+        expense = Expense.objects.create(description="Chalk", amount=Decimal("30.00"), treasury=self.cash,
+                                         date=date(2025, 3, 2))
+        self.assertEqual(self.balance(self.cash), Decimal("70.00"))
+        pk = expense.pk
+        expense.delete()
+        expense.pk = pk
+
+        self.assertEqual(self.entries(expense)[-1], ("Cash", date(2025, 3, 2), Decimal("30.00"), True))
+        self.assertEqual(self.balance(self.cash), Decimal("100.00"))
+
+    def test_record_covers_bulk_created_movements(self):
+        payments = Payment.objects.bulk_create([
+            Payment(invoice=self.invoice, amount=Decimal("10.00"), treasury=self.bank, date=date(2025, 3, 3)),
+            Payment(invoice=self.invoice, amount=Decimal("15.00"), treasury=self.bank, date=date(2025, 3, 4)),
+        ])
+        self.assertEqual(self.balance(self.bank), Decimal("0.00"))
+        ledger.record(payments)
+        self.assertEqual(self.balance(self.bank), Decimal("25.00"))
+
+    def test_compact_folds_the_tail_into_the_balance(self):
+        for day in (2, 3, 4):
+            entry(self.cash, "10.00", date(2025, 3, day), inflow=day != 3)
+
+        self.assertEqual(ledger.compact(batch_size=2), 2)
+        self.assertEqual(Treasury.objects.get(pk=self.cash.pk).balance, Decimal("100.00"))
+        self.assertEqual(self.balance(self.cash), Decimal("110.00"))
+        self.assertEqual(ledger.compact(), 1)
+        self.assertEqual(ledger.compact(), 0)
+        cash = Treasury.objects.get(pk=self.cash.pk)
+        self.assertEqual((cash.balance, cash.current_balance), (Decimal("110.00"), Decimal("110.00")))
+
+
+@mock.patch("finance.signals.email_invoice")
+class PaidTotalTests(TestCase):
+    def setUp(self):
+        self.student = make_student()
+        self.cash = Treasury.objects.create(name="Cash", balance=Decimal("0.00"))
+        self.invoice = make_invoice(self.student, due=date(2099, 1, 1))
+
+    def pay(self, amount, invoice=None):
+        return Payment.objects.create(invoice=invoice or self.invoice, amount=Decimal(amount), treasury=self.cash,
+                                      date=date(2025, 3, 2))
+
+    def state(self, invoice=None):
+        return Invoice.objects.values_list("paid_total", "balance", "status").get(pk=(invoice or self.invoice).pk)
+
+    def test_payments_move_the_total_and_status_by_their_delta(self, email):
+        first = self.pay("30.00")
+        self.assertEqual(self.state(), (Decimal("30.00"), Decimal("70.00"), "PARTIAL"))
+        self.pay("70.00")
+        self.assertEqual(self.state(), (Decimal("100.00"), Decimal("0.00"), "PAID"))
+        email.delay.assert_called_once_with(self.invoice.pk)
+
+        other = make_invoice(self.student, due=date(2099, 1, 1))
+        first.invoice, first.amount = other, Decimal("50.00")
+        first.save()
+        self.assertEqual(self.state(), (Decimal("70.00"), Decimal("30.00"), "PARTIAL"))
+        self.assertEqual(self.state(other), (Decimal("50.00"), Decimal("50.00"), "PARTIAL"))
+        first.delete()
+        self.assertEqual(self.state(other), (Decimal("0.00"), Decimal("100.00"), "SENT"))
+
+    def test_a_stale_invoice_save_keeps_the_paid_total_and_its_status(self, email):
+        stale = Invoice.objects.get(pk=self.invoice.pk)
+        self.pay("40.00")
+        stale.description = "Edited"
+        stale.save()
+        self.assertEqual(self.state(), (Decimal("40.00"), Decimal("60.00"), "PARTIAL"))
+        self.assertEqual((stale.paid_total, stale.status), (Decimal("40.00"), "PARTIAL"))
+
+        Invoice.objects.apply_payment(self.invoice.pk, Decimal("60.00"))
+        stale.save()
+        self.assertEqual(self.state(), (Decimal("100.00"), Decimal("0.00"), "PAID"))
+
+    def test_apply_payments_updates_many_invoices_per_statement(self, email):
+        invoices = [self.invoice] + [make_invoice(self.student, due=date(2099, 1, 1)) for _ in range(2)]
+        overdue = make_invoice(self.student)
+        deltas = {invoices[0].pk: Decimal("100.00"), invoices[1].pk: Decimal("25.00"), invoices[2].pk: Decimal("0"),
+                  overdue.pk: Decimal("10.00")}
+        with self.assertNumQueries(2):
+            Invoice.objects.apply_payments(deltas, batch_size=2)
+        self.assertEqual([self.state(i)[::2] for i in invoices + [overdue]], [
+            (Decimal("100.00"), "PAID"), (Decimal("25.00"), "PARTIAL"), (Decimal("0.00"), "SENT"),
+            (Decimal("10.00"), "OVERDUE"),
+        ])
+
+    def test_repair_recomputes_only_drifted_totals(self, email):
+        drifted = make_invoice(self.student, due=date(2099, 1, 1))
+        self.pay("20.00")
+        self.pay("100.00", invoice=drifted)
+        Invoice.objects.filter(pk=drifted.pk).update(paid_total=Decimal("5.00"), status="PARTIAL")
+
+        self.assertEqual(Invoice.objects.repair_paid_totals(), [drifted.pk])
+        self.assertEqual(self.state(drifted), (Decimal("100.00"), Decimal("0.00"), "PAID"))
+        self.assertEqual(tasks.verify_invoice_balances(), 0)
+
+
+class PaymentImportTests(TestCase):
+    def setUp(self):
+        student = make_student()
+        self.cash = Treasury.objects.create(name="Cash", balance=Decimal("0.00"))
+        self.first = make_invoice(student, due=date(2099, 1, 1))
+        self.second = make_invoice(student, due=date(2099, 1, 1))
+
+    def rows(self, text):
+        return imports.read_rows(BytesIO(text.encode("utf-8-sig")), "statement.csv")
+
+    def test_reads_csv_and_xlsx_with_normalised_headers(self):
+        self.assertEqual(self.rows("Invoice Number,Amount,Date\nINV-1,10,2025-03-02\n,,\n"),
+                         [{"invoice_number": "INV-1", "amount": "10", "date": "2025-03-02"}])
+        with self.assertRaisesMessage(ValueError, "Missing column(s): date"):
+            self.rows("invoice_number,amount\n")
+        with self.assertRaises(ValueError):
+            imports.read_rows(BytesIO(b""), "statement.pdf")
+
+        from openpyxl import Workbook, load_workbook
+        book = Workbook()
+        book.active.append(["Invoice Number", "Amount", "Date"])
+        book.active.append(["INV-1", 10, date(2025, 3, 2)])
+        upload = BytesIO()
+        book.save(upload)
+        upload.seek(0)
+        opened = []
+        with mock.patch("openpyxl.load_workbook", lambda *a, **kw: opened.append(load_workbook(*a, **kw)) or opened[0]):
+            rows = imports.read_rows(upload, "statement.xlsx")
+        self.assertEqual([r["amount"] for r in rows], [10])
+        self.assertIsNone(opened[0]._archive.fp)  # closed
+
+    def test_every_bad_row_is_reported_and_nothing_is_written(self):
+        number = self.first.invoice_number
+        rows = self.rows(
+            "invoice_number,amount,date,treasury\n"
+            f"{number},10,2025-03-02,\n"
+            f"INV-9999,10,2025-03-02,\n"
+            f"{number},-5,2025-03-02,\n"
+            f"{number},10,March,\n"
+            f"{number},10,2025-03-02,Safe\n"
+        )
+        result = imports.import_payments(rows, treasury="cash")
+        self.assertEqual([e["row"] for e in result["errors"]], [3, 4, 5, 6])
+        self.assertFalse(Payment.objects.exists())
+
+        self.assertEqual(imports.import_payments(rows[:1], treasury="Vault")["errors"][0]["row"], None)
+        self.assertEqual(imports.import_payments(rows[:1])["errors"], [{"row": 2, "error": "No treasury given"}])
+
+    def test_repeated_rows_are_duplicates_unless_their_reference_differs(self):
+        number = self.first.invoice_number
+        rows = self.rows(
+            "invoice_number,amount,date,reference\n"
+            f"{number},10,2025-03-02,TX1\n"
+            f"{number},10,02/03/2025,TX2\n"
+            f"{number},10.00,2025-03-02,TX1\n"
+        )
+        result = imports.import_payments(rows, treasury=self.cash.pk, dry_run=True)
+        self.assertEqual(result["errors"], [{"row": 4, "error": "Duplicate of row 2"}])
+        self.assertEqual(imports.import_payments(rows, treasury="Cash", dry_run=True, allow_duplicates=True)["errors"], [])
+
+    @mock.patch("finance.imports.email_invoices_batch")
+    @mock.patch("finance.imports.email_payment_receipts_batch")
+    def test_import_posts_payments_ledger_and_totals_in_bulk(self, receipts, paid):
+        rows = self.rows(
+            "invoice_number,amount,date\n"
+            f"{self.first.invoice_number},60,2025-03-02\n"
+            f"{self.first.invoice_number},40,2025-03-03\n"
+            f"{self.second.invoice_number},\"1,5\",2025-03-03\n"
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            result = imports.import_payments(rows, treasury="Cash")
+
+        self.assertEqual({k: result[k] for k in ("created", "invoices", "total", "paid")},
+                         {"created": 3, "invoices": 2, "total": Decimal("115.00"), "paid": 1})
+        self.assertEqual(Treasury.objects.get(pk=self.cash.pk).current_balance, Decimal("115.00"))
+        self.assertEqual(Invoice.objects.get(pk=self.first.pk).status, "PAID")
+        self.assertEqual(Invoice.objects.get(pk=self.second.pk).paid_total, Decimal("15.00"))
+        self.assertEqual(receipts.apply_async.call_args.args[0],
+                         (list(Payment.objects.order_by("pk").values_list("pk", flat=True)),))
+        self.assertEqual(paid.apply_async.call_args.args[0], ([self.first.pk],))
+
+        self.assertEqual(result["unqueued"], {"payments": [], "invoices": []})
+
+        # Re-importing the statement is rejected row by row
+        again = imports.import_payments(rows, treasury="Cash")
+        self.assertEqual([e["row"] for e in again["errors"]], [2, 3, 4])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+@mock.patch("finance.signals.email_invoice")
+class DocumentCacheTests(TestCase):
+    def setUp(self):
+        self.cash = Treasury.objects.create(name="Cash", balance=Decimal("0.00"))
+        self.invoices = [make_invoice(make_student(n), due=date(2099, 1, 1)) for n in range(2)]
+        patcher = mock.patch.object(documents, "render_many", side_effect=lambda docs: [b"%PDF-" for _doc in docs])
+        self.render = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def invoices_pdfs(self):
+        return documents.pdfs("invoice", list(documents.KINDS["invoice"].queryset().order_by("pk")))
+
+    def test_current_versions_are_served_from_storage(self, email):
+        first = self.invoices_pdfs()
+        self.assertEqual(self.render.call_count, 1)
+        invoices = list(documents.KINDS["invoice"].queryset().order_by("pk"))
+        with self.assertNumQueries(1):
+            self.assertEqual(documents.pdfs("invoice", invoices), first)
+        self.assertEqual(self.render.call_count, 1)
+
+        fh, name = documents.open_pdf("invoice", self.invoices[0].pk)
+        with fh:
+            self.assertEqual((fh.read(), name), (first[0], f"invoice_{self.invoices[0].pk}.pdf"))
+        self.assertEqual(self.render.call_count, 1)
+        self.assertEqual(documents.open_pdf("invoice", 0), (None, None))
+
+    def test_payments_and_edits_render_a_new_version_over_the_old_file(self, email):
+        self.invoices_pdfs()
+        old = RenderedDocument.objects.get(object_id=self.invoices[0].pk)
+        Payment.objects.create(invoice=self.invoices[0], amount=Decimal("10.00"), treasury=self.cash,
+                               date=date(2025, 3, 2))
+
+        self.invoices_pdfs()
+        new = RenderedDocument.objects.get(object_id=self.invoices[0].pk)
+        self.assertNotEqual(new.version, old.version)
+        self.assertFalse(default_storage.exists(old.file.name))
+        self.assertTrue(default_storage.exists(new.file.name))
+        self.assertEqual(self.render.call_count, 2)
+        self.assertEqual(RenderedDocument.objects.count(), 2)
+
+    def test_evict_drops_unused_then_least_recent_documents(self, email):
+        self.invoices_pdfs()
+        first, second = RenderedDocument.objects.order_by("object_id")
+        RenderedDocument.objects.filter(pk=first.pk).update(last_used_at=timezone.now() - timedelta(days=2))
+
+        self.assertEqual(documents.evict(max_age=timedelta(days=1)), 1)
+        self.assertEqual(list(RenderedDocument.objects.all()), [second])
+        self.assertFalse(default_storage.exists(first.file.name))
+        self.assertEqual(documents.evict(max_age=timedelta(days=1), max_bytes=second.size), 0)
+        self.assertEqual(documents.evict(max_age=timedelta(days=1), max_bytes=second.size - 1), 1)
+        self.assertFalse(default_storage.exists(second.file.name))
+
+
+@override_settings(INVOICE_EMAIL_BATCH_SIZE=2, EMAIL_BATCH_INTERVAL=60)
+class MonthlyBillingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        for n in range(3):
+            make_student(n)
+        make_student(9, is_active=False)
+
+    @mock.patch("finance.tasks.email_invoices_batch")
+    def test_emails_are_queued_only_once_the_invoices_commit(self, batch):
+        with self.captureOnCommitCallbacks() as callbacks:
+            result = tasks.generate_monthly_invoices_for_active_students()
+        self.assertEqual(len(callbacks), 2)
+        batch.apply_async.assert_not_called()
+        self.assertEqual(Invoice.objects.count(), 3)
+
+        for callback in callbacks:
+            callback()
+        queued = [c.args[0][0] for c in batch.apply_async.call_args_list]
+        first, second = [c.kwargs["countdown"] for c in batch.apply_async.call_args_list]
+        self.assertAlmostEqual(second - first, 60, delta=1)
+        self.assertEqual(sorted(sum(queued, [])), sorted(Invoice.objects.values_list("pk", flat=True)))
+        self.assertEqual(result, "Created 3 invoices, scheduled 3 emails")
+
+        # A second run in the same period bills nobody
+        self.assertEqual(tasks.generate_monthly_invoices_for_active_students(), "Created 0 invoices, scheduled 0 emails")
+
+
+@override_settings(EMAIL_BATCH_SIZE=2, EMAIL_BATCH_INTERVAL=60)
+class ReminderTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.invoices = [
+            make_invoice(make_student(n, guardian_email=f"g{n}@example.com"), status="OVERDUE") for n in range(3)
+        ]
+        make_invoice(make_student(7))  # no address
+        make_invoice(make_student(8, guardian_email="paid@example.com"), status="PAID")
+
+    def counts(self):
+        return [Invoice.objects.get(pk=i.pk).reminder_count for i in self.invoices]
+
+    def test_one_task_per_mail_batch_at_its_own_send_slot(self):
+        with mock.patch.object(tasks.send_invoice_reminder_batch, "apply_async") as queue:
+            self.assertEqual(tasks.send_invoice_reminders(), "Scheduled 3 invoice reminders in 2 batches")
+
+        self.assertEqual([c.args[0] for c in queue.call_args_list],
+                         [([self.invoices[0].pk, self.invoices[1].pk],), ([self.invoices[2].pk],)])
+        first, second = [c.kwargs["countdown"] for c in queue.call_args_list]
+        self.assertAlmostEqual(second - first, 60, delta=1)
+        self.assertEqual(mail.outbox, [])
+
+    def test_each_batch_counts_its_reminders_and_passes_on_the_rest(self):
+        ids = [i.pk for i in self.invoices]
+        with mock.patch.object(tasks.send_invoice_reminder_batch, "apply_async") as queue:
+            self.assertEqual(tasks.send_invoice_reminder_batch(ids), "Sent 2 invoice reminders")
+        self.assertEqual(queue.call_args.args[0], (ids[2:],))
+        self.assertEqual(self.counts(), [1, 1, 0])
+        self.assertEqual(len(mail.outbox), 2)
+
+        Invoice.objects.filter(pk=ids[0]).update(reminder_count=3)
+        tasks.send_invoice_reminder_batch(ids[:2])
+        self.assertEqual(self.counts(), [3, 2, 0])
+
+
+class PaymentImportCommitTests(TransactionTestCase):
+    # Outside a test transaction, so the import really commits
+
+    @mock.patch("finance.imports.email_invoices_batch")
+    @mock.patch("finance.imports.email_payment_receipts_batch")
+    def test_broker_failure_after_commit_is_reported_not_raised(self, receipts, paid):
+        cash = Treasury.objects.create(name="Cash", balance=Decimal("0.00"))
+        invoice = make_invoice(make_student(), due=date(2099, 1, 1))
+        receipts.apply_async.side_effect = ConnectionRefusedError("broker down")
+        rows = [{"invoice_number": invoice.invoice_number, "amount": "100", "date": "2025-03-02"}]
+
+        result = imports.import_payments(rows, treasury=cash.pk)
+
+        payment = Payment.objects.get()
+        self.assertEqual(result["created"], 1)
+        self.assertEqual(result["unqueued"], {"payments": [payment.pk], "invoices": []})
+        self.assertEqual(paid.apply_async.call_args.args[0], ([invoice.pk],))
+
+
+@override_settings(INVOICE_EMAIL_BATCH_SIZE=2)
+class MonthlyBillingCommitTests(TransactionTestCase):
+    # Outside a test transaction, so the billing block really commits
+
+    @mock.patch("finance.tasks.email_invoices_batch")
+    def test_broker_failure_is_reported_apart_from_billing(self, batch):
+        for n in range(3):
+            make_student(n)
+        batch.apply_async.side_effect = [None, ConnectionRefusedError("broker down")]
+        result = tasks.generate_monthly_invoices_for_active_students()
+
+        self.assertEqual(Invoice.objects.count(), 3)
+        self.assertFalse(result.startswith("Failed"))
+        unqueued = batch.apply_async.call_args_list[1].args[0][0]
+        self.assertEqual(result, f"Created 3 invoices, scheduled 2 emails; could not queue emails for invoices {unqueued}")
+
+
+class NumberingTests(TestCase):
+    def setUp(self):
+        self.student = make_student()
+
+    def seeded(self, *numbers):
+        DocumentCounter.objects.all().delete()
+        for number in numbers:
+            make_invoice(self.student, invoice_number=number)
+
+    def test_blocks_are_consecutive_and_continue_the_single_allocator(self):
+        self.seeded()
+        self.assertEqual(numbering.allocate_numbers("invoice", 3), ["INV-0001", "INV-0002", "INV-0003"])
+        self.assertEqual(next_invoice_number(), "INV-0004")
+        self.assertEqual(make_invoice(self.student).invoice_number, "INV-0005")
+        self.assertEqual(numbering.allocate_numbers("invoice", 0), [])
+        with self.assertRaises(ValueError):
+            numbering.allocate_numbers("receipt")
+
+    def test_counter_starts_after_the_highest_number_in_the_configured_format(self):
+        self.seeded("INV-0041", "INV-7", "INV-12a", "2025-9999", "OLD-0500")
+        self.assertEqual(numbering.allocate_numbers("invoice"), ["INV-0042"])
+
+    @override_settings(INVOICE_NUMBER_PREFIX="INV/", INVOICE_NUMBER_PADDING=5)
+    def test_prefixes_without_a_dash_are_seeded_too(self):
+        self.seeded("INV/00120", "INV-0900")
+        self.assertEqual(numbering.allocate_numbers("invoice", 2), ["INV/00121", "INV/00122"])
+
+    @override_settings(INVOICE_NUMBER_PREFIX="INV/")
+    def test_migration_seeds_counters_without_app_code(self):
+        migration = import_module("finance.migrations.0008_document_numbering")
+        self.seeded("INV/0007", "INV-0100")
+
+        migration.create_sequences(apps, mock.Mock(connection=mock.Mock(vendor=connection.vendor)))
+
+        self.assertEqual(DocumentCounter.objects.get(kind="invoice").last, 7)
+        self.assertEqual(DocumentCounter.objects.get(kind="po").last, 0)
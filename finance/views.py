@@ -1,25 +1,37 @@
-from django.http import HttpResponse, JsonResponse
+import logging
+
+from django.http import FileResponse, HttpResponse, JsonResponse
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from core.api.permissions import ModulePermission
+
+from . import documents
+from .imports import import_payments, read_rows
 
 # Make sure all required tasks are imported
 from .tasks import (
-    generate_invoice_pdf, 
     email_invoice, 
     email_payment_receipt,
-    generate_purchase_order_pdf,
-    generate_payment_receipt_pdf
 )
 
+logger = logging.getLogger(__name__)
+
+def _pdf_response(kind, pk, failure):
+    """Streams the cached PDF file; it is rendered and stored first when stale or missing."""
+    try:
+        pdf_file, filename = documents.open_pdf(kind, pk)
+    except Exception as e:
+        logger.error(f"Error generating {kind} PDF {pk}: {e}")
+        pdf_file = None
+    if pdf_file is None:
+        return HttpResponse(failure, status=500)
+    return FileResponse(pdf_file, as_attachment=True, filename=filename, content_type='application/pdf')
+
 class InvoicePDFView(APIView):
     permission_classes = [IsAuthenticated]
     def get(self, request, pk):
-        pdf_bytes = generate_invoice_pdf(pk)
-        if pdf_bytes is None:
-            return HttpResponse("Failed to generate PDF.", status=500)
-        response = HttpResponse(pdf_bytes, content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="invoice_{pk}.pdf"'
-        return response
+        return _pdf_response("invoice", pk, "Failed to generate PDF.")
 
 class InvoiceEmailView(APIView):
     permission_classes = [IsAuthenticated]
@@ -32,26 +44,44 @@ class PurchaseOrderPDFView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, pk):
-        pdf_bytes = generate_purchase_order_pdf(pk)
-        if pdf_bytes is None:
-            return HttpResponse("Failed to generate PO PDF.", status=500)
-            
-        response = HttpResponse(pdf_bytes, content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="po_{pk}.pdf"'
-        return response
+        return _pdf_response("po", pk, "Failed to generate PO PDF.")
 
 class PaymentReceiptPDFView(APIView):
     permission_classes = [IsAuthenticated]
     def get(self, request, pk):
-        pdf_bytes = generate_payment_receipt_pdf(pk)
-        if pdf_bytes is None:
-            return HttpResponse("Failed to generate Receipt PDF.", status=500)
-        response = HttpResponse(pdf_bytes, content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="receipt_{pk}.pdf"'
-        return response
+        return _pdf_response("receipt", pk, "Failed to generate Receipt PDF.")
 
 class PaymentReceiptEmailView(APIView):
     permission_classes = [IsAuthenticated]
     def post(self, request, pk):
         email_payment_receipt.delay(pk)
         return JsonResponse({"message": "Payment receipt emailing has been started."})
+
+class PaymentImportView(APIView):
+    """
+    POST a bank statement (multipart "file", CSV or XLSX) to record its
+    payments in one go. Optional fields: "treasury" (name or id for rows
+    without one), "dry_run", "allow_duplicates", "send_receipts".
+    """
+    permission_classes = [IsAuthenticated, ModulePermission]
+    module_name = 'finance'
+
+    def post(self, request):
+        upload = request.FILES.get("file")
+        if not upload:
+            return Response({"error": "No file uploaded."}, status=400)
+        flag = lambda name, default: str(request.data.get(name, default)).lower() in ("1", "true", "yes", "on")
+        try:
+            rows = read_rows(upload, upload.name)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        result = import_payments(
+            rows,
+            treasury=request.data.get("treasury"),
+            dry_run=flag("dry_run", False),
+            allow_duplicates=flag("allow_duplicates", False),
+            send_receipts=flag("send_receipts", True),
+        )
+        if result["errors"]:
+            return Response(result, status=400)
+        return Response(result, status=201 if result["created"] else 200)
@@ -89,6 +89,14 @@ export const updatePayment = (id, data) =>
 export const deletePayment = (id) =>
   axios.delete(`${FINANCE_URL}/payments/${id}/`);
 
+// Bank-statement import (CSV/XLSX: invoice_number, amount, date[, treasury])
+export const importPayments = (file, options = {}) => {
+  const form = new FormData();
+  form.append("file", file);
+  Object.entries(options).forEach(([k, v]) => v !== undefined && v !== "" && form.append(k, v));
+  return axios.post(`${FINANCE_URL}/payments/import/`, form, { timeout: 120000 }).then((r) => r.data);
+};
+
 // Payment PDF Download and Email functions
 export const downloadPaymentPDF = (id) =>
   axios.get(`${FINANCE_URL}/payments/${id}/receipt.pdf`, { 
@@ -4,9 +4,12 @@ import api from "./axios";
 // CORRECTED PATH
 const BASE = "/reporting";
 
-// List recent report jobs
-export async function listReports() {
-  const res = await api.get(`${BASE}/`);
+// List recent report jobs, newest first: { results, next }; pass `next` back as `cursor`
+export async function listReports({ cursor, pageSize, ...filters } = {}) {
+  const params = { ...filters };
+  if (cursor) params.cursor = cursor;
+  if (pageSize) params.page_size = pageSize;
+  const res = await api.get(`${BASE}/`, { params });
   return res.data;
 }
 
@@ -22,6 +25,18 @@ export async function getReportStatus(jobId) {
   return res.data;
 }
 
+// Long-poll for job changes after `since` (omit it to get the current cursor)
+export async function waitForReportEvents(since, { signal } = {}) {
+  const res = await api.get(`${BASE}/events/`, { params: since ? { since } : {}, signal });
+  return res.data;
+}
+
+// Cancel a queued or running job
+export async function cancelReport(jobId) {
+  const res = await api.post(`${BASE}/${jobId}/cancel/`);
+  return res.data;
+}
+
 // Build a direct URL (only useful if endpoint is public; we keep for UI linking)
 export function getReportDownloadUrl(jobId) {
   const base = api.defaults.baseURL ? api.defaults.baseURL.replace(/\/+$/, "") : "";
@@ -69,6 +69,7 @@ export default function Invoices() {
     issue_date: new Date(inv.issue_date).toLocaleDateString(),
     due_date: new Date(inv.due_date).toLocaleDateString(),
     amount: parseFloat(inv.amount).toFixed(2),
+    balance: parseFloat(inv.balance).toFixed(2),
     _actions: (
       <div className="flex gap-2 items-center">
         <button
@@ -108,6 +109,7 @@ export default function Invoices() {
     { key: "invoice_number", label: "Invoice #", width: "120px" },
     { key: "student_name", label: "Student", width: "200px" },
     { key: "amount", label: "Amount", width: "100px" },
+    { key: "balance", label: "Balance", width: "100px" },
     { key: "issue_date", label: "Issued", width: "100px" },
     { key: "due_date", label: "Due", width: "100px" },
     { key: "status", label: "Status", width: "100px" },
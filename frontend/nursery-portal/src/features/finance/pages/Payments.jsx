@@ -1,10 +1,10 @@
-import { useState } from "react";
+import { useRef, useState } from "react";
 import { useNavigate } from "react-router-dom";
-import { FiSearch, FiX, FiPlus } from "react-icons/fi";
+import { FiSearch, FiX, FiPlus, FiUpload } from "react-icons/fi";
 import { useQuery, useMutation, useQueryClient } from "@tanstack/react-query";
 import { toast, Toaster } from "react-hot-toast";
 
-import { listPayments, deletePayment } from "../../../api/finance";
+import { listPayments, deletePayment, importPayments } from "../../../api/finance";
 import DataTable from "../../../components/ui/DataTable";
 import SkeletonTable from "../../../components/ui/SkeletonTable";
 import ConfirmDialog from "../../../components/ui/ConfirmDialog";
@@ -14,6 +14,7 @@ export default function Payments() {
   const navigate = useNavigate();
   const [confirmID, setConfirmID] = useState(null);
   const [search, setSearch] = useState("");
+  const fileInput = useRef(null);
 
   const { data: payments = [], isLoading } = useQuery({
     queryKey: ["payments"],
@@ -68,6 +69,26 @@ export default function Payments() {
     onError: () => toast.error("Delete failed"),
   });
   
+  const { mutate: importFile, isPending: importing } = useMutation({
+    mutationFn: (file) => importPayments(file),
+    onSuccess: (res) => {
+      toast.success(`Imported ${res.created} payments (${res.paid} invoices now paid)`);
+      qc.invalidateQueries({ queryKey: ["payments"] });
+      qc.invalidateQueries({ queryKey: ["invoices"] });
+    },
+    onError: (err) => {
+      const data = err?.response?.data;
+      const first = data?.errors?.[0];
+      toast.error(
+        data?.error ||
+          (first ? `${data.errors.length} invalid row(s); row ${first.row ?? "-"}: ${first.error}` : "Import failed")
+      );
+    },
+    onSettled: () => {
+      if (fileInput.current) fileInput.current.value = "";
+    },
+  });
+
   // --- ADD THIS FUNCTION FOR BULK DELETE ---
   const removeMany = async (ids) => {
     if (!window.confirm(`Delete ${ids.length} payments?`)) return;
@@ -87,12 +108,29 @@ export default function Payments() {
         <div className="bg-white shadow-lg rounded-2xl p-6 space-y-6">
           <div className="flex items-center justify-between">
             <h2 className="text-2xl font-semibold">Payments</h2>
-            <button
-              onClick={() => navigate("/finance/payments/new")}
-              className="btn-primary flex items-center gap-2"
-            >
-              <FiPlus /> Add Payment
-            </button>
+            <div className="flex items-center gap-2">
+              <input
+                ref={fileInput}
+                type="file"
+                accept=".csv,.xlsx"
+                className="hidden"
+                onChange={(e) => e.target.files?.[0] && importFile(e.target.files[0])}
+              />
+              <button
+                onClick={() => fileInput.current?.click()}
+                disabled={importing}
+                className="btn-secondary flex items-center gap-2"
+                title="CSV or XLSX with invoice_number, amount, date and treasury columns"
+              >
+                <FiUpload /> {importing ? "Importing…" : "Import Statement"}
+              </button>
+              <button
+                onClick={() => navigate("/finance/payments/new")}
+                className="btn-primary flex items-center gap-2"
+              >
+                <FiPlus /> Add Payment
+              </button>
+            </div>
           </div>
 
           <div className="relative w-full max-w-lg">
@@ -1,28 +1,35 @@
 // src/features/reporting/pages/ReportsPage.jsx
-import React, { useMemo, useState } from "react";
-import { useQuery, useMutation, useQueryClient } from "@tanstack/react-query";
+import React, { useEffect, useMemo, useState } from "react";
+import { useInfiniteQuery, useQuery, useMutation, useQueryClient } from "@tanstack/react-query";
 import DatePicker from "react-datepicker";
 import "react-datepicker/dist/react-datepicker.css";
-import { FiDownload, FiFileText, FiPlayCircle, FiRefreshCcw } from "react-icons/fi";
+import { FiDownload, FiFileText, FiPlayCircle, FiRefreshCcw, FiXCircle } from "react-icons/fi";
 import { toast } from "react-hot-toast";
 import {
   listReports,
   requestReport,
   getReportStatus,
   downloadReport,
+  cancelReport,
+  waitForReportEvents,
 } from "../../../api/reporting";
+import { listClassrooms } from "../../../api/classrooms";
 
 // Report catalog:
-// - params: which extra inputs to show ("dates", "threshold", "daysAhead")
+// - params: which extra inputs to show ("dates", "asOf", "compare", "threshold", "daysAhead",
+//   "invoiceStatus", "classroom")
 // - formats: which output formats are supported for this report
+// - types: report type to request per format, when a format has its own builder
 const REPORTS = {
   // Finance
-  PNL:             { label: "Profit & Loss",                params: ["dates"],   formats: ["PDF"] },
+  PNL:             { label: "Profit & Loss",                params: ["dates", "compare"], formats: ["PDF"] },
   CASH:            { label: "Cash Flow",                    params: ["dates"],   formats: ["PDF"] },
-  BS:              { label: "Balance Sheet",                params: [],          formats: ["PDF"] },
+  BS:              { label: "Balance Sheet",                params: ["asOf"],    formats: ["PDF"] },
+  INVOICES:        { label: "Invoice PDFs (batch)",         params: ["dates", "invoiceStatus", "classroom"],
+                     formats: ["ZIP", "PDF"], types: { ZIP: "INVOICES_ZIP", PDF: "INVOICES_PDF" } },
 
   // Inventory
-  LOW_STOCK:       { label: "Inventory: Low Stock",         params: ["threshold"], formats: ["PDF", "XLSX"] },
+  LOW_STOCK:       { label: "Inventory: Low Stock",         params: ["threshold"], formats: ["PDF", "XLSX"], types: { PDF: "LOW_STOCK_PDF" } },
   INV_VALUATION:   { label: "Inventory Valuation",          params: [],          formats: ["PDF", "XLSX"] },
 
   // Documents
@@ -39,8 +46,37 @@ const REPORTS = {
 
   // HR
   HR_ATT_SUMMARY:  { label: "HR Attendance Summary",        params: ["dates"],   formats: ["PDF", "XLSX"] },
+  PAYROLL_VS_ATT:  { label: "Payroll vs Attendance",        params: ["dates"],   formats: ["XLSX"] },
 };
 
+const IN_FLIGHT = ["PENDING", "IN_PROGRESS"];
+
+function fmtProgress(job) {
+  if (job?.status !== "IN_PROGRESS") return "";
+  const done = job.rows_processed || 0;
+  const pct = job.rows_total ? ` (${Math.min(100, Math.round((100 * done) / job.rows_total))}%)` : "";
+  return `${job.phase || "starting"}: ${done}${job.rows_total ? ` / ${job.rows_total}` : ""}${pct}`;
+}
+
+// Applies pushed job rows to the cached list pages in place. Returns false when
+// some job is not in the list yet (created elsewhere), so the caller refetches.
+function patchJobList(qc, jobs) {
+  const data = qc.getQueryData(["reports", "list"]);
+  if (!data) return true;
+  const byId = new Map(jobs.map((job) => [job.id, job]));
+  const seen = new Set();
+  const pages = data.pages.map((page) => ({
+    ...page,
+    results: page.results.map((row) => {
+      if (!byId.has(row.id)) return row;
+      seen.add(row.id);
+      return byId.get(row.id);
+    }),
+  }));
+  qc.setQueryData(["reports", "list"], { ...data, pages });
+  return seen.size === byId.size;
+}
+
 function fmtDate(d) {
   if (!d) return "";
   const iso = new Date(d).toISOString();
@@ -55,25 +91,65 @@ export default function ReportsPage() {
   const [params, setParams] = useState({
     start: new Date(new Date().getFullYear(), new Date().getMonth(), 1),
     end: new Date(),
-    threshold: 5,
+    as_of: new Date(),
+    threshold: "",
     days_ahead: 30,
+    compare: "",
+    status: "",
+    classroom: "",
   });
   const [currentJobId, setCurrentJobId] = useState(null);
 
-  const jobsQuery = useQuery({
+  // Job changes are pushed through the events long-poll below, so neither
+  // query polls on its own.
+  const jobsQuery = useInfiniteQuery({
     queryKey: ["reports", "list"],
-    queryFn: listReports,
-    refetchInterval: 8000,
+    queryFn: ({ pageParam }) => listReports({ cursor: pageParam }),
+    initialPageParam: null,
+    getNextPageParam: (lastPage) => lastPage.next,
+  });
+  const jobs = jobsQuery.data?.pages.flatMap((p) => p.results) || [];
+
+  const classroomsQuery = useQuery({
+    queryKey: ["classrooms"],
+    queryFn: listClassrooms,
+    enabled: !!REPORTS[reportType]?.params?.includes("classroom"),
   });
 
   const jobStatusQuery = useQuery({
     queryKey: ["reports", "job", currentJobId],
     queryFn: () => getReportStatus(currentJobId),
     enabled: !!currentJobId,
-    refetchInterval: 2500,
-    staleTime: 0,
+    staleTime: Infinity,
   });
 
+  useEffect(() => {
+    const controller = new AbortController();
+    let cursor = null;
+    let delay = 1000;
+
+    (async () => {
+      while (!controller.signal.aborted) {
+        try {
+          const { cursor: next, jobs } = await waitForReportEvents(cursor, { signal: controller.signal });
+          if (cursor && jobs.length) {
+            jobs.forEach((job) => qc.setQueryData(["reports", "job", job.id], job));
+            if (!patchJobList(qc, jobs)) qc.invalidateQueries({ queryKey: ["reports", "list"] });
+          }
+          cursor = next;
+          delay = 1000;
+        } catch (e) {
+          if (controller.signal.aborted) return;
+          // Back off while the server is unreachable
+          await new Promise((r) => setTimeout(r, delay));
+          delay = Math.min(delay * 2, 30000);
+        }
+      }
+    })();
+
+    return () => controller.abort();
+  }, [qc]);
+
   const createMutation = useMutation({
     mutationFn: async () => {
       const cfg = REPORTS[reportType] || {};
@@ -83,14 +159,26 @@ export default function ReportsPage() {
         payload.start = fmtDate(params.start);
         payload.end = fmtDate(params.end);
       }
+      if (cfg.params?.includes("asOf")) {
+        payload.as_of = fmtDate(params.as_of);
+      }
+      if (cfg.params?.includes("compare") && params.compare) {
+        payload.compare = params.compare;
+      }
       if (cfg.params?.includes("threshold")) {
         payload.threshold = Number(params.threshold) || null;
       }
       if (cfg.params?.includes("daysAhead")) {
         payload.days_ahead = Number(params.days_ahead) || 30;
       }
+      if (cfg.params?.includes("invoiceStatus") && params.status) {
+        payload.status = params.status;
+      }
+      if (cfg.params?.includes("classroom") && params.classroom) {
+        payload.classroom = Number(params.classroom);
+      }
 
-      const job = await requestReport(reportType, payload);
+      const job = await requestReport(cfg.types?.[format] || reportType, payload);
       return job;
     },
     onSuccess: (job) => {
@@ -104,13 +192,26 @@ export default function ReportsPage() {
     },
   });
 
+  const cancelMutation = useMutation({
+    mutationFn: cancelReport,
+    onSuccess: (job) => {
+      toast.success("Cancellation requested");
+      qc.setQueryData(["reports", "job", job.id], job);
+      patchJobList(qc, [job]);
+    },
+    onError: (e) => {
+      console.error(e);
+      toast.error(e?.response?.data?.error || "Failed to cancel report");
+    },
+  });
+
   const currentJob = jobStatusQuery.data;
   const cfg = REPORTS[reportType] || {};
 
   async function downloadById(jobId, fallbackName = "report") {
     try {
-      const { blob, filename } = await downloadReport(jobId);
-      const name = filename || `${fallbackName}.${(filename||"").endsWith(".xlsx") ? "xlsx" : (format === "XLSX" ? "xlsx" : "pdf")}`;
+      const { data: blob, filename } = await downloadReport(jobId);
+      const name = filename || `${fallbackName}.${format.toLowerCase()}`;
       const url = URL.createObjectURL(blob);
       const a = document.createElement("a");
       a.href = url; a.download = name; document.body.appendChild(a);
@@ -180,10 +281,39 @@ export default function ReportsPage() {
         </>
       )}
 
+      {/* As-of date */}
+      {cfg.params?.includes("asOf") && (
+        <div>
+          <label className="block mb-1 font-medium">As Of</label>
+          <DatePicker
+            selected={params.as_of}
+            onChange={(date) => setParams((p) => ({ ...p, as_of: date }))}
+            className="w-full border rounded px-3 py-2"
+            dateFormat="yyyy-MM-dd"
+          />
+        </div>
+      )}
+
+      {/* Comparison period */}
+      {cfg.params?.includes("compare") && (
+        <div>
+          <label className="block mb-1 font-medium">Compare With</label>
+          <select
+            className="w-full border rounded px-3 py-2"
+            value={params.compare}
+            onChange={(e) => setParams((p) => ({ ...p, compare: e.target.value }))}
+          >
+            <option value="">No comparison</option>
+            <option value="previous_period">Previous period</option>
+            <option value="previous_year">Previous year</option>
+          </select>
+        </div>
+      )}
+
       {/* Threshold */}
       {cfg.params?.includes("threshold") && (
         <div>
-          <label className="block mb-1 font-medium">Threshold</label>
+          <label className="block mb-1 font-medium">Threshold (blank = reorder level)</label>
           <input
             type="number"
             className="w-full border rounded px-3 py-2"
@@ -205,8 +335,44 @@ export default function ReportsPage() {
           />
         </div>
       )}
+
+      {/* Invoice status */}
+      {cfg.params?.includes("invoiceStatus") && (
+        <div>
+          <label className="block mb-1 font-medium">Status</label>
+          <select
+            className="w-full border rounded px-3 py-2"
+            value={params.status}
+            onChange={(e) => setParams((p) => ({ ...p, status: e.target.value }))}
+          >
+            <option value="">Any status</option>
+            <option value="DRAFT">Draft</option>
+            <option value="SENT">Sent</option>
+            <option value="PARTIAL">Partially Paid</option>
+            <option value="PAID">Paid</option>
+            <option value="OVERDUE">Overdue</option>
+          </select>
+        </div>
+      )}
+
+      {/* Classroom */}
+      {cfg.params?.includes("classroom") && (
+        <div>
+          <label className="block mb-1 font-medium">Classroom</label>
+          <select
+            className="w-full border rounded px-3 py-2"
+            value={params.classroom}
+            onChange={(e) => setParams((p) => ({ ...p, classroom: e.target.value }))}
+          >
+            <option value="">All classrooms</option>
+            {(classroomsQuery.data || []).map((c) => (
+              <option key={c.id} value={c.id}>{c.name}</option>
+            ))}
+          </select>
+        </div>
+      )}
     </div>
-  ), [reportType, params, format]);
+  ), [reportType, params, format, classroomsQuery.data]);
 
   return (
     <div className="p-4 max-w-6xl mx-auto">
@@ -238,9 +404,20 @@ export default function ReportsPage() {
           {currentJob?.status && (
             <span className="px-3 py-2 rounded border bg-gray-50">
               Status: <b>{currentJob.status_display || currentJob.status}</b>
+              {fmtProgress(currentJob) && <span className="text-gray-500 text-sm"> — {fmtProgress(currentJob)}</span>}
             </span>
           )}
 
+          {IN_FLIGHT.includes(currentJob?.status) && !currentJob.cancel_requested_at && (
+            <button
+              onClick={() => cancelMutation.mutate(currentJob.id)}
+              disabled={cancelMutation.isPending}
+              className="px-4 py-2 rounded border border-red-300 text-red-600 flex items-center gap-2 disabled:opacity-60"
+            >
+              <FiXCircle /> Cancel
+            </button>
+          )}
+
           <button
             onClick={() => qc.invalidateQueries({ queryKey: ["reports", "list"] })}
             className="px-3 py-2 rounded border flex items-center gap-2"
@@ -254,7 +431,7 @@ export default function ReportsPage() {
         <div className="border rounded">
           <div className="px-3 py-2 border-b bg-gray-50 font-medium">Recent Jobs</div>
           <div className="divide-y">
-            {(jobsQuery.data || []).map((j) => (
+            {jobs.map((j) => (
               <div key={j.id} className="px-3 py-2 flex items-center justify-between">
                 <div className="space-x-2">
                   <span className="font-mono text-sm">#{j.id}</span>
@@ -266,6 +443,7 @@ export default function ReportsPage() {
                 </div>
                 <div className="flex items-center gap-2">
                   <span className="text-sm">{j.status_display || j.status}</span>
+                  {fmtProgress(j) && <span className="text-gray-500 text-sm">{fmtProgress(j)}</span>}
                   {j.status === "COMPLETED" ? (
                     <button
                       onClick={() => downloadById(j.id, (j.file || "").split("/").pop() || "report")}
@@ -284,6 +462,15 @@ export default function ReportsPage() {
                 </div>
               </div>
             ))}
+            {jobsQuery.hasNextPage && (
+              <button
+                onClick={() => jobsQuery.fetchNextPage()}
+                disabled={jobsQuery.isFetchingNextPage}
+                className="w-full px-3 py-2 text-sm text-blue-600 disabled:opacity-60"
+              >
+                {jobsQuery.isFetchingNextPage ? "Loading…" : "Load more"}
+              </button>
+            )}
             {jobsQuery.isFetching && <div className="px-3 py-2 text-sm text-gray-500">Refreshing…</div>}
           </div>
         </div>
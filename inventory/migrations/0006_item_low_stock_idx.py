@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_remove_automatedreorderrule_item_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(condition=models.Q(('quantity__lte', models.F('reorder_level'))), fields=['name'], name='item_low_stock_idx'),
+        ),
+    ]
@@ -1,4 +1,7 @@
+from django.apps import apps
 from django.db import models
+from django.db.models import ExpressionWrapper, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
 from core.models import TimestampMixin
 from hr.models import Staff
 from student.models import Student
@@ -13,6 +16,40 @@ class Vendor(TimestampMixin):
         return self.name
 
 
+# Matches the partial index on Item; keep the two in sync.
+LOW_STOCK = Q(quantity__lte=F("reorder_level"))
+
+
+class ItemQuerySet(models.QuerySet):
+    def low_stock(self, threshold=None):
+        """
+        Items at or below their reorder level (served by the partial index),
+        or at or below a fixed `threshold` when one is given.
+        """
+        return self.filter(LOW_STOCK if threshold is None else Q(quantity__lte=threshold))
+
+    def with_reorder_info(self, target_factor=2):
+        """
+        Adds vendor_name, restocked_on and suggested_qty in SQL. Vendor and
+        restock date fall back to the latest received purchase order; the
+        suggestion tops stock up to `target_factor` x the reorder level, or
+        to min_required when that is higher.
+        """
+        PurchaseOrder = apps.get_model("finance", "PurchaseOrder")
+        latest_po = PurchaseOrder.objects.filter(item=OuterRef("pk"), received=True).order_by("-order_date", "-pk")
+        return self.annotate(
+            vendor_name=Coalesce("vendor__name", Subquery(latest_po.values("vendor__name")[:1])),
+            restocked_on=Coalesce("last_restock", Subquery(latest_po.values("order_date")[:1])),
+            suggested_qty=Greatest(
+                ExpressionWrapper(
+                    Greatest(F("reorder_level") * target_factor, F("min_required")) - F("quantity"),
+                    output_field=models.IntegerField(),
+                ),
+                Value(0),
+            ),
+        )
+
+
 class Item(TimestampMixin):
     CATEGORY = [
         ("UNIFORM", "Uniform"),
@@ -32,6 +69,13 @@ class Item(TimestampMixin):
     reorder_level  = models.PositiveIntegerField(default=0)
     last_restock   = models.DateField(null=True, blank=True)
 
+    objects = ItemQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["name"], condition=LOW_STOCK, name="item_low_stock_idx"),
+        ]
+
     def __str__(self):
         return f"{self.name} ({self.sku})"
 
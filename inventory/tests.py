@@ -1,3 +1,43 @@
+from datetime import date
+from decimal import Decimal
+
 from django.test import TestCase
 
-# Create your tests here.
+from finance.models import PurchaseOrder
+
+from .models import Item, Vendor
+
+
+class LowStockTests(TestCase):
+    def setUp(self):
+        self.vendor = Vendor.objects.create(name="Books Co")
+
+    def item(self, sku, quantity, reorder_level, **kwargs):
+        return Item.objects.create(name=sku, sku=sku, category="BOOK", unit_price=Decimal("1.00"),
+                                   quantity=quantity, reorder_level=reorder_level, **kwargs)
+
+    def test_low_stock_uses_the_reorder_level_or_a_fixed_threshold(self):
+        self.item("A", 2, 5)
+        self.item("B", 5, 5)
+        self.item("C", 6, 5)
+        self.item("D", 1, 0)
+        self.assertEqual(sorted(Item.objects.low_stock().values_list("sku", flat=True)), ["A", "B"])
+        self.assertEqual(sorted(Item.objects.low_stock(1).values_list("sku", flat=True)), ["D"])
+
+    def test_reorder_info_falls_back_to_the_latest_received_order(self):
+        direct = self.item("A", 2, 5, vendor=self.vendor, last_restock=date(2025, 1, 1), min_required=20)
+        other = Vendor.objects.create(name="Paper Ltd")
+        ordered = self.item("B", 3, 5)
+        for vendor, day, received in ((self.vendor, date(2025, 2, 1), True), (other, date(2025, 3, 1), True),
+                                      (self.vendor, date(2025, 4, 1), False)):
+            PurchaseOrder.objects.create(vendor=vendor, item=ordered, quantity=1, unit_price=Decimal("1.00"),
+                                         order_date=day, received=received)
+
+        with self.assertNumQueries(1):
+            info = {i.sku: i for i in Item.objects.low_stock().with_reorder_info()}
+
+        self.assertEqual((info["A"].vendor_name, info["A"].restocked_on, info["A"].suggested_qty),
+                         ("Books Co", date(2025, 1, 1), 18))
+        self.assertEqual((info["B"].vendor_name, info["B"].restocked_on, info["B"].suggested_qty),
+                         ("Paper Ltd", date(2025, 3, 1), 7))
+        self.assertEqual(direct.pk, info["A"].pk)
@@ -22,5 +22,29 @@ app.conf.beat_schedule = {
         'task': 'finance.tasks.generate_monthly_invoices_for_active_students',
         'schedule': crontab(day_of_month='1', hour=6, minute=0),
     },
+    'snapshot-treasury-balances': {
+        'task': 'finance.tasks.snapshot_treasury_balances',
+        'schedule': crontab(hour=0, minute=10),
+    },
+    'verify-invoice-balances': {
+        'task': 'finance.tasks.verify_invoice_balances',
+        'schedule': crontab(hour=2, minute=30),
+    },
+    'compact-treasury-ledger': {
+        'task': 'finance.tasks.compact_treasury_ledger',
+        'schedule': crontab(minute='*/5'),
+    },
+    'evict-document-cache': {
+        'task': 'finance.tasks.evict_document_cache',
+        'schedule': crontab(minute=45),
+    },
+    'evict-report-cache': {
+        'task': 'reporting.tasks.evict_report_cache',
+        'schedule': crontab(minute=15),
+    },
+    'reap-report-jobs': {
+        'task': 'reporting.tasks.reap_report_jobs',
+        'schedule': 30.0,  # seconds
+    },
 }
 # REMOVE this line: app.conf.timezone = 'Asia/Dubai'
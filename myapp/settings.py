@@ -210,6 +210,13 @@ EMAIL_HOST_PASSWORD = "LU-mino852"
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 SERVER_EMAIL = EMAIL_HOST_USER
 EMAIL_TIMEOUT = 30  # seconds
+# Bulk mail (notifications.utils.send_batched): messages per SMTP connection
+# and per task run, minimum seconds between batch starts (Office 365 accepts
+# 30 messages a minute per mailbox) and reconnect attempts per batch. Batch
+# start slots are handed out through the cache (reserve_send_slot).
+EMAIL_BATCH_SIZE = int(os.getenv('EMAIL_BATCH_SIZE', '30'))
+EMAIL_BATCH_INTERVAL = float(os.getenv('EMAIL_BATCH_INTERVAL', '60'))
+EMAIL_MAX_RECONNECTS = int(os.getenv('EMAIL_MAX_RECONNECTS', '3'))
 
 # -------------------------
 # WeasyPrint Configuration
@@ -217,6 +224,74 @@ EMAIL_TIMEOUT = 30  # seconds
 WEASYPRINT_BASEURL = 'file://' + str(BASE_DIR)
 WEASYPRINT_DPI = 96
 WEASYPRINT_PRESENTATIONAL_HINTS = True
+# Warm rendering pool (core.pdf), started per process: every Celery worker
+# child gets its own PDF_POOL_WORKERS renderers. 0 renders in-process.
+PDF_POOL_WORKERS = int(os.getenv('PDF_POOL_WORKERS', '2'))
+PDF_POOL_MAX_TASKS = int(os.getenv('PDF_POOL_MAX_TASKS', '200'))  # renders before a worker is replaced
+PDF_WORKER_MAX_RSS_MB = int(os.getenv('PDF_WORKER_MAX_RSS_MB', '512'))
+PDF_PRELOAD_STYLESHEETS = [
+    'reports/report.css',
+    'finance/invoice.css',
+    'finance/payment_receipt.css',
+    'finance/po.css',
+]
+
+# -------------------------
+# Reporting
+# -------------------------
+# Result cache: reuse identical reports built from unchanged data
+REPORT_CACHE_MAX_AGE = int(os.getenv('REPORT_CACHE_MAX_AGE', str(7 * 24 * 3600)))  # seconds
+REPORT_CACHE_MAX_BYTES = int(os.getenv('REPORT_CACHE_MAX_BYTES', str(1024 ** 3)))  # 1 GiB
+# Partitioned builds fan out as a Celery chord, which needs a result backend
+# that supports chords (Redis, database); the rpc:// default builds inline.
+# Each partition renders its part to media storage for the callback to merge.
+REPORT_PARALLEL_BUILDS = os.getenv(
+    'REPORT_PARALLEL_BUILDS', str(not CELERY_RESULT_BACKEND.startswith('rpc'))
+) == 'True'
+REPORT_MIN_PARTITIONS = int(os.getenv('REPORT_MIN_PARTITIONS', '2'))
+# Long PDF tables are laid out in chunks of this many rows, then merged
+REPORT_PDF_CHUNK_ROWS = int(os.getenv('REPORT_PDF_CHUNK_ROWS', '1000'))
+# Progress: builds flush row counts and beat at most this often; the reaper
+# fails jobs without a heartbeat and force-stops ignored cancel requests.
+REPORT_PROGRESS_INTERVAL = float(os.getenv('REPORT_PROGRESS_INTERVAL', '1'))  # seconds
+# Row counts alone wake job lists (events channel) at most this often
+REPORT_PROGRESS_PUSH_INTERVAL = float(os.getenv('REPORT_PROGRESS_PUSH_INTERVAL', '5'))  # seconds
+REPORT_HEARTBEAT_INTERVAL = float(os.getenv('REPORT_HEARTBEAT_INTERVAL', '5'))  # seconds
+REPORT_HEARTBEAT_TIMEOUT = int(os.getenv('REPORT_HEARTBEAT_TIMEOUT', '60'))  # seconds
+REPORT_CANCEL_GRACE = int(os.getenv('REPORT_CANCEL_GRACE', '15'))  # seconds
+# Queued jobs no worker claimed by then are failed, freeing their cache key
+REPORT_QUEUE_TIMEOUT = int(os.getenv('REPORT_QUEUE_TIMEOUT', '3600'))  # seconds
+# Job events: long-polls wake over Redis pub/sub when REDIS_URL is set (and
+# redis-py is installed), otherwise they re-check the database periodically.
+REDIS_URL = os.getenv('REDIS_URL', '')
+# The cache shares state between processes (e.g. bulk mail send slots) only
+# over Redis; without it each process keeps its own.
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': REDIS_URL}
+    if REDIS_URL else {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+}
+REPORT_EVENTS_TIMEOUT = float(os.getenv('REPORT_EVENTS_TIMEOUT', '25'))  # seconds
+REPORT_EVENTS_POLL_INTERVAL = float(os.getenv('REPORT_EVENTS_POLL_INTERVAL', '2'))  # seconds
+# Payroll vs attendance: weekday numbers (Monday=0) that are not working days
+PAYROLL_WEEKEND_DAYS = [int(d) for d in os.getenv('PAYROLL_WEEKEND_DAYS', '5,6').split(',') if d.strip()]
+
+# -------------------------
+# Finance
+# -------------------------
+# Monthly billing inserts invoices in batches of this many rows and emails
+# them in Celery tasks of INVOICE_EMAIL_BATCH_SIZE invoices each.
+INVOICE_BULK_BATCH_SIZE = int(os.getenv('INVOICE_BULK_BATCH_SIZE', '500'))
+INVOICE_EMAIL_BATCH_SIZE = int(os.getenv('INVOICE_EMAIL_BATCH_SIZE', '50'))
+# Document numbers: prefix + zero-padded value from a PostgreSQL sequence
+INVOICE_NUMBER_PREFIX = os.getenv('INVOICE_NUMBER_PREFIX', 'INV-')
+INVOICE_NUMBER_PADDING = int(os.getenv('INVOICE_NUMBER_PADDING', '4'))
+PO_NUMBER_PREFIX = os.getenv('PO_NUMBER_PREFIX', 'PO-')
+PO_NUMBER_PADDING = int(os.getenv('PO_NUMBER_PADDING', '4'))
+# Ledger entries folded into Treasury.balance per treasury per compaction run
+TREASURY_COMPACT_BATCH_SIZE = int(os.getenv('TREASURY_COMPACT_BATCH_SIZE', '10000'))
+# Rendered invoice/receipt/PO PDFs kept in media storage (finance.documents)
+DOCUMENT_CACHE_MAX_AGE = int(os.getenv('DOCUMENT_CACHE_MAX_AGE', str(30 * 24 * 3600)))  # seconds since last use (30 days)
+DOCUMENT_CACHE_MAX_BYTES = int(os.getenv('DOCUMENT_CACHE_MAX_BYTES', str(512 * 1024 ** 2)))  # 512 MiB
 
 # -------------------------
 # Security Settings (Production)
@@ -1,6 +1,5 @@
 from celery import shared_task
 from datetime import date, timedelta
-from django.db.models import F
 from django.utils import timezone
 
 from inventory.models import Item
@@ -11,8 +10,9 @@ from notifications.utils import send_html_mail
 
 @shared_task
 def low_stock_alert():
-    items = Item.objects.filter(quantity__lte=F("reorder_level")).order_by("name")
-    if not items.exists():
+    # Same single query as the LOW_STOCK reports, evaluated once
+    items = list(Item.objects.low_stock().with_reorder_info().order_by("name", "pk"))
+    if not items:
         return "No low-stock items"
 
     send_html_mail(
@@ -20,7 +20,7 @@ def low_stock_alert():
         "emails/low_stock.html",
         {"items": items, "today": date.today()},
     )
-    return f"Sent for {items.count()} item(s)"
+    return f"Sent for {len(items)} item(s)"
 
 
 @shared_task
@@ -1,3 +1,54 @@
-from django.test import TestCase
+import smtplib
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail import EmailMessage
+from django.test import SimpleTestCase, override_settings
+
+from . import utils
+
+
+def message(n):
+    return EmailMessage(f"Subject {n}", "Body", "from@example.com", [f"to{n}@example.com"])
+
+
+@override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend", EMAIL_BATCH_INTERVAL=60)
+class SendBatchedTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    @mock.patch("notifications.utils.time.time", return_value=1000.0)
+    def test_send_slots_are_an_interval_apart_and_never_handed_out_twice(self, _now):
+        self.assertEqual([utils.reserve_send_slot() for _ in range(3)], [20.0, 80.0, 140.0])
+        # A stale hint is only a starting point
+        cache.delete(utils.SEND_SLOT_KEY.format("next"))
+        self.assertEqual(utils.reserve_send_slot(), 200.0)
+        self.assertEqual(utils.reserve_send_slot(interval=0), 0.0)
+
+    @mock.patch("notifications.utils.time.sleep")
+    def test_batches_go_out_without_waiting(self, sleep):
+        self.assertEqual(utils.send_batched([message(n) for n in range(5)], batch_size=2), [])
+        self.assertEqual([m.subject for m in mail.outbox], [f"Subject {n}" for n in range(5)])
+        sleep.assert_not_called()
+
+    @mock.patch("notifications.utils.time.sleep")
+    def test_refused_messages_are_pinned_and_lost_sessions_reopened(self, sleep):
+        connection = mock.Mock()
+        connection.send_messages.side_effect = [
+            1, smtplib.SMTPRecipientsRefused({}), smtplib.SMTPServerDisconnected(), 1, 1,
+        ]
+        with mock.patch.object(utils, "get_connection", return_value=connection):
+            failed = utils.send_batched([message(n) for n in range(4)], batch_size=4)
+
+        self.assertEqual(failed, [1])
+        self.assertEqual(connection.send_messages.call_args_list[3].args[0][0].subject, "Subject 2")
+        sleep.assert_called_once_with(2)
+
+    @mock.patch("notifications.utils.time.sleep")
+    def test_gives_up_on_the_rest_after_max_reconnects(self, sleep):
+        connection = mock.Mock(**{"open.side_effect": ConnectionRefusedError("down")})
+        with mock.patch.object(utils, "get_connection", return_value=connection):
+            failed = utils.send_batched([message(n) for n in range(3)], max_reconnects=2)
+        self.assertEqual(failed, [0, 1, 2])
+        self.assertEqual(sleep.call_count, 2)
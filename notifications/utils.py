@@ -1,7 +1,118 @@
+import logging
+import math
+import smtplib
+import time
+
 from django.conf import settings
-from django.core.mail import EmailMessage
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
 from django.template.loader import render_to_string
 
+logger = logging.getLogger(__name__)
+
+# Errors meaning the SMTP session is gone, rather than the message being refused
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+SEND_SLOT_KEY = "notifications:send-slot:{}"
+
+
+def _session_lost(error) -> bool:
+    # 421: the server is closing the channel (Office 365 also uses it when throttling)
+    return isinstance(error, CONNECTION_ERRORS) or getattr(error, "smtp_code", None) == 421
+
+
+def _close(connection):
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+
+def reserve_send_slot(interval=None) -> float:
+    """
+    Reserves the next free start for a mail batch and returns the seconds
+    until it: the countdown to queue the task that sends the batch with.
+
+    Slots are EMAIL_BATCH_INTERVAL seconds apart and handed out at most once
+    each through the cache, so every task that reserves one shares the
+    provider's rate limit. That holds across workers when CACHES is shared
+    (Redis when REDIS_URL is set); the local-memory default limits each
+    process on its own.
+    """
+    interval = getattr(settings, "EMAIL_BATCH_INTERVAL", 60.0) if interval is None else interval
+    if interval <= 0:
+        return 0.0
+    now = time.time()
+    # The hint only skips slots known to be taken; the add/incr pair decides.
+    slot = max(math.ceil(now / interval), cache.get(SEND_SLOT_KEY.format("next"), 0))
+    while True:
+        key = SEND_SLOT_KEY.format(slot)
+        ttl = math.ceil((slot + 1) * interval - now)
+        cache.add(key, 0, ttl)
+        try:
+            taken = cache.incr(key)
+        except ValueError:  # expired in between
+            continue
+        if taken == 1:
+            cache.set(SEND_SLOT_KEY.format("next"), slot + 1, ttl)
+            return max(0.0, slot * interval - now)
+        slot += 1
+
+
+def send_batched(messages, batch_size=None, max_reconnects=None) -> list[int]:
+    """
+    Sends EmailMessages in batches of `batch_size` (EMAIL_BATCH_SIZE), each
+    over one SMTP connection. Nothing here waits between batches: bulk mail
+    stays under the provider's rate limit by sending one batch per task,
+    queued with a countdown from reserve_send_slot().
+
+    Messages go through send_messages one at a time on the open connection,
+    so a refused message is pinned to itself and nothing delivered is sent
+    twice. A dropped session is reopened and the message retried, up to
+    `max_reconnects` (EMAIL_MAX_RECONNECTS) times per batch; after that the
+    rest of the run is given up.
+
+    Returns the positions of the messages that were not sent.
+    """
+    messages = list(messages)
+    batch_size = batch_size or getattr(settings, "EMAIL_BATCH_SIZE", 30)
+    max_reconnects = getattr(settings, "EMAIL_MAX_RECONNECTS", 3) if max_reconnects is None else max_reconnects
+
+    failed = []
+    connection = get_connection(fail_silently=False)
+    for start in range(0, len(messages), batch_size):
+        i, end, reconnects = start, min(start + batch_size, len(messages)), 0
+        while i < end:
+            opened = False
+            try:
+                connection.open()
+                opened = True
+                sent = connection.send_messages([messages[i]])
+            except Exception as e:
+                if opened and not _session_lost(e):
+                    logger.error(f"Could not send email to {messages[i].to}: {e}")
+                    failed.append(i)
+                    i += 1
+                    continue
+                _close(connection)
+                if reconnects == max_reconnects:
+                    logger.error(f"Giving up on {len(messages) - i} email(s) after {reconnects} reconnects: {e}")
+                    failed.extend(range(i, len(messages)))
+                    return failed
+                reconnects += 1
+                logger.warning(f"SMTP connection lost ({e}); reconnecting ({reconnects}/{max_reconnects})")
+                time.sleep(min(2 ** reconnects, 30))
+                continue
+            if not sent:  # no recipients
+                failed.append(i)
+            i += 1
+        _close(connection)
+
+    if failed:
+        logger.warning(f"{len(failed)} of {len(messages)} email(s) were not sent")
+    return failed
+
+
 def send_html_mail(subject, template_name, context, to=None):
     if to is None:
         to = settings.ALERT_RECIPIENTS
@@ -9,5 +120,5 @@ def send_html_mail(subject, template_name, context, to=None):
     html_body = render_to_string(template_name, context)
     msg = EmailMessage(subject, html_body, settings.DEFAULT_FROM_EMAIL, to)
     msg.content_subtype = "html"
-    msg.send()
-
+    if send_batched([msg]):
+        raise smtplib.SMTPException(f"Could not send '{subject}' to {to}")
@@ -3,6 +3,6 @@ from .models import ReportJob
 
 @admin.register(ReportJob)
 class ReportJobAdmin(admin.ModelAdmin):
-    list_display = ("report_type", "generated_at", "file")
-    readonly_fields = ("generated_at",)
+    list_display = ("report_type", "status", "phase", "rows_processed", "heartbeat_at", "generated_at", "file")
+    readonly_fields = ("generated_at", "heartbeat_at", "cancel_requested_at")
 
@@ -22,8 +22,16 @@ class ReportJobSerializer(serializers.ModelSerializer):
             'status_display',
             'error',
             'download_url',
+            'phase',
+            'rows_processed',
+            'rows_total',
+            'heartbeat_at',
+            'cancel_requested_at',
+        ]
+        read_only_fields = [
+            'file', 'generated_at', 'status', 'error',
+            'phase', 'rows_processed', 'rows_total', 'heartbeat_at', 'cancel_requested_at',
         ]
-        read_only_fields = ['file', 'generated_at', 'status', 'error']
 
     def validate_parameters(self, value):
         if not isinstance(value, dict):
@@ -35,3 +43,29 @@ class ReportJobSerializer(serializers.ModelSerializer):
             return reverse('report_download', kwargs={'job_id': obj.id})
         return None
 
+
+
+class ReportJobListSerializer(ReportJobSerializer):
+    """Slim list projection: no parameters JSON; pair with ReportJob.objects.only(*LIST_FIELDS)."""
+    LIST_FIELDS = (
+        'id', 'report_type', 'file', 'created_at', 'generated_at', 'status', 'error',
+        'phase', 'rows_processed', 'rows_total', 'cancel_requested_at',
+    )
+
+    class Meta(ReportJobSerializer.Meta):
+        fields = [
+            'id',
+            'report_type',
+            'report_type_display',
+            'file',
+            'created_at',
+            'generated_at',
+            'status',
+            'status_display',
+            'error',
+            'download_url',
+            'phase',
+            'rows_processed',
+            'rows_total',
+            'cancel_requested_at',
+        ]
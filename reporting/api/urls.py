@@ -1,15 +1,19 @@
 # File to edit: reporting/urls.py
 
 from django.urls import path
-from .views import ReportRequestView, ReportDetailView, ReportDownloadView, ReportListView
+from .views import ReportRequestView, ReportDetailView, ReportDownloadView, ReportListView, ReportCancelView, ReportEventsView
 
 urlpatterns = [
     # GET /api/v1/reporting/ -> List all reports
     path("", ReportListView.as_view(), name="report_list"),
+    # GET /api/v1/reporting/events/?since=<cursor> -> Long-poll for job changes
+    path("events/", ReportEventsView.as_view(), name="report_events"),
     # POST /api/v1/reporting/create/ -> Start a new report
     path("create/", ReportRequestView.as_view(), name="report_create"),
     # GET /api/v1/reporting/123/ -> Check status of a report
     path("<int:job_id>/", ReportDetailView.as_view(), name="report_detail"),
+    # POST /api/v1/reporting/123/cancel/ -> Stop a queued or running report
+    path("<int:job_id>/cancel/", ReportCancelView.as_view(), name="report_cancel"),
     # GET /api/v1/reporting/123/download/ -> Download the file
     path("<int:job_id>/download/", ReportDownloadView.as_view(), name="report_download"),
 ]
@@ -3,28 +3,108 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions
 from rest_framework.permissions import IsAuthenticated
+from django.conf import settings
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from django.http import FileResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.decorators import method_decorator
+from django.db.models import Count, Max, Q
+from django.utils.http import parse_etags, quote_etag
+import base64
+import hashlib
+import json
+import mimetypes
 import os
 
 # --- Our new permission class ---
 from core.api.permissions import ModulePermission
 
+from .. import events
+from ..cache import find_or_create_job
 from ..models import ReportJob
-from ..tasks import build_report
-from .serializers import ReportJobSerializer
+from ..tasks import queue_build
+from .serializers import ReportJobListSerializer, ReportJobSerializer
 
 
 # Note: We are adding ModulePermission and module_name to each class
 
+def _encode_cursor(job):
+    raw = json.dumps([job.created_at.isoformat(), job.pk])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor):
+    created, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    created = parse_datetime(created)
+    if created is None:
+        raise ValueError("bad cursor")
+    return created, int(pk)
+
+
 class ReportListView(APIView):
+    """
+    Newest-first job list with keyset pagination on (created_at, id).
+    Filters: ?status=A,B  ?report_type=X,Y  ?requested_by=<id>|me  ?page_size=N  ?cursor=...
+    Responses carry an ETag from the filtered set's row count and newest
+    changed_at, so an unchanged poll gets 304 before any rows are fetched.
+    """
     permission_classes = [permissions.IsAuthenticated, ModulePermission]
     module_name = 'reporting'
+    page_size = 25
+    max_page_size = 100
 
     def get(self, request):
-        jobs = ReportJob.objects.all().order_by('-created_at')
-        serializer = ReportJobSerializer(jobs, many=True)
-        return Response(serializer.data)
+        params = request.query_params
+        jobs = ReportJob.objects.all()
+        if params.get('status'):
+            jobs = jobs.filter(status__in=params['status'].split(','))
+        if params.get('report_type'):
+            jobs = jobs.filter(report_type__in=params['report_type'].split(','))
+        requested_by = params.get('requested_by')
+        if requested_by == 'me':
+            jobs = jobs.filter(requested_by=request.user)
+        elif requested_by:
+            if not requested_by.isdigit():
+                return Response({"error": "requested_by must be a user id or 'me'."}, status=status.HTTP_400_BAD_REQUEST)
+            jobs = jobs.filter(requested_by_id=int(requested_by))
+
+        # Everything the payload depends on: filters, cursor, page size and user ('me').
+        state = jobs.aggregate(n=Count('pk'), last=Max('changed_at'))
+        etag = quote_etag(hashlib.sha1(
+            f"{request.user.pk}|{request.get_full_path()}|{state['n']}|{state['last']}".encode()
+        ).hexdigest())
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            response['ETag'] = etag
+            return response
+
+        try:
+            page_size = min(int(params.get('page_size', self.page_size)), self.max_page_size)
+        except ValueError:
+            page_size = self.page_size
+        page_size = max(page_size, 1)
+
+        if params.get('cursor'):
+            try:
+                created, pk = _decode_cursor(params['cursor'])
+            except (ValueError, TypeError):
+                return Response({"error": "Invalid cursor."}, status=status.HTTP_400_BAD_REQUEST)
+            jobs = jobs.filter(Q(created_at__lt=created) | Q(created_at=created, pk__lt=pk))
+
+        page = list(
+            jobs.only(*ReportJobListSerializer.LIST_FIELDS).order_by('-created_at', '-pk')[:page_size + 1]
+        )
+        next_cursor = _encode_cursor(page[page_size - 1]) if len(page) > page_size else None
+        response = Response({
+            "results": ReportJobListSerializer(page[:page_size], many=True).data,
+            "next": next_cursor,
+        })
+        response['ETag'] = etag
+        # Let the browser cache the body and revalidate it on every poll.
+        response['Cache-Control'] = 'private, no-cache'
+        return response
 
 
 class ReportRequestView(APIView):
@@ -34,10 +114,17 @@ class ReportRequestView(APIView):
     def post(self, request):
         serializer = ReportJobSerializer(data=request.data)
         if serializer.is_valid():
-            # Pass the user to the serializer's save method
-            job = serializer.save(created_by=request.user)
-            build_report.delay(job.id)
-            return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+            # Identical requests reuse a cached result or the build already in flight
+            job, outcome = find_or_create_job(
+                serializer.validated_data["report_type"],
+                serializer.validated_data.get("parameters", {}),
+                requested_by=request.user,
+            )
+            if outcome == "created":
+                transaction.on_commit(lambda: queue_build(job.id))
+            data = dict(ReportJobSerializer(job).data, cache=outcome)
+            code = status.HTTP_200_OK if outcome == "hit" else status.HTTP_202_ACCEPTED
+            return Response(data, status=code)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
@@ -51,6 +138,64 @@ class ReportDetailView(APIView):
         return Response(serializer.data)
 
 
+class ReportCancelView(APIView):
+    permission_classes = [permissions.IsAuthenticated, ModulePermission]
+    module_name = 'reporting'
+
+    def post(self, request, job_id):
+        job = get_object_or_404(ReportJob, id=job_id)
+        live = ReportJob.objects.filter(pk=job.pk, cancel_requested_at__isnull=True)
+        now = timezone.now()
+        # Queued jobs are cancelled outright (the worker skips them); running
+        # ones stop at their next progress check. Dropping the cache key frees
+        # the single-flight slot for a fresh request.
+        cancelled = (
+            live.filter(status='PENDING').update(
+                status='CANCELLED', error='Cancelled by user.', cancel_requested_at=now, cache_key=None,
+                changed_at=now,
+            )
+            or live.filter(status='IN_PROGRESS').update(cancel_requested_at=now, cache_key=None, changed_at=now)
+        )
+        if cancelled:
+            transaction.on_commit(lambda: events.publish(job.pk))
+        job.refresh_from_db()
+        already = job.status == 'CANCELLED' or (job.status in ReportJob.IN_FLIGHT and job.cancel_requested_at)
+        if not (cancelled or already):
+            return Response({"error": "Report has already finished."}, status=status.HTTP_409_CONFLICT)
+        return Response(ReportJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+
+@method_decorator(transaction.non_atomic_requests, name='dispatch')
+class ReportEventsView(APIView):
+    """
+    Long-poll for job changes: GET ?since=<cursor> blocks until some job
+    changed after the cursor (or the timeout passes) and returns those jobs
+    with the next cursor. Without `since` it returns the current cursor at once.
+    Runs outside ATOMIC_REQUESTS so the wait doesn't pin a transaction.
+    """
+    permission_classes = [permissions.IsAuthenticated, ModulePermission]
+    module_name = 'reporting'
+
+    def get(self, request):
+        since = request.query_params.get('since')
+        if not since:
+            cursor = ReportJob.objects.aggregate(c=Max('changed_at'))['c'] or timezone.now()
+            return Response({"cursor": cursor.isoformat(), "jobs": []})
+
+        since = parse_datetime(since)
+        if since is None:
+            return Response({"error": "Invalid 'since' cursor."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            timeout = float(request.query_params.get('timeout', settings.REPORT_EVENTS_TIMEOUT))
+        except ValueError:
+            timeout = settings.REPORT_EVENTS_TIMEOUT
+        timeout = max(0.0, min(timeout, settings.REPORT_EVENTS_TIMEOUT))
+
+        jobs = events.wait_for_changes(since, timeout)
+        cursor = jobs[-1].changed_at if jobs else since
+        return Response({"cursor": cursor.isoformat(), "jobs": ReportJobSerializer(jobs, many=True).data})
+
+
 class ReportDownloadView(APIView):
     permission_classes = [permissions.IsAuthenticated, ModulePermission]
     module_name = 'reporting'
@@ -65,6 +210,7 @@ class ReportDownloadView(APIView):
         filename = os.path.basename(job.file.name)
         
         # Use FileResponse for better handling of file downloads
-        response = FileResponse(job.file.open('rb'), content_type='application/pdf')
+        content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = FileResponse(job.file.open('rb'), content_type=content_type)
         response['Content-Disposition'] = f'attachment; filename="{filename}"'
         return response
@@ -0,0 +1,156 @@
+# reporting/cache.py
+"""
+Content-addressed report result cache.
+
+A report is identified by its type, its normalized parameters, the day it
+was requested for and a data-version token of the tables it reads. Identical
+requests reuse a completed job's file, or attach to the build already in
+flight instead of queuing a duplicate.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .models import ReportJob
+from .utils import get_model
+
+logger = logging.getLogger(__name__)
+
+# Source tables per report type; their row count and newest updated_at form
+# the data version. Types not listed here are never cached.
+REPORT_SOURCES = {
+    "PNL":            [("finance", "Invoice"), ("finance", "Payment"), ("finance", "Expense"),
+                       ("finance", "SalaryPayment"), ("finance", "PurchaseOrder")],
+    "BS":             [("finance", "Treasury"), ("finance", "TreasuryTransaction"), ("finance", "Payment"),
+                       ("finance", "Expense"), ("finance", "SalaryPayment"), ("finance", "Invoice"),
+                       ("finance", "PurchaseOrder"), ("hr", "SalaryRecord")],
+    "CASH":           [("finance", "Payment"), ("finance", "Expense")],
+    "ENROLL_SUMMARY": [("student", "Student"), ("student", "Classroom")],
+    "AP_AGING":       [("finance", "PurchaseOrder"), ("finance", "Expense"), ("inventory", "Vendor")],
+    "AR_AGING":       [("finance", "Invoice"), ("finance", "Payment"), ("student", "Student")],
+    "STUDENT_DOCS":   [("student", "StudentDocument"), ("student", "Student")],
+    "STUDENT_FEES":   [("finance", "Invoice"), ("finance", "Payment"), ("student", "Student")],
+    "DOC_EXP":        [("student", "StudentDocument"), ("hr", "StaffDocument"),
+                       ("student", "Student"), ("hr", "Staff")],
+    "INV_VALUATION":  [("inventory", "Item")],
+    "LOW_STOCK":      [("inventory", "Item"), ("inventory", "Vendor")],
+    "LOW_STOCK_PDF":  [("inventory", "Item"), ("inventory", "Vendor")],
+    "PAYROLL_VS_ATT": [("hr", "StaffAttendance"), ("hr", "SalaryRecord"), ("hr", "Vacation"), ("hr", "Staff")],
+    "HR_ATT_SUMMARY": [("hr", "StaffAttendance"), ("hr", "Staff")],
+    "INVOICES_ZIP":   [("finance", "Invoice"), ("finance", "Payment"), ("student", "Student")],
+    "INVOICES_PDF":   [("finance", "Invoice"), ("finance", "Payment"), ("student", "Student")],
+}
+
+
+def normalize_parameters(parameters) -> dict:
+    """Drops empty values so {"start": None} and {} hash the same; keys are sorted on dump."""
+    if not isinstance(parameters, dict):
+        return {}
+    return {k: v for k, v in parameters.items() if v not in (None, "", [], {})}
+
+
+def data_version(report_type: str) -> str | None:
+    """
+    Cheap change token for the report's source tables (one aggregate each).
+    Catches inserts, deletes and saves; queryset .update() calls that skip
+    updated_at are only caught through the other tables a report reads.
+    """
+    sources = REPORT_SOURCES.get(report_type)
+    if not sources:
+        return None
+    parts = []
+    for app_label, model_name in sources:
+        model = get_model(app_label, model_name)
+        if not model:
+            continue
+        agg = model.objects.aggregate(n=Count("pk"), last=Max("updated_at"))
+        parts.append(f"{model._meta.label}:{agg['n']}:{agg['last'].isoformat() if agg['last'] else ''}")
+    return "|".join(parts)
+
+
+def cache_key(report_type: str, parameters) -> str | None:
+    version = data_version(report_type)
+    if version is None:
+        return None
+    payload = json.dumps(
+        [report_type, normalize_parameters(parameters), date.today().isoformat(), version],
+        sort_keys=True, default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _max_age() -> timedelta:
+    return timedelta(seconds=getattr(settings, "REPORT_CACHE_MAX_AGE", 7 * 24 * 3600))
+
+
+def find_or_create_job(report_type: str, parameters, requested_by=None):
+    """
+    Returns (job, outcome) where outcome is "hit" (completed result reused),
+    "in_flight" (attached to a queued/running build) or "created" (caller
+    must queue build_report for the new job).
+    """
+    key = cache_key(report_type, parameters)
+    if key:
+        cached = (
+            ReportJob.objects.filter(
+                cache_key=key, status__in=("COMPLETED",) + ReportJob.IN_FLIGHT,
+                created_at__gte=timezone.now() - _max_age(),
+            )
+            .order_by("-created_at")
+            .first()
+        )
+        if cached:
+            return cached, "hit" if cached.status == "COMPLETED" else "in_flight"
+
+    try:
+        # Savepoint: the partial unique constraint rejects a second in-flight
+        # build for the same key when two identical requests race.
+        with transaction.atomic():
+            job = ReportJob.objects.create(
+                report_type=report_type, parameters=parameters or {},
+                requested_by=requested_by, cache_key=key,
+            )
+        return job, "created"
+    except IntegrityError:
+        in_flight = ReportJob.objects.filter(cache_key=key, status__in=ReportJob.IN_FLIGHT).first()
+        if in_flight:
+            return in_flight, "in_flight"
+        # The other build finished between our insert and this lookup.
+        return find_or_create_job(report_type, parameters, requested_by)
+
+
+def evict(max_age: timedelta | None = None, max_bytes: int | None = None) -> int:
+    """
+    Drops cached results older than `max_age`, then the oldest remaining
+    ones until the cached files fit in `max_bytes`. Evicted jobs keep their
+    history row but lose the file and the cache key.
+    """
+    max_age = max_age or _max_age()
+    if max_bytes is None:
+        max_bytes = getattr(settings, "REPORT_CACHE_MAX_BYTES", 1024 ** 3)
+
+    cached = ReportJob.objects.filter(cache_key__isnull=False, status="COMPLETED")
+    expired = set(cached.filter(created_at__lt=timezone.now() - max_age).values_list("pk", flat=True))
+
+    used = 0
+    for pk, size in cached.exclude(pk__in=expired).order_by("-created_at").values_list("pk", "file_size"):
+        used += size or 0
+        if used > max_bytes:
+            expired.add(pk)
+
+    for job in ReportJob.objects.filter(pk__in=expired).only("pk", "file"):
+        if job.file:
+            try:
+                job.file.delete(save=False)
+            except Exception as e:
+                logger.warning("Could not delete cached report file %s: %s", job.file.name, e)
+    ReportJob.objects.filter(pk__in=expired).update(file=None, file_size=None, cache_key=None)
+    return len(expired)
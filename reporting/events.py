@@ -0,0 +1,123 @@
+# reporting/events.py
+"""
+Push channel for report job state changes.
+
+Writers bump ReportJob.changed_at and call publish(); the long-poll endpoint
+blocks in wait_for_changes() until a job changed after the client's cursor.
+Celery workers and web processes meet over Redis pub/sub when REDIS_URL is
+set and the redis package is installed. Otherwise a process-local condition
+wakes waiters in the same process, and waiters re-check the database every
+REPORT_EVENTS_POLL_INTERVAL seconds to pick up changes made elsewhere.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from django.conf import settings
+
+from .models import ReportJob
+
+try:
+    import redis
+except Exception:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "reporting:jobs"
+
+_client = None
+_local = threading.Condition()
+_local_version = 0
+
+
+def _redis():
+    global _client
+    url = getattr(settings, "REDIS_URL", "")
+    if not (redis and url):
+        return None
+    if _client is None:
+        _client = redis.Redis.from_url(url)
+    return _client
+
+
+def publish(*job_ids: int) -> None:
+    """Wakes waiting long-polls; best effort, the cursor query is the source of truth."""
+    global _local_version
+    with _local:
+        _local_version += 1
+        _local.notify_all()
+
+    client = _redis()
+    if client is None or not job_ids:
+        return
+    try:
+        client.publish(CHANNEL, ",".join(str(pk) for pk in job_ids))
+    except Exception as e:
+        logger.warning("Could not publish report job events: %s", e)
+
+
+class _LocalSubscription:
+    def __init__(self):
+        self.seen = _local_version
+
+    def wait(self, timeout: float) -> None:
+        with _local:
+            _local.wait_for(lambda: _local_version != self.seen, timeout)
+            self.seen = _local_version
+
+
+class _RedisSubscription:
+    def __init__(self, pubsub):
+        self.pubsub = pubsub
+
+    def wait(self, timeout: float) -> None:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            msg = self.pubsub.get_message(ignore_subscribe_messages=True, timeout=deadline - time.monotonic())
+            if msg:
+                return
+
+
+@contextmanager
+def subscribe():
+    client = _redis()
+    pubsub = None
+    if client is not None:
+        try:
+            pubsub = client.pubsub()
+            pubsub.subscribe(CHANNEL)
+        except Exception as e:
+            logger.warning("Report events falling back to database polling: %s", e)
+            pubsub = None
+    try:
+        yield _RedisSubscription(pubsub) if pubsub else _LocalSubscription()
+    finally:
+        if pubsub:
+            pubsub.close()
+
+
+def changed_since(since: datetime):
+    return ReportJob.objects.filter(changed_at__gt=since).order_by("changed_at", "pk")
+
+
+def wait_for_changes(since: datetime, timeout: float):
+    """
+    Returns the jobs changed after `since`, blocking up to `timeout` seconds
+    for one to appear. Subscribing before the first query means a change
+    committed in between still wakes us.
+    """
+    deadline = time.monotonic() + timeout
+    with subscribe() as sub:
+        pushed = isinstance(sub, _RedisSubscription)
+        step = getattr(settings, "REPORT_EVENTS_POLL_INTERVAL", 2)
+        while True:
+            jobs = list(changed_since(since))
+            remaining = deadline - time.monotonic()
+            if jobs or remaining <= 0:
+                return jobs
+            sub.wait(remaining if pushed else min(step, remaining))
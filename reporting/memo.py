@@ -0,0 +1,102 @@
+# reporting/memo.py
+"""
+Month-by-month memoization for date-range reports.
+
+A builder describes one calendar month's work as compute(first, last) ->
+(summary, rows), both JSON-serializable. monthly() covers a range with whole
+months: closed months come from ReportPeriodMemo while their source version
+still matches, and the open month (and anything later) is always computed
+fresh. Source versions are one grouped Count/Max(updated_at) query per
+source table, so back-dated inserts, edits and deletes invalidate exactly
+the months they touch. Callers slice the edge months of the range in Python.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Callable, Iterable, NamedTuple, Optional
+
+from django.apps import apps
+from django.db.models import Count, Max
+from django.db.models.functions import TruncMonth
+
+from .models import ReportPeriodMemo
+
+
+class MonthBlock(NamedTuple):
+    month: date                      # first day
+    end: date                        # last day
+    summary: dict
+    load_rows: Callable[[], list]    # rows are fetched only when consumed
+
+
+def month_bounds(start: date, end: date) -> list[tuple[date, date]]:
+    """Whole calendar months overlapping [start, end]."""
+    months = []
+    lo = start.replace(day=1)
+    while lo <= end:
+        nxt = (lo + timedelta(days=32)).replace(day=1)
+        months.append((lo, nxt - timedelta(days=1)))
+        lo = nxt
+    return months
+
+
+def source_versions(sources: Iterable[tuple[str, str, str]], first: date, last: date) -> dict[date, str]:
+    """
+    Version token per month for (app_label, model_name, date_field) sources
+    over [first, last]: row count and newest updated_at of each source.
+    """
+    parts = defaultdict(list)
+    for app_label, model_name, field in sources:
+        try:
+            model = apps.get_model(app_label, model_name)
+        except LookupError:
+            continue
+        grouped = dict(
+            (month, f"{n}:{latest.isoformat() if latest else ''}")
+            for month, n, latest in model.objects.filter(**{f"{field}__range": (first, last)})
+            .annotate(_month=TruncMonth(field))
+            .order_by()
+            .values("_month")
+            .annotate(n=Count("pk"), latest=Max("updated_at"))
+            .values_list("_month", "n", "latest")
+        )
+        for lo, _hi in month_bounds(first, last):
+            parts[lo].append(f"{model._meta.label}:{grouped.get(lo, '0:')}")
+    return {month: "|".join(p) for month, p in parts.items()}
+
+
+def _stored_rows(pk: int) -> Callable[[], list]:
+    return lambda: ReportPeriodMemo.objects.values_list("rows", flat=True).get(pk=pk)
+
+
+def monthly(key: str, start: date, end: date, sources, compute, today: Optional[date] = None) -> list[MonthBlock]:
+    today = today or date.today()
+    months = month_bounds(start, end)
+    versions = source_versions(sources, months[0][0], months[-1][1]) if months else {}
+    stored = {
+        month: (pk, version, summary)
+        for pk, month, version, summary in ReportPeriodMemo.objects.filter(
+            key=key, month__in=[lo for lo, _ in months],
+        ).values_list("pk", "month", "source_version", "summary")
+    }
+
+    blocks = []
+    for lo, hi in months:
+        version = versions.get(lo, "")
+        closed = hi < today.replace(day=1)
+        memo = stored.get(lo)
+        if closed and memo and memo[1] == version:
+            blocks.append(MonthBlock(lo, hi, memo[2], _stored_rows(memo[0])))
+            continue
+
+        summary, rows = compute(lo, hi)
+        if closed:
+            obj, _ = ReportPeriodMemo.objects.update_or_create(
+                key=key, month=lo, defaults={"source_version": version, "summary": summary, "rows": rows},
+            )
+            # Let the rows go; they are read back when the report consumes them.
+            blocks.append(MonthBlock(lo, hi, summary, _stored_rows(obj.pk)))
+        else:
+            blocks.append(MonthBlock(lo, hi, summary, lambda rows=rows: rows))
+    return blocks
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:02
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reporting', '0006_reportjob_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportjob',
+            name='changed_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
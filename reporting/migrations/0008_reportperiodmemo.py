@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reporting', '0007_reportjob_changed_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportPeriodMemo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64)),
+                ('month', models.DateField()),
+                ('source_version', models.CharField(max_length=255)),
+                ('summary', models.JSONField(blank=True, default=dict)),
+                ('rows', models.JSONField(blank=True, default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('key', 'month'), name='reportperiodmemo_key_month')],
+            },
+        ),
+    ]
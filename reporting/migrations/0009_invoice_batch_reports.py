@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reporting', '0008_reportperiodmemo'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='reportjob',
+            name='report_type',
+            field=models.CharField(choices=[('PNL', 'Profit & Loss'), ('BS', 'Balance Sheet'), ('CASH', 'Cash Flow'), ('PAYROLL_VS_ATT', 'Payroll vs Attendance (Excel)'), ('LOW_STOCK', 'Low Stock (Excel)'), ('DOC_EXP', 'Expiring Documents (Excel)'), ('STUDENT_DOCS', 'Student Documents (PDF)'), ('LOW_STOCK_PDF', 'Low Stock (PDF)'), ('STUDENT_FEES', 'Student Fees Status'), ('ENROLL_SUMMARY', 'Enrollment Summary'), ('AR_AGING', 'Accounts Receivable Aging'), ('AP_AGING', 'Accounts Payable Aging'), ('INV_VALUATION', 'Inventory Valuation'), ('HR_ATT_SUMMARY', 'HR Attendance Summary'), ('INVOICES_ZIP', 'Invoice PDFs (ZIP)'), ('INVOICES_PDF', 'Invoice PDFs (single PDF)')], max_length=40),
+        ),
+    ]
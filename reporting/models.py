@@ -2,6 +2,7 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 from django.db.models import JSONField
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -21,6 +22,8 @@ class ReportJob(models.Model):
         ("AP_AGING", "Accounts Payable Aging"),
         ("INV_VALUATION", "Inventory Valuation"),
         ("HR_ATT_SUMMARY", "HR Attendance Summary"),
+        ("INVOICES_ZIP", "Invoice PDFs (ZIP)"),
+        ("INVOICES_PDF", "Invoice PDFs (single PDF)"),
     ]
 
     STATUS_CHOICES = [
@@ -28,6 +31,7 @@ class ReportJob(models.Model):
         ("IN_PROGRESS", "In Progress"),
         ("COMPLETED", "Completed"),
         ("FAILED", "Failed"),
+        ("CANCELLED", "Cancelled"),
     ]
 
     report_type = models.CharField(max_length=40, choices=REPORT_TYPES)
@@ -44,9 +48,55 @@ class ReportJob(models.Model):
 
     task_id = models.CharField(max_length=64, blank=True, null=True)
 
+    # Result cache: hash of report type, normalized parameters and source data version
+    cache_key = models.CharField(max_length=64, blank=True, null=True, db_index=True)
+    file_size = models.PositiveBigIntegerField(blank=True, null=True)
+
+    # Progress, written by the running build at a throttled rate
+    phase = models.CharField(max_length=40, blank=True, default="")
+    rows_processed = models.PositiveBigIntegerField(default=0)
+    rows_total = models.PositiveBigIntegerField(blank=True, null=True)
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    cancel_requested_at = models.DateTimeField(blank=True, null=True)
+
+    # Bumped on state and phase changes (row counts at a throttled rate); cursor for the events endpoint
+    changed_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    IN_FLIGHT = ("PENDING", "IN_PROGRESS")
+
     class Meta:
         ordering = ["-created_at"]
+        constraints = [
+            # Single-flight: at most one queued/running build per cache key
+            models.UniqueConstraint(
+                fields=["cache_key"],
+                condition=models.Q(status__in=["PENDING", "IN_PROGRESS"]),
+                name="reportjob_single_flight",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.get_report_type_display()} #{self.pk}"
 
+
+
+class ReportPeriodMemo(models.Model):
+    """
+    Per-month partial results of date-range reports (see reporting.memo).
+    Only closed months are stored; a row is reused while `source_version`
+    still matches the month's data in the source tables.
+    """
+    key = models.CharField(max_length=64)
+    month = models.DateField()  # first day of the month
+    source_version = models.CharField(max_length=255)
+    summary = JSONField(default=dict, blank=True)
+    rows = JSONField(default=list, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["key", "month"], name="reportperiodmemo_key_month"),
+        ]
+
+    def __str__(self):
+        return f"{self.key} {self.month:%Y-%m}"
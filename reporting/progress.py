@@ -0,0 +1,132 @@
+# reporting/progress.py
+"""
+Throttled progress reporting and cooperative cancellation for report builds.
+
+A build wraps its work in `with JobProgress(job_id) as progress:` and feeds
+rows through `progress.track(...)`. Counters are flushed at most once per
+REPORT_PROGRESS_INTERVAL; a background thread keeps `heartbeat_at` fresh
+while the build sits in a long query or in PDF rendering. Row counts alone
+are pushed to the events channel (changed_at) at most once per
+REPORT_PROGRESS_PUSH_INTERVAL, so open job lists are not woken every second;
+phase changes are pushed at once. Both writes are
+conditional on the job not being cancelled, so a cancel request surfaces as
+ReportCancelled at the next row boundary.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Iterable, Iterator, Optional
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+
+from . import events
+from .models import ReportJob
+
+logger = logging.getLogger(__name__)
+
+
+class ReportCancelled(Exception):
+    """Raised inside a build once its job has a pending cancel request."""
+
+
+def _interval(name: str, default: float) -> float:
+    return float(getattr(settings, name, default))
+
+
+class JobProgress:
+    def __init__(self, job_id: int):
+        self.job_id = job_id
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        self._last_push = self._last_flush
+        self._cancelled = threading.Event()
+        self._stop = threading.Event()
+        self._beat_thread: Optional[threading.Thread] = None
+
+    # ----- lifecycle -----
+    def __enter__(self) -> "JobProgress":
+        self._beat()
+        self._beat_thread = threading.Thread(
+            target=self._beat_loop, name=f"report-heartbeat-{self.job_id}", daemon=True,
+        )
+        self._beat_thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self._stop.set()
+        if self._beat_thread:
+            self._beat_thread.join()
+        if exc_type is None:
+            self.flush()
+
+    # ----- writes -----
+    def _live(self):
+        return ReportJob.objects.filter(pk=self.job_id, cancel_requested_at__isnull=True)
+
+    def _beat(self) -> None:
+        if not self._live().update(heartbeat_at=timezone.now()):
+            self._cancelled.set()
+
+    def _beat_loop(self) -> None:
+        # Runs on its own thread, hence its own database connection.
+        try:
+            while not self._stop.wait(_interval("REPORT_HEARTBEAT_INTERVAL", 5)):
+                try:
+                    self._beat()
+                except Exception as e:
+                    logger.warning("Heartbeat for report job %s failed: %s", self.job_id, e)
+        finally:
+            connection.close()
+
+    def flush(self, **fields) -> None:
+        """Writes pending row counts (plus any extra fields); raises if the job was cancelled."""
+        now, tick = timezone.now(), time.monotonic()
+        push = bool(fields) or tick - self._last_push >= _interval("REPORT_PROGRESS_PUSH_INTERVAL", 5)
+        if push:
+            fields["changed_at"] = now
+        updated = self._live().update(
+            rows_processed=F("rows_processed") + self._pending,
+            heartbeat_at=now,
+            **fields,
+        )
+        self._pending = 0
+        self._last_flush = tick
+        if not updated:
+            self._cancelled.set()
+        elif push:
+            self._last_push = tick
+            events.publish(self.job_id)
+        self.check()
+
+    # ----- builder API -----
+    def check(self) -> None:
+        if self._cancelled.is_set():
+            raise ReportCancelled(f"Report job {self.job_id} was cancelled")
+
+    def phase(self, name: str, total: Optional[int] = None) -> None:
+        fields = {"phase": name[:40]}
+        if total is not None:
+            fields["rows_total"] = total
+        self.flush(**fields)
+
+    def step(self, n: int = 1) -> None:
+        self._pending += n
+        self.check()
+        if time.monotonic() - self._last_flush >= _interval("REPORT_PROGRESS_INTERVAL", 1):
+            self.flush()
+
+    def track(self, rows: Iterable, n: int = 1) -> Iterator:
+        """Yields `rows` unchanged, counting each one and checking for cancellation."""
+        for row in rows:
+            self.step(n)
+            yield row
+
+
+def track(rows: Iterable, progress: Optional[JobProgress]) -> Iterable:
+    """Builders accept progress=None when called outside a report job."""
+    return progress.track(rows) if progress else rows
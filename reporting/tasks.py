@@ -1,12 +1,21 @@
 # reporting/tasks.py
 from __future__ import annotations
 import json
-from celery import shared_task
+import logging
+from datetime import timedelta
+
+from celery import chord, current_app, shared_task
+from django.conf import settings
 from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Q
 from django.utils import timezone
 
 from .models import ReportJob
-from . import utils
+from .progress import JobProgress, ReportCancelled
+from . import cache, events, utils
+
+logger = logging.getLogger(__name__)
 
 
 def _set_status(job: ReportJob, value: str) -> None:
@@ -42,6 +51,11 @@ REPORT_BUILDERS = {
     "STUDENT_DOCS":           getattr(utils, "generate_student_docs_pdf", None),
     "STUDENT_FEES":           getattr(utils, "generate_student_fees_pdf", None),
     "STUDENT_FEES_STATUS":    getattr(utils, "generate_student_fees_status_pdf", None),
+    "LOW_STOCK_PDF":          getattr(utils, "generate_low_stock_pdf", None),
+    "INVOICES_PDF":           getattr(utils, "generate_invoices_pdf", None),
+
+    # Archives
+    "INVOICES_ZIP":           getattr(utils, "generate_invoices_zip", None),
 
     # Excel
     "LOW_STOCK":              getattr(utils, "generate_low_stock_excel", None),
@@ -51,11 +65,110 @@ REPORT_BUILDERS = {
 }
 
 
+# Builders that can split into independent partitions (see utils.Partitioned).
+# Listed types fan out as a Celery group, each partition rendering its part
+# to storage, and a chord callback merges the parts.
+PARTITIONED_BUILDERS = {
+    "CASH":                   getattr(utils, "CASH_FLOW_PARTITIONS", None),
+    "STUDENT_DOCS":           getattr(utils, "STUDENT_DOCS_PARTITIONS", None),
+}
+
+
+def _save(job: ReportJob, fields: list[str]) -> None:
+    """Saves a state change and pushes it to the events channel."""
+    job.changed_at = timezone.now()
+    job.save(update_fields=[*fields, "changed_at"])
+    events.publish(job.id)
+
+
+def _store_result(job: ReportJob, content: ContentFile | None) -> None:
+    if not content:
+        _set_status(job, "COMPLETED")
+        job.error = "Report generated, but no data was found for the given parameters."
+        _save(job, ["status", "error"])
+        return
+
+    name = getattr(content, "name", f"report_{job.id}.bin")
+    job.file.save(name, content, save=False)
+    _set_status(job, "COMPLETED")
+    job.generated_at = timezone.now()
+    job.file_size = job.file.size
+    job.error = None
+    _save(job, ["file", "file_size", "status", "generated_at", "error"])
+
+
+def _fail(job: ReportJob, e: Exception) -> None:
+    _set_status(job, "FAILED")
+    job.error = f"{type(e).__name__}: {e}"
+    _save(job, ["status", "error"])
+
+
+def _cancelled(job: ReportJob) -> None:
+    _set_status(job, "CANCELLED")
+    job.error = "Cancelled by user."
+    _save(job, ["status", "error"])
+
+
+def revoke_builds(task_ids, terminate: bool = False) -> None:
+    task_ids = [t for t in task_ids if t]
+    if not task_ids:
+        return
+    try:
+        current_app.control.revoke(task_ids, terminate=terminate)
+    except Exception as e:
+        logger.warning("Could not revoke report tasks %s: %s", task_ids, e)
+
+
+PARTS_DIR = "reports/parts"
+
+
+def _parts_dir(job_id: int) -> str:
+    return f"{PARTS_DIR}/{job_id}"
+
+
+def discard_parts(job_id: int) -> None:
+    """Deletes the stored partition parts of a job."""
+    try:
+        _dirs, files = default_storage.listdir(_parts_dir(job_id))
+    except (FileNotFoundError, NotADirectoryError):
+        return
+    for name in files:
+        try:
+            default_storage.delete(f"{_parts_dir(job_id)}/{name}")
+        except Exception as e:
+            logger.warning("Could not delete report part %s/%s: %s", job_id, name, e)
+
+
+def _fan_out(job: ReportJob, params: dict, progress: JobProgress) -> bool:
+    """Queues a partitioned build as a chord; False means build inline instead."""
+    partitioned = PARTITIONED_BUILDERS.get(job.report_type)
+    if not partitioned or not getattr(settings, "REPORT_PARALLEL_BUILDS", False):
+        return False
+    if not (utils.WEASY and utils.CAN_MERGE):
+        return False  # parts are PDFs; the HTML fallback renders in one piece
+    partitions = partitioned.partitions(**params)
+    if len(partitions) < getattr(settings, "REPORT_MIN_PARTITIONS", 2):
+        return False
+    # Progress is counted in partitions here, one step per finished slice.
+    progress.phase("partitions", total=len(partitions))
+    last = len(partitions) - 1
+    chord(
+        build_report_partition.s(job.id, part, index=i, last=i == last) for i, part in enumerate(partitions)
+    )(merge_report_partitions.s(job.id))
+    return True
+
+
 @shared_task(bind=True, max_retries=0)
 def build_report(self, job_id: int):
+    # Claim the job; one cancelled while queued (or already claimed) is skipped.
+    claimed = ReportJob.objects.filter(pk=job_id, status="PENDING", cancel_requested_at__isnull=True).update(
+        status="IN_PROGRESS", task_id=self.request.id, heartbeat_at=timezone.now(),
+        phase="", rows_processed=0, rows_total=None, changed_at=timezone.now(),
+    )
+    if not claimed:
+        return
+    events.publish(job_id)
     job = ReportJob.objects.get(pk=job_id)
-    _set_status(job, "IN_PROGRESS")
-    job.save(update_fields=["status"])
 
     params = _as_kwargs(job.parameters or {})
     rtype = job.report_type
@@ -64,28 +177,155 @@ def build_report(self, job_id: int):
     if not builder:
         _set_status(job, "FAILED")
         job.error = f"No builder for report type '{rtype}'"
-        job.save(update_fields=["status", "error"])
+        _save(job, ["status", "error"])
         return
 
     try:
-        content: ContentFile | None = builder(**params)
-        if not content:
-            _set_status(job, "COMPLETED")
-            job.error = "Report generated, but no data was found for the given parameters."
-            job.save(update_fields=["status", "error"])
-            return
+        with JobProgress(job.id) as progress:
+            if _fan_out(job, params, progress):
+                return
+            content = builder(**{**params, "progress": progress})
+            progress.phase("saving")
+        _store_result(job, content)
+    except ReportCancelled:
+        _cancelled(job)
+    except Exception as e:
+        _fail(job, e)
+        raise
 
-        name = getattr(content, "name", f"report_{job.id}.bin")
-        job.file.save(name, content, save=False)
-        _set_status(job, "COMPLETED")
-        job.generated_at = timezone.now()
-        job.error = None
-        job.save(update_fields=["file", "status", "generated_at", "error"])
-        return
 
+def queue_build(job_id: int) -> None:
+    """
+    Queues build_report for a new job (from on_commit). A broker failure
+    fails the job and frees its cache key, so identical requests start a
+    new build instead of attaching to one that was never queued.
+    """
+    try:
+        build_report.delay(job_id)
     except Exception as e:
-        _set_status(job, "FAILED")
-        job.error = f"{type(e).__name__}: {e}"
-        job.save(update_fields=["status", "error"])
+        logger.error("Could not queue report job %s: %s", job_id, e)
+        ReportJob.objects.filter(pk=job_id, status="PENDING").update(
+            status="FAILED", cache_key=None, error="Could not queue the report build.", changed_at=timezone.now(),
+        )
+    events.publish(job_id)
+
+
+@shared_task(bind=True, max_retries=0)
+def build_report_partition(self, job_id: int, partition, index: int = 0, last: bool = False):
+    """
+    Renders one slice of a partitioned report into storage. The result the
+    chord callback receives is only the part's name and summary.
+    """
+    job = ReportJob.objects.get(pk=job_id)
+    try:
+        with JobProgress(job.id) as progress:
+            progress.check()
+            content, summary = PARTITIONED_BUILDERS[job.report_type].build(
+                partition, index == 0, last, **_as_kwargs(job.parameters or {})
+            )
+            name = None
+            if content is not None:
+                name = default_storage.save(f"{_parts_dir(job.id)}/{index:05d}.pdf", ContentFile(content))
+            progress.step()
+        return {"part": name, "summary": summary}
+    except ReportCancelled:
+        # Raising keeps the chord callback from running.
+        _cancelled(job)
+        raise
+    except Exception as e:
+        # A failed header task means the chord callback never runs.
+        _fail(job, e)
+        raise
+
+
+def _read_parts(names):
+    for name in names:
+        with default_storage.open(name, "rb") as fh:
+            yield fh.read()
+
+
+@shared_task(bind=True, max_retries=0)
+def merge_report_partitions(self, partials, job_id: int):
+    """Chord callback: merges the stored parts (in partition order) into the report file."""
+    job = ReportJob.objects.get(pk=job_id)
+    try:
+        with JobProgress(job.id) as progress:
+            progress.phase("merging")
+            content = PARTITIONED_BUILDERS[job.report_type].merge(
+                _read_parts(p["part"] for p in partials if p["part"]),
+                [p["summary"] for p in partials],
+                **_as_kwargs(job.parameters or {}),
+            )
+            progress.phase("saving")
+        _store_result(job, content)
+    except ReportCancelled:
+        _cancelled(job)
+    except Exception as e:
+        _fail(job, e)
         raise
+    finally:
+        discard_parts(job.id)
 
+
+@shared_task
+def reap_report_jobs():
+    """
+    Fails running jobs whose heartbeat went stale (worker died or hung),
+    force-stops cancelled jobs that ignored the request past the grace
+    period, and fails (and un-keys) jobs no worker picked up in time.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=getattr(settings, "REPORT_HEARTBEAT_TIMEOUT", 60))
+    grace = now - timedelta(seconds=getattr(settings, "REPORT_CANCEL_GRACE", 15))
+    unclaimed = now - timedelta(seconds=getattr(settings, "REPORT_QUEUE_TIMEOUT", 3600))
+
+    # A fanned-out job only beats while one of its partitions runs, so it
+    # gets a task time limit's worth of slack for partitions still queued.
+    fanned_out = now - timedelta(seconds=getattr(settings, "CELERY_TASK_TIME_LIMIT", 30 * 60))
+
+    running = ReportJob.objects.filter(status="IN_PROGRESS")
+    abandoned = running.filter(
+        Q(heartbeat_at__isnull=True, created_at__lt=stale)
+        | (~Q(phase="partitions") & Q(heartbeat_at__lt=stale))
+        | Q(phase="partitions", heartbeat_at__lt=fanned_out)
+    )
+    stuck = running.filter(cancel_requested_at__lt=grace).exclude(pk__in=abandoned.values("pk"))
+
+    abandoned = dict(abandoned.values_list("pk", "task_id"))
+    stuck = dict(stuck.values_list("pk", "task_id"))
+    revoke_builds([*abandoned.values(), *stuck.values()], terminate=True)
+
+    failed = ReportJob.objects.filter(pk__in=abandoned, status="IN_PROGRESS").update(
+        status="FAILED", error="Report worker stopped responding.", changed_at=now,
+    )
+    cancelled = ReportJob.objects.filter(pk__in=stuck, status="IN_PROGRESS").update(
+        status="CANCELLED", error="Cancelled by user.", changed_at=now,
+    )
+    # Lost between the request and a worker (e.g. the broker dropped it):
+    # without this, identical requests would keep attaching to it.
+    lost = list(ReportJob.objects.filter(status="PENDING", created_at__lt=unclaimed).values_list("pk", flat=True))
+    unqueued = ReportJob.objects.filter(pk__in=lost, status="PENDING").update(
+        status="FAILED", cache_key=None, error="Report was never picked up by a worker.", changed_at=now,
+    )
+    if abandoned or stuck or lost:
+        events.publish(*abandoned, *stuck, *lost)
+    return f"Reaped {failed} stale, {cancelled} cancelled and {unqueued} unqueued report job(s)"
+
+
+@shared_task
+def evict_report_cache():
+    """
+    Age- and size-based eviction of cached report files. Also drops the
+    parts left behind by partitioned builds that failed or were cancelled.
+    """
+    evicted = cache.evict()
+    try:
+        job_dirs, _files = default_storage.listdir(PARTS_DIR)
+    except (FileNotFoundError, NotADirectoryError):
+        job_dirs = []
+    job_ids = [int(d) for d in job_dirs if d.isdigit()]
+    running = set(ReportJob.objects.filter(pk__in=job_ids, status="IN_PROGRESS").values_list("pk", flat=True))
+    for job_id in job_ids:
+        if job_id not in running:
+            discard_parts(job_id)
+    return f"Evicted {evicted} cached report(s)"
@@ -1,3 +1,850 @@
-from django.test import TestCase
+import gc
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from core.testing import make_invoice, make_staff, make_student
+from finance.models import Expense, Invoice, Payment, PurchaseOrder, Treasury
+from hr.models import Staff, StaffDocument
+from inventory.models import Item, Vendor
+from student.models import Classroom, StudentDocument
+
+from . import cache, events, memo, tasks, utils
+from .progress import JobProgress, ReportCancelled
+from .models import ReportJob, ReportPeriodMemo
+
+ZERO = Decimal("0.00")
+
+
+class CashFlowTests(TestCase):
+    def setUp(self):
+        self.treasury = Treasury.objects.create(name="Main", balance=Decimal("0.00"))
+        self.invoice = make_invoice(make_student(), amount="5000.00")
+
+    def pay(self, amount, day):
+        return Payment.objects.create(invoice=self.invoice, amount=Decimal(amount), treasury=self.treasury, date=day)
+
+    def spend(self, amount, day, reference=""):
+        return Expense.objects.create(description="x", amount=Decimal(amount), treasury=self.treasury,
+                                      date=day, reference=reference)
+
+    def test_rows_are_signed_merged_by_date_and_windowed(self):
+        p = self.pay("100.00", date(2025, 3, 5))
+        self.spend("40.00", date(2025, 3, 2), reference="RENT-3")
+        e2 = self.spend("-10.00", date(2025, 3, 7))  # stored negative, still an outflow
+        self.pay("999.00", date(2025, 4, 1))
+
+        rows, totals = utils.cash_flow_entries(date(2025, 3, 1), date(2025, 3, 31))
+
+        self.assertEqual(list(rows), [
+            (date(2025, 3, 2), "RENT-3", Decimal("-40.00"), "OUT"),
+            (date(2025, 3, 5), f"PAY-{p.pk}", Decimal("100.00"), "IN"),
+            (date(2025, 3, 7), f"EXP-{e2.pk}", Decimal("-10.00"), "OUT"),
+        ])
+        self.assertEqual(totals, {"count": 3, "total_in": Decimal("100.00"), "total_out": Decimal("50.00"),
+                                  "net": Decimal("50.00")})
+
+    def test_empty_window_has_no_report(self):
+        rows, totals = utils.cash_flow_entries(date(2025, 1, 1), date(2025, 1, 31))
+        self.assertEqual(list(rows), [])
+        self.assertEqual(totals["count"], 0)
+        self.assertIsNone(utils.generate_cash_flow_pdf(start="2025-01-01", end="2025-01-31"))
+
+
+class PeriodMemoTests(TestCase):
+    SOURCES = (("finance", "Expense", "date"),)
+    TODAY = date(2025, 4, 10)
+
+    def setUp(self):
+        self.treasury = Treasury.objects.create(name="Main", balance=Decimal("0.00"))
+        self.computed = []
+
+    def spend(self, day, amount="10.00"):
+        return Expense.objects.create(description="x", amount=Decimal(amount), treasury=self.treasury, date=day)
+
+    def compute(self, first, last):
+        self.computed.append(first)
+        n = Expense.objects.filter(date__range=(first, last)).count()
+        return {"count": n}, [[first.isoformat(), n]]
+
+    def run_memo(self, start=date(2025, 1, 15), end=date(2025, 4, 5)):
+        return memo.monthly("TEST:v1", start, end, self.SOURCES, self.compute, today=self.TODAY)
+
+    def test_closed_months_are_reused_and_the_open_month_recomputed(self):
+        self.spend(date(2025, 2, 3))
+        blocks = self.run_memo()
+        self.assertEqual([b.month for b in blocks], [date(2025, m, 1) for m in (1, 2, 3, 4)])
+        self.assertEqual([b.summary["count"] for b in blocks], [0, 1, 0, 0])
+        self.assertEqual(ReportPeriodMemo.objects.count(), 3)
+
+        self.computed.clear()
+        blocks = self.run_memo()
+        self.assertEqual(self.computed, [date(2025, 4, 1)])
+        self.assertEqual(blocks[1].load_rows(), [["2025-02-01", 1]])
+
+    def test_back_dated_changes_invalidate_only_their_month(self):
+        expense = self.spend(date(2025, 2, 3))
+        self.run_memo()
+
+        self.computed.clear()
+        self.spend(date(2025, 3, 9))
+        self.assertEqual(self.computed, [])
+        self.assertEqual([b.summary["count"] for b in self.run_memo()], [0, 1, 1, 0])
+        self.assertEqual(self.computed, [date(2025, 3, 1), date(2025, 4, 1)])
+
+        self.computed.clear()
+        expense.delete()
+        self.assertEqual([b.summary["count"] for b in self.run_memo()], [0, 0, 1, 0])
+        self.assertEqual(self.computed, [date(2025, 2, 1), date(2025, 4, 1)])
+
+    def test_memoized_cash_flow_matches_a_direct_query(self):
+        invoice = make_invoice(make_student(), amount="5000.00")
+        for day in (date(2025, 1, 31), date(2025, 2, 1), date(2025, 2, 28), date(2025, 3, 15)):
+            Payment.objects.create(invoice=invoice, amount=Decimal("25.00"), treasury=self.treasury, date=day)
+            self.spend(day, amount="7.50")
+
+        for _ in range(2):  # cold, then from the memo
+            rows, totals = utils.cash_flow_memoized(date(2025, 2, 1), date(2025, 3, 10))
+            direct_rows, direct_totals = utils.cash_flow_entries(date(2025, 2, 1), date(2025, 3, 10))
+            self.assertEqual(sorted(rows), sorted(direct_rows))
+            self.assertEqual(totals, direct_totals)
+
+
+class PnlTests(TestCase):
+    def setUp(self):
+        self.treasury = Treasury.objects.create(name="Main", balance=Decimal("0.00"))
+        student = make_student()
+        make_invoice(student, amount="100.00", issued=date(2025, 1, 10))
+        make_invoice(student, amount="50.00", issued=date(2025, 2, 10), status="DRAFT")
+        make_invoice(student, amount="200.00", issued=date(2025, 3, 10))
+        make_invoice(student, amount="80.00", issued=date(2024, 1, 10))
+
+        vendor = Vendor.objects.create(name="Books Co")
+        item = Item.objects.create(name="Book", sku="BK-1", category="BOOK", unit_price=Decimal("10.00"))
+        po = PurchaseOrder.objects.create(vendor=vendor, item=item, quantity=2, unit_price=Decimal("10.00"),
+                                          order_date=date(2025, 2, 5), received=True)
+        PurchaseOrder.objects.create(vendor=vendor, item=item, quantity=9, unit_price=Decimal("10.00"),
+                                     order_date=date(2025, 2, 6))
+        self.spend("-30.00", date(2025, 1, 20), category="RENT")
+        self.spend("5.00", date(2025, 3, 20), category="UTILITIES")
+        self.spend("20.00", date(2025, 2, 7), purchase_order=po)  # settles the PO: already in cost of sales
+
+    def spend(self, amount, day, **kwargs):
+        return Expense.objects.create(description="x", amount=Decimal(amount), treasury=self.treasury, date=day,
+                                      **kwargs)
+
+    def test_statement_pivots_grouped_aggregates(self):
+        with self.assertNumQueries(4):
+            pnl = utils.pnl_statement(date(2025, 1, 1), date(2025, 3, 31), compare="previous_year")
+
+        self.assertEqual(pnl["columns"], ["Jan 2025", "Feb 2025", "Mar 2025"])
+        revenue, cogs, opex = pnl["sections"]
+        self.assertEqual(revenue["lines"][0]["cells"], [Decimal("100.00"), ZERO, Decimal("200.00")])
+        self.assertEqual(
+            {k: revenue["total"][k] for k in ("total", "previous", "change", "change_pct")},
+            {"total": Decimal("300.00"), "previous": Decimal("80.00"), "change": Decimal("220.00"),
+             "change_pct": Decimal("275.0")},
+        )
+        self.assertEqual(cogs["total"]["total"], Decimal("20.00"))
+        self.assertEqual([(l["label"], l["total"]) for l in opex["lines"]],
+                         [("Rent", Decimal("30.00")), ("Utilities", Decimal("5.00"))])
+        self.assertEqual(cogs["after"]["total"], Decimal("280.00"))
+        self.assertEqual(pnl["net"]["total"], Decimal("245.00"))
+        self.assertEqual(pnl["net"]["cells"], [Decimal("70.00"), Decimal("-20.00"), Decimal("195.00")])
+
+    def test_cash_basis_counts_collections(self):
+        invoice = Invoice.objects.get(amount=Decimal("200.00"))
+        Payment.objects.create(invoice=invoice, amount=Decimal("60.00"), treasury=self.treasury, date=date(2025, 2, 1))
+        revenue = utils.pnl_statement(date(2025, 1, 1), date(2025, 3, 31), basis="cash")["sections"][0]
+        self.assertEqual([(l["label"], l["total"]) for l in revenue["lines"]], [("Fees collected", Decimal("60.00"))])
+        self.assertIsNone(revenue["total"]["previous"])
+
+    def test_columns_coarsen_with_the_range(self):
+        self.assertEqual(utils.pnl_statement(date(2024, 1, 1), date(2025, 1, 31))["columns"][:2], ["Q1 2024", "Q2 2024"])
+        self.assertEqual(utils.pnl_statement(date(2022, 1, 1), date(2025, 6, 30))["columns"],
+                         ["2022", "2023", "2024", "2025"])
+        self.assertEqual(utils.pnl_comparison_window(date(2025, 3, 1), date(2025, 3, 31), "previous_period"),
+                         (date(2025, 1, 29), date(2025, 2, 28)))
+
+
+class BalanceSheetTests(TestCase):
+    def test_open_balances_count_payments_up_to_the_date(self):
+        from finance.models import SalaryPayment
+        from hr.models import SalaryRecord
+
+        treasury = Treasury.objects.create(name="Main", balance=Decimal("1000.00"))
+        invoice = make_invoice(make_student(), amount="300.00", issued=date(2025, 3, 1), due=date(2025, 3, 10))
+        Payment.objects.create(invoice=invoice, amount=Decimal("100.00"), treasury=treasury, date=date(2025, 3, 5))
+        Payment.objects.create(invoice=invoice, amount=Decimal("50.00"), treasury=treasury, date=date(2025, 3, 25))
+        make_invoice(make_student(1), amount="999.00", issued=date(2025, 4, 1))  # issued later
+
+        vendor = Vendor.objects.create(name="Books Co")
+        item = Item.objects.create(name="Book", sku="BK-1", category="BOOK", unit_price=Decimal("10.00"))
+        PurchaseOrder.objects.create(vendor=vendor, item=item, quantity=4, unit_price=Decimal("10.00"),
+                                     order_date=date(2025, 3, 2), received=True)
+        record = SalaryRecord.objects.create(staff=make_staff(), month=date(2025, 3, 1), gross=Decimal("80.00"),
+                                             deduct=Decimal("0.00"), net=Decimal("80.00"))
+        SalaryPayment.objects.create(salary_record=record, treasury=treasury, amount=Decimal("80.00"),
+                                     date=date(2025, 4, 2))
+
+        sheet = utils.balance_sheet(date(2025, 3, 20))
+
+        assets = {a["label"]: a["amount"] for a in sheet["assets"]}
+        self.assertEqual(assets, {"Main": Decimal("1100.00"), "Accounts receivable": Decimal("200.00")})
+        self.assertEqual(sheet["assets"][1]["note"], "200.00 overdue")
+        self.assertEqual({l["label"]: l["amount"] for l in sheet["liabilities"]},
+                         {"Accounts payable": Decimal("40.00"), "Salaries payable": Decimal("80.00")})
+        self.assertEqual(sheet["equity"], Decimal("1180.00"))
+
+
+@override_settings(PAYROLL_WEEKEND_DAYS=(5, 6))
+class PayrollVsAttendanceTests(TestCase):
+    # Weekdays of 1-14 March 2025 (the 1st is a Saturday): ten working days
+    WINDOW = (date(2025, 3, 1), date(2025, 3, 14))
+    WORKDAYS = [d for d in (date(2025, 3, 1) + timedelta(days=i) for i in range(14)) if d.weekday() < 5]
+
+    def staff_with_salary(self, n, net="3000.00"):
+        from hr.models import SalaryRecord
+
+        staff = make_staff(n, first_name=f"S{n}")
+        SalaryRecord.objects.create(staff=staff, month=date(2025, 3, 1), gross=Decimal("3000.00"),
+                                    net=Decimal(net))
+        return staff
+
+    def attend(self, staff, days, status="PRESENT"):
+        from hr.models import StaffAttendance
+
+        StaffAttendance.objects.bulk_create(StaffAttendance(staff=staff, date=d, status=status) for d in days)
+
+    def report(self):
+        return {r["staff"]: r for r in utils.payroll_vs_attendance(*self.WINDOW)}
+
+    def test_partial_month_prorates_against_the_working_days_in_range(self):
+        from hr.models import Vacation
+
+        full = self.staff_with_salary(1)
+        self.attend(full, self.WORKDAYS)
+        on_leave = self.staff_with_salary(2)
+        self.attend(on_leave, self.WORKDAYS[:9])
+        Vacation.objects.create(staff=on_leave, start_date=date(2025, 3, 14), end_date=date(2025, 3, 20),
+                                approved=True)
+        half = self.staff_with_salary(3)
+        self.attend(half, self.WORKDAYS[:5])
+
+        rows = self.report()
+        self.assertEqual((rows["S1 Member"]["working"], rows["S1 Member"]["expected"], rows["S1 Member"]["flag"]),
+                         (10, Decimal("3000.00"), ""))
+        self.assertEqual((rows["S2 Member"]["vacation"], rows["S2 Member"]["flag"]), (1, ""))
+        self.assertEqual((rows["S3 Member"]["expected"], rows["S3 Member"]["variance"], rows["S3 Member"]["flag"]),
+                         (Decimal("1500.00"), Decimal("1500.00"), "Mismatch"))
+
+    def test_missing_sides_are_flagged(self):
+        self.staff_with_salary(1)
+        self.attend(make_staff(2, first_name="S2"), self.WORKDAYS[:1])
+        rows = self.report()
+        self.assertEqual(rows["S1 Member"]["flag"], "No attendance")
+        self.assertEqual(rows["S2 Member"]["flag"], "No salary record")
+
+
+class EnrollmentSummaryTests(TestCase):
+    def test_one_grouped_query_with_breakdown_counts(self):
+        a, b = Classroom.objects.create(name="A"), Classroom.objects.create(name="B")
+        make_student(1, classroom=a)
+        make_student(2, classroom=a, gender="F", is_active=False)
+        make_student(3, classroom=b, gender="F", enrollment_status="left")
+        make_student(4)
+
+        with self.assertNumQueries(1):
+            columns, rows = utils.enrollment_summary(["gender", "is_active", "bogus"])
+
+        self.assertEqual([label for _f, _v, label in columns], ["Male", "Female", "Is Active", "Not Active"])
+        by_group = {r["group"]: [r["count"]] + [r[f"c{i}"] for i in range(len(columns))] for r in rows}
+        self.assertEqual(by_group, {
+            "A": [2, 1, 1, 1, 1],
+            "B": [1, 0, 1, 1, 0],
+            "Unassigned": [1, 1, 0, 1, 0],
+        })
+        self.assertEqual([r["group"] for r in rows], ["A", "B", "Unassigned"])
+
+
+class AgingTests(TestCase):
+    AS_OF = date(2025, 6, 30)
+
+    def setUp(self):
+        self.treasury = Treasury.objects.create(name="Main", balance=Decimal("0.00"))
+
+    def render(self, builder, **params):
+        with mock.patch.object(utils, "_render_report", side_effect=lambda t, ctx, f: ctx) as render:
+            ctx = builder(as_of=self.AS_OF, **params)
+        if not render.called:
+            return None
+        return list(ctx["rows"]), ctx["parties"], ctx["totals"]
+
+    def test_ar_buckets_on_their_boundaries(self):
+        student = make_student()
+        for overdue in (-10, 30, 31, 90, 91):
+            make_invoice(student, due=self.AS_OF - timedelta(days=overdue), issued=date(2025, 1, 1),
+                         description=str(overdue))
+        make_invoice(student, due=date(2025, 1, 1), issued=date(2025, 1, 1), status="DRAFT")
+        partly = make_invoice(student, due=self.AS_OF, issued=date(2025, 1, 1))
+        Payment.objects.create(invoice=partly, amount=Decimal("60.00"), treasury=self.treasury, date=self.AS_OF)
+        settled = make_invoice(student, due=date(2025, 1, 1), issued=date(2025, 1, 1))
+        with mock.patch("finance.signals.email_invoice"):
+            Payment.objects.create(invoice=settled, amount=Decimal("100.00"), treasury=self.treasury,
+                                   date=self.AS_OF)
+
+        rows, parties, totals = self.render(utils.generate_ar_aging_pdf)
+
+        self.assertEqual(sorted((r["age"], r["bucket"], r["balance"]) for r in rows), [
+            (-10, "0-30", Decimal("100.00")),
+            (0, "0-30", Decimal("40.00")),
+            (30, "0-30", Decimal("100.00")),
+            (31, "31-60", Decimal("100.00")),
+            (90, "61-90", Decimal("100.00")),
+            (91, "90+", Decimal("100.00")),
+        ])
+        self.assertEqual(len(parties), 1)
+        self.assertEqual(
+            {k: totals[k] for k in ("b0_30", "b31_60", "b61_90", "b90p", "balance", "paid")},
+            {"b0_30": Decimal("240.00"), "b31_60": Decimal("100.00"), "b61_90": Decimal("100.00"),
+             "b90p": Decimal("100.00"), "balance": Decimal("540.00"), "paid": Decimal("60.00")},
+        )
+
+    def test_ap_ages_received_orders_from_their_terms(self):
+        vendor = Vendor.objects.create(name="Books Co")
+        item = Item.objects.create(name="Book", sku="BK-1", category="BOOK", unit_price=Decimal("10.00"))
+        order = lambda day, **kw: PurchaseOrder.objects.create(
+            vendor=vendor, item=item, quantity=10, unit_price=Decimal("10.00"), order_date=day, **kw)
+        late = order(self.AS_OF - timedelta(days=70), received=True)   # due 40 days ago
+        order(self.AS_OF - timedelta(days=10), received=True)          # not due yet
+        order(self.AS_OF - timedelta(days=200), received=False)        # never received
+        Expense.objects.create(description="part", amount=Decimal("30.00"), treasury=self.treasury,
+                               date=self.AS_OF, purchase_order=late)
+
+        rows, parties, totals = self.render(utils.generate_ap_aging_pdf, terms_days=30)
+
+        self.assertEqual([(r["ref"], r["age"], r["bucket"], r["balance"]) for r in rows], [
+            (late.po_number, 40, "31-60", Decimal("70.00")),
+            (rows[1]["ref"], -20, "0-30", Decimal("100.00")),
+        ])
+        self.assertEqual(parties[0]["name"], "Books Co")
+        self.assertEqual(totals["balance"], Decimal("170.00"))
+
+    def test_nothing_open_means_no_report(self):
+        self.assertIsNone(self.render(utils.generate_ar_aging_pdf))
+
+
+class WriteXlsxTests(TestCase):
+    def test_streams_rows_under_the_header(self):
+        from openpyxl import load_workbook
+
+        rows = ((f"item {i}", i, Decimal("1.50") * i) for i in range(1, 4))
+        out = utils.write_xlsx(rows, ["Item", "Qty", "Value"], "A sheet name longer than thirty-one chars", "x.xlsx")
+
+        self.assertEqual(out.name, "x.xlsx")
+        sheet = load_workbook(out).active
+        self.assertEqual(sheet.title, "A sheet name longer than thirty")
+        self.assertEqual(list(sheet.values), [("Item", "Qty", "Value"), ("item 1", 1, 1.5), ("item 2", 2, 3),
+                                              ("item 3", 3, 4.5)])
+
+    def test_no_rows_returns_none_without_building_a_workbook(self):
+        unraisable = []
+        with mock.patch.object(sys, "unraisablehook", unraisable.append):
+            self.assertIsNone(utils.write_xlsx(iter(()), ["A"], "Empty", "empty.xlsx"))
+            self.assertIsNone(utils.generate_expiring_docs_excel())
+            gc.collect()
+        self.assertEqual(unraisable, [])
+
+
+@skipUnless(utils.WEASY and utils.CAN_MERGE, "needs WeasyPrint and pypdf")
+@override_settings(PDF_POOL_WORKERS=2, REPORT_PDF_CHUNK_ROWS=2)
+class RenderPagedTests(TestCase):
+    def tearDown(self):
+        from core import pdf
+        pdf.close_pool()
+
+    @staticmethod
+    def html(rows, first, last):
+        return "<html><body>" + "".join(f"<p>{r}</p>" for r in rows) + "</body></html>"
+
+    def test_chunks_render_on_the_pool_and_merge_with_page_numbers(self):
+        from core import pdf
+        from pypdf import PdfReader
+
+        html = mock.Mock(side_effect=self.html)
+        with mock.patch.object(pdf, "_in_process", wraps=pdf._in_process) as in_process:
+            out = utils.render_paged(iter(range(5)), html, pdf_name="t.pdf", html_name="t.html")
+
+        self.assertEqual([c.args for c in html.call_args_list],
+                         [([0, 1], True, False), ([2, 3], False, False), ([4], False, True)])
+        in_process.assert_not_called()
+        self.assertEqual(out.name, "t.pdf")
+        self.assertEqual(len(PdfReader(out).pages), 3)
+
+    def test_no_rows_means_no_report(self):
+        self.assertIsNone(utils.render_paged(iter(()), self.html, pdf_name="t.pdf", html_name="t.html"))
+
+
+@skipUnless(utils.WEASY and utils.CAN_MERGE, "needs WeasyPrint and pypdf")
+@override_settings(PDF_POOL_WORKERS=2, MEDIA_ROOT=tempfile.mkdtemp())
+class InvoiceExportTests(TestCase):
+    def setUp(self):
+        a, b = Classroom.objects.create(name="A"), Classroom.objects.create(name="B")
+        self.invoices = [
+            make_invoice(make_student(0, classroom=a), issued=date(2025, 3, 2), status="PAID"),
+            make_invoice(make_student(1, classroom=a), issued=date(2025, 3, 1)),
+            make_invoice(make_student(2, classroom=b), issued=date(2025, 3, 1)),
+            make_invoice(make_student(3, classroom=a), issued=date(2025, 4, 1)),
+        ]
+        self.classroom = a
+
+    def tearDown(self):
+        from core import pdf
+        pdf.close_pool()
+
+    def test_batch_filters_in_one_query(self):
+        with self.assertNumQueries(1):
+            batch = utils.invoice_batch("2025-03-01", "2025-03-31", ["SENT", "PAID"], self.classroom.pk)
+            [i.student.first_name for i in batch]
+        self.assertEqual(batch, [self.invoices[1], self.invoices[0]])
+        self.assertEqual(utils.invoice_batch(status="PAID"), [self.invoices[0]])
+
+    def test_zip_and_merged_exports_render_on_the_pool(self):
+        from core import pdf
+        from pypdf import PdfReader
+
+        job = ReportJob.objects.create(report_type="INVOICES_ZIP", status="PENDING",
+                                       parameters={"start": "2025-03-01", "end": "2025-03-31"})
+        with mock.patch.object(pdf, "_in_process") as in_process:
+            tasks.build_report(job.pk)
+            merged = utils.generate_invoices_pdf(classroom=self.classroom.pk)
+        in_process.assert_not_called()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, "COMPLETED")
+        with job.file.open("rb") as fh, zipfile.ZipFile(fh) as archive:
+            self.assertEqual(archive.namelist(), [f"Invoice-{self.invoices[i].invoice_number}.pdf" for i in (1, 2, 0)])
+            self.assertTrue(archive.read(archive.namelist()[0]).startswith(b"%PDF"))
+        self.assertEqual(merged.name, "invoices.pdf")
+        self.assertEqual(len(PdfReader(merged).pages), 3)
+
+        self.assertIsNone(utils.generate_invoices_zip(start="2026-01-01"))
+
+    def test_merged_export_falls_back_to_a_zip_without_pypdf(self):
+        with mock.patch.object(utils, "CAN_MERGE", False), mock.patch.object(utils, "merge_pdfs") as merge:
+            out = utils.generate_invoices_pdf(classroom=self.classroom.pk)
+        merge.assert_not_called()
+        self.assertEqual(out.name, "invoices.zip")
+        self.assertEqual(len(zipfile.ZipFile(out).namelist()), 3)
+
+
+class ReportCacheTests(TestCase):
+    def setUp(self):
+        self.treasury = Treasury.objects.create(name="Main", balance=Decimal("0.00"))
+
+    def test_key_ignores_empty_parameters_and_follows_the_data(self):
+        key = cache.cache_key("CASH", {"start": "2025-03-01", "end": None})
+        self.assertEqual(key, cache.cache_key("CASH", {"start": "2025-03-01"}))
+        self.assertNotEqual(key, cache.cache_key("CASH", {"start": "2025-03-02"}))
+        self.assertNotEqual(key, cache.cache_key("PNL", {"start": "2025-03-01"}))
+
+        Expense.objects.create(description="x", amount=Decimal("5.00"), treasury=self.treasury, date=date.today())
+        self.assertNotEqual(key, cache.cache_key("CASH", {"start": "2025-03-01"}))
+
+    def test_types_without_sources_are_never_cached(self):
+        self.assertIsNone(cache.cache_key("UNLISTED", {}))
+        first, outcome = cache.find_or_create_job("UNLISTED", {})
+        second, again = cache.find_or_create_job("UNLISTED", {})
+        self.assertEqual((outcome, again), ("created", "created"))
+        self.assertNotEqual(first.pk, second.pk)
+
+    def test_identical_requests_share_one_build_then_its_result(self):
+        job, outcome = cache.find_or_create_job("CASH", {"start": "2025-03-01"})
+        self.assertEqual(outcome, "created")
+        self.assertEqual(cache.find_or_create_job("CASH", {"start": "2025-03-01", "end": ""}), (job, "in_flight"))
+
+        ReportJob.objects.filter(pk=job.pk).update(status="COMPLETED")
+        self.assertEqual(cache.find_or_create_job("CASH", {"start": "2025-03-01"}), (job, "hit"))
+
+        # New data means a new build
+        Expense.objects.create(description="x", amount=Decimal("5.00"), treasury=self.treasury, date=date.today())
+        fresh, outcome = cache.find_or_create_job("CASH", {"start": "2025-03-01"})
+        self.assertEqual(outcome, "created")
+        self.assertNotEqual(fresh.pk, job.pk)
+
+    def test_failed_builds_are_not_reused(self):
+        job, _ = cache.find_or_create_job("CASH", {})
+        ReportJob.objects.filter(pk=job.pk).update(status="FAILED")
+        retry, outcome = cache.find_or_create_job("CASH", {})
+        self.assertEqual(outcome, "created")
+        self.assertNotEqual(retry.pk, job.pk)
+
+    def test_database_allows_one_in_flight_build_per_key(self):
+        job, _ = cache.find_or_create_job("CASH", {})
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ReportJob.objects.create(report_type="CASH", cache_key=job.cache_key)
+        ReportJob.objects.filter(pk=job.pk).update(status="COMPLETED")
+        ReportJob.objects.create(report_type="CASH", cache_key=job.cache_key)  # finished builds don't count
+
+    def test_evict_drops_expired_then_oldest_until_under_budget(self):
+        jobs = [ReportJob.objects.create(report_type="CASH", status="COMPLETED", cache_key=f"k{i}", file_size=100)
+                for i in range(4)]
+        ReportJob.objects.filter(pk=jobs[0].pk).update(created_at=date(2020, 1, 1))
+        for i, job in enumerate(jobs[1:], start=1):
+            ReportJob.objects.filter(pk=job.pk).update(created_at=date.today() - timedelta(days=3 - i))
+
+        self.assertEqual(cache.evict(max_age=timedelta(days=30), max_bytes=200), 2)
+
+        kept = set(ReportJob.objects.filter(cache_key__isnull=False).values_list("pk", flat=True))
+        self.assertEqual(kept, {jobs[2].pk, jobs[3].pk})
+        self.assertEqual(ReportJob.objects.count(), 4)  # history stays
+
+
+class ReportRequestApiTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_superuser("boss", "b@x.com", "pw"))
+
+    def test_duplicate_request_attaches_to_the_build_in_flight(self):
+        with mock.patch("reporting.tasks.build_report") as build:
+            with self.captureOnCommitCallbacks(execute=True):
+                first = self.client.post("/api/v1/reporting/create/", {"report_type": "CASH", "parameters": {}},
+                                         format="json")
+            with self.captureOnCommitCallbacks(execute=True):
+                second = self.client.post("/api/v1/reporting/create/", {"report_type": "CASH", "parameters": {}},
+                                          format="json")
+
+        self.assertEqual((first.status_code, first.data["cache"]), (202, "created"))
+        self.assertEqual((second.status_code, second.data["cache"]), (202, "in_flight"))
+        self.assertEqual(first.data["id"], second.data["id"])
+        build.delay.assert_called_once_with(first.data["id"])
+
+    def request(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post("/api/v1/reporting/create/", {"report_type": "CASH", "parameters": {}},
+                                    format="json")
+
+    @mock.patch("reporting.tasks.build_report")
+    def test_a_build_the_broker_refused_does_not_hold_the_key(self, build):
+        build.delay.side_effect = ConnectionRefusedError("broker down")
+        first = self.request()
+        self.assertEqual(first.status_code, 202)
+        job = ReportJob.objects.get(pk=first.data["id"])
+        self.assertEqual((job.status, job.cache_key), ("FAILED", None))
+
+        build.delay.side_effect = None
+        second = self.request()
+        self.assertEqual(second.data["cache"], "created")
+        self.assertNotEqual(second.data["id"], first.data["id"])
+
+
+class ReportListApiTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_superuser("boss", "b@x.com", "pw")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # Same created_at for all, so the cursor has to break ties on the id
+        now = timezone.now()
+        self.jobs = [ReportJob.objects.create(report_type="CASH" if i % 2 else "PNL") for i in range(5)]
+        ReportJob.objects.update(created_at=now)
+
+    def ids(self, response):
+        return [row["id"] for row in response.data["results"]]
+
+    def test_keyset_pages_cover_every_job_once(self):
+        seen, cursor = [], None
+        while True:
+            response = self.client.get("/api/v1/reporting/", {"page_size": 2, **({"cursor": cursor} if cursor else {})})
+            self.assertEqual(response.status_code, 200)
+            seen += self.ids(response)
+            cursor = response.data["next"]
+            if not cursor:
+                break
+        self.assertEqual(seen, [j.pk for j in reversed(self.jobs)])
+
+    def test_filters(self):
+        ReportJob.objects.filter(pk=self.jobs[0].pk).update(requested_by=self.user, status="COMPLETED")
+        self.assertEqual(self.ids(self.client.get("/api/v1/reporting/", {"requested_by": "me"})), [self.jobs[0].pk])
+        self.assertEqual(self.ids(self.client.get("/api/v1/reporting/", {"status": "COMPLETED,FAILED"})),
+                         [self.jobs[0].pk])
+        self.assertEqual(len(self.ids(self.client.get("/api/v1/reporting/", {"report_type": "CASH"}))), 2)
+        self.assertEqual(self.client.get("/api/v1/reporting/", {"requested_by": "x"}).status_code, 400)
+        self.assertEqual(self.client.get("/api/v1/reporting/", {"cursor": "junk"}).status_code, 400)
+
+    def test_unchanged_list_revalidates_with_304(self):
+        first = self.client.get("/api/v1/reporting/")
+        etag = first["ETag"]
+        again = self.client.get("/api/v1/reporting/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(again.status_code, 304)
+
+        ReportJob.objects.filter(pk=self.jobs[0].pk).update(status="FAILED", changed_at=timezone.now())
+        changed = self.client.get("/api/v1/reporting/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], etag)
+
+
+@override_settings(REDIS_URL="", REPORT_EVENTS_TIMEOUT=5)
+class ReportEventsApiTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_superuser("boss", "b@x.com", "pw"))
+        now = timezone.now()
+        self.old, self.new = (
+            ReportJob.objects.create(report_type="CASH", changed_at=now - timedelta(minutes=m)) for m in (10, 5)
+        )
+
+    def poll(self, **params):
+        return self.client.get("/api/v1/reporting/events/", params)
+
+    def test_without_since_returns_the_current_cursor(self):
+        response = self.poll()
+        self.assertEqual(response.data, {"cursor": self.new.changed_at.isoformat(), "jobs": []})
+
+    def test_returns_jobs_changed_after_the_cursor_and_the_next_one(self):
+        response = self.poll(since=self.old.changed_at.isoformat(), timeout=0)
+        self.assertEqual([j["id"] for j in response.data["jobs"]], [self.new.pk])
+        self.assertEqual(response.data["cursor"], self.new.changed_at.isoformat())
+
+    def test_timeout_without_changes_keeps_the_cursor(self):
+        since = self.new.changed_at.isoformat()
+        self.assertEqual(self.poll(since=since, timeout=0).data, {"cursor": since, "jobs": []})
+
+    def test_invalid_cursor_is_rejected(self):
+        self.assertEqual(self.poll(since="yesterday").status_code, 400)
+
+    @override_settings(REPORT_EVENTS_POLL_INTERVAL=30)
+    def test_publish_wakes_a_waiting_poll_in_the_same_process(self):
+        changed = threading.Event()
+
+        def change():
+            time.sleep(0.2)
+            changed.set()
+            events.publish(self.new.pk)
+
+        since = self.new.changed_at
+        with mock.patch.object(events, "changed_since", lambda _since: [self.new] if changed.is_set() else []):
+            threading.Thread(target=change).start()
+            started = time.monotonic()
+            jobs = events.wait_for_changes(since, timeout=5)
+
+        self.assertEqual(jobs, [self.new])
+        self.assertLess(time.monotonic() - started, 2)
+
+
+class FieldResolutionTests(TestCase):
+    def test_roles_resolve_against_model_fields(self):
+        self.assertEqual(utils.resolve_field(StudentDocument, "expires"), "expiration_date")
+        self.assertEqual(utils.resolve_field(Item, "quantity"), "quantity")
+        self.assertEqual(utils.resolve_field(Item, "cost"), "unit_price")
+        self.assertIsNone(utils.resolve_field(StudentDocument, "title"))
+        self.assertEqual(utils._name_parts(Staff), ("first_name", "last_name"))
+
+    def test_expiring_documents_are_projected_in_sql(self):
+        from openpyxl import load_workbook
+
+        soon = date.today() + timedelta(days=5)
+        staff = make_staff(1, first_name="Amal", last_name="Z")
+        StaffDocument.objects.create(staff=staff, doc_type="ID", file="a.pdf", issue_date=date(2020, 1, 1),
+                                     expiration_date=soon)
+        StaffDocument.objects.create(staff=staff, doc_type="OTHER", file="b.pdf", issue_date=date(2020, 1, 1),
+                                     expiration_date=date.today() + timedelta(days=90))
+        student = make_student(1, first_name="Bea", last_name="Y")
+        StudentDocument.objects.create(student=student, doc_type="PASSPORT", file="c.pdf", expiration_date=soon)
+
+        with self.assertNumQueries(2):
+            out = utils.generate_expiring_docs_excel(days_ahead=30)
+
+        self.assertEqual(list(load_workbook(out).active.values)[1:], [
+            ("Amal Z", "Staff", "ID", mock.ANY),
+            ("Bea Y", "Student", "PASSPORT", mock.ANY),
+        ])
+
+    def test_inventory_valuation_multiplies_in_sql(self):
+        from openpyxl import load_workbook
+
+        Item.objects.create(name="Ball", sku="B-1", category="TOY", unit_price=Decimal("2.50"), quantity=4)
+        Item.objects.create(name="Atlas", sku="A-1", category="BOOK", unit_price=Decimal("10.00"), quantity=0)
+
+        rows = list(load_workbook(utils.generate_inventory_valuation()).active.values)
+        self.assertEqual(rows, [("Item", "Qty", "Cost", "Value"), ("Atlas", 0, 10, 0), ("Ball", 4, 2.5, 10)])
+
+
+@skipUnless(utils.WEASY and utils.CAN_MERGE, "needs WeasyPrint and pypdf")
+@override_settings(PDF_POOL_WORKERS=0, REPORT_PDF_CHUNK_ROWS=2, MEDIA_ROOT=tempfile.mkdtemp())
+class PartitionedBuildTests(TestCase):
+    def setUp(self):
+        treasury = Treasury.objects.create(name="Main", balance=Decimal("0.00"))
+        invoice = make_invoice(make_student(), amount="5000.00")
+        for day in (date(2025, 3, 3), date(2025, 3, 4), date(2025, 3, 5), date(2025, 5, 9)):
+            Payment.objects.create(invoice=invoice, amount=Decimal("10.00"), treasury=treasury, date=day)
+        self.job = ReportJob.objects.create(report_type="CASH", status="IN_PROGRESS",
+                                            parameters={"start": "2025-03-01", "end": "2025-05-31"})
+
+    def build_partitions(self):
+        partitions = utils.CASH_FLOW_PARTITIONS.partitions(**self.job.parameters)
+        return [
+            tasks.build_report_partition(self.job.pk, part, index=i, last=i == len(partitions) - 1)
+            for i, part in enumerate(partitions)
+        ]
+
+    def test_partitions_store_their_parts_and_return_only_summaries(self):
+        with mock.patch.object(utils, "_cash_flow_html", wraps=utils._cash_flow_html) as html:
+            partials = self.build_partitions()
+
+        # Title on the first slice, totals on the last; the empty April slice renders nothing.
+        self.assertEqual([p["summary"] for p in partials], [{"count": 3}, {"count": 0}, {"count": 1}])
+        self.assertIsNone(partials[1]["part"])
+        self.assertEqual([c.args[1:] for c in html.call_args_list], [(True, False), (False, False), (False, True)])
+        self.assertEqual(html.call_args_list[-1].kwargs["totals"]["count"], 4)
+        for p in (partials[0], partials[2]):
+            self.assertTrue(default_storage.exists(p["part"]))
+
+        tasks.merge_report_partitions(partials, self.job.pk)
+
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, "COMPLETED")
+        with self.job.file.open("rb") as fh:
+            self.assertTrue(fh.read().startswith(b"%PDF"))
+        self.assertEqual(default_storage.listdir(tasks._parts_dir(self.job.pk))[1], [])
+
+    def test_empty_report_completes_without_a_file(self):
+        self.job.parameters = {"start": "2024-01-01", "end": "2024-02-29"}
+        self.job.save()
+        tasks.merge_report_partitions(self.build_partitions(), self.job.pk)
+
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, "COMPLETED")
+        self.assertFalse(self.job.file)
+
+    def test_eviction_sweeps_parts_of_finished_builds_only(self):
+        self.build_partitions()
+        done = ReportJob.objects.create(report_type="CASH", status="FAILED")
+        default_storage.save(f"{tasks._parts_dir(done.pk)}/00000.pdf", ContentFile(b"%PDF"))
+
+        tasks.evict_report_cache()
+
+        self.assertEqual(default_storage.listdir(tasks._parts_dir(done.pk))[1], [])
+        self.assertEqual(len(default_storage.listdir(tasks._parts_dir(self.job.pk))[1]), 2)
+
+
+class CancellationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_superuser("boss", "b@x.com", "pw"))
+
+    def cancel(self, job):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(f"/api/v1/reporting/{job.pk}/cancel/")
+
+    def test_queued_job_is_cancelled_outright_and_skipped_by_the_worker(self):
+        job = ReportJob.objects.create(report_type="LOW_STOCK", cache_key="k")
+        self.assertEqual(self.cancel(job).status_code, 202)
+
+        builder = mock.Mock()
+        with mock.patch.dict(tasks.REPORT_BUILDERS, {"LOW_STOCK": builder}):
+            tasks.build_report(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.cache_key), ("CANCELLED", None))
+        builder.assert_not_called()
+
+    def test_running_build_stops_at_its_next_progress_check(self):
+        job = ReportJob.objects.create(report_type="LOW_STOCK")
+
+        def builder(progress, **kwargs):
+            self.assertEqual(self.cancel(ReportJob.objects.get(pk=job.pk)).status_code, 202)
+            list(progress.track(range(3)))
+            progress.flush()
+
+        with mock.patch.dict(tasks.REPORT_BUILDERS, {"LOW_STOCK": builder}):
+            tasks.build_report(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), ("CANCELLED", "Cancelled by user."))
+        self.assertFalse(job.file)
+
+    def test_progress_raises_once_cancelled(self):
+        job = ReportJob.objects.create(report_type="LOW_STOCK", status="IN_PROGRESS")
+        with self.assertRaises(ReportCancelled), JobProgress(job.pk) as progress:
+            progress.step(5)
+            ReportJob.objects.filter(pk=job.pk).update(cancel_requested_at=timezone.now())
+            progress.flush()
+        # Writes are conditional on the job still being live
+        self.assertEqual(ReportJob.objects.get(pk=job.pk).rows_processed, 0)
+
+    def test_finished_job_cannot_be_cancelled(self):
+        job = ReportJob.objects.create(report_type="LOW_STOCK", status="COMPLETED")
+        self.assertEqual(self.cancel(job).status_code, 409)
+
+
+class ProgressPushTests(TestCase):
+    @override_settings(REPORT_PROGRESS_PUSH_INTERVAL=60)
+    @mock.patch("reporting.progress.events.publish")
+    def test_row_counts_alone_do_not_wake_job_lists(self, publish):
+        job = ReportJob.objects.create(report_type="CASH", status="IN_PROGRESS")
+        with JobProgress(job.pk) as progress:
+            progress.phase("rows", total=10)
+            pushed = ReportJob.objects.get(pk=job.pk).changed_at
+            progress.step(4)
+            progress.flush()
+
+            job.refresh_from_db()
+            self.assertEqual((job.rows_processed, job.changed_at), (4, pushed))
+            self.assertEqual(publish.call_count, 1)
+
+            progress.phase("saving")
+        job.refresh_from_db()
+        self.assertGreater(job.changed_at, pushed)
+        self.assertEqual(publish.call_count, 2)
+
+
+class ReaperTests(TestCase):
+    def job(self, age, **fields):
+        ago = timezone.now() - timedelta(seconds=age)
+        return ReportJob.objects.create(report_type="CASH", status="IN_PROGRESS", heartbeat_at=ago, **fields)
+
+    @mock.patch("reporting.tasks.revoke_builds")
+    def test_stale_and_stuck_jobs_are_stopped(self, revoke):
+        alive = self.job(5, task_id="alive")
+        stale = self.job(120, task_id="stale")
+        stuck = self.job(5, task_id="stuck", cancel_requested_at=timezone.now() - timedelta(seconds=60))
+        fanned_out = self.job(120, task_id="fanned", phase="partitions")
+
+        tasks.reap_report_jobs()
+
+        status = dict(ReportJob.objects.values_list("task_id", "status"))
+        self.assertEqual(status, {"alive": "IN_PROGRESS", "stale": "FAILED", "stuck": "CANCELLED",
+                                  "fanned": "IN_PROGRESS"})
+        self.assertEqual(sorted(revoke.call_args.args[0]), ["stale", "stuck"])
+        self.assertTrue(revoke.call_args.kwargs["terminate"])
+        self.assertEqual(ReportJob.objects.get(pk=stale.pk).error, "Report worker stopped responding.")
+        for job in (alive, fanned_out):
+            self.assertIsNone(ReportJob.objects.get(pk=job.pk).error)
+
+    def test_jobs_never_picked_up_are_failed_and_free_their_key(self):
+        key = cache.cache_key("CASH", {})
+        lost = ReportJob.objects.create(report_type="CASH", cache_key=key)
+        ReportJob.objects.filter(pk=lost.pk).update(created_at=timezone.now() - timedelta(hours=2))
+        queued = ReportJob.objects.create(report_type="CASH", cache_key="other")
+
+        with override_settings(REPORT_QUEUE_TIMEOUT=3600):
+            tasks.reap_report_jobs()
+
+        lost.refresh_from_db()
+        self.assertEqual((lost.status, lost.cache_key), ("FAILED", None))
+        self.assertEqual(ReportJob.objects.get(pk=queued.pk).status, "PENDING")
+        job, outcome = cache.find_or_create_job("CASH", {})
+        self.assertEqual(outcome, "created")
@@ -1,7 +1,8 @@
 # reporting/urls.py
 from django.urls import path
 from .api.views import (
-    ReportRequestView, ReportDetailView, ReportDownloadView, ReportListView
+    ReportRequestView, ReportDetailView, ReportDownloadView, ReportListView, ReportCancelView,
+    ReportEventsView,
 )
 from .views import ReportEmailView
 
@@ -9,7 +10,9 @@ urlpatterns = [
     # Core job lifecycle
     path("", ReportListView.as_view(), name="report_list"),
     path("create/", ReportRequestView.as_view(), name="report_create"),
+    path("events/", ReportEventsView.as_view(), name="report_events"),
     path("<int:job_id>/", ReportDetailView.as_view(), name="report_detail"),
+    path("<int:job_id>/cancel/", ReportCancelView.as_view(), name="report_cancel"),
     path("<int:job_id>/download/", ReportDownloadView.as_view(), name="report_download"),
 
     # Optional: email a generated report file
@@ -1,310 +1,645 @@
 from __future__ import annotations
 
-from collections import defaultdict
-from io import BytesIO
-from typing import Any, Iterable, Optional
+import heapq
+import tempfile
+import zipfile
+from functools import lru_cache, partial
+from decimal import Decimal
+from io import StringIO
+from itertools import chain, islice
+from operator import itemgetter
+from typing import Any, Callable, Iterable, Iterator, NamedTuple, Optional
 from datetime import date, datetime, timedelta
 
-import pandas as pd
 from django.conf import settings
-from django.core.files.base import ContentFile
+from django.core.files.base import ContentFile, File
 from django.apps import apps
+from django.template.loader import get_template, render_to_string
+from django.utils import timezone
+from django.db.models import (
+    Case, CharField, Count, DateField, DecimalField, DurationField, ExpressionWrapper,
+    F, OuterRef, Q, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Abs, Cast, Coalesce, Concat, NullIf, TruncMonth, TruncQuarter, TruncYear
 
-# Optional PDF engine
-try:
-    from weasyprint import HTML
-    WEASY = True
-except Exception:
-    WEASY = False
+from core.pdf import AVAILABLE as WEASY, CAN_MERGE, merge_pdfs, render_pdf, render_stream  # optional PDF engine
+
+from . import memo
+from .progress import JobProgress, track
 
 
 # ---------- helpers ----------
+# Rows are pulled from the database in chunks of this size when streaming.
+ITERATOR_CHUNK_SIZE = 2000
+
+ZERO = Decimal("0.00")
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+
 def get_model(app_label: str, model_name: str):
     try:
         return apps.get_model(app_label, model_name)
     except Exception:
         return None
 
-def first_attr(obj: Any, names: Iterable[str], default=None):
-    for n in names:
-        if hasattr(obj, n):
-            v = getattr(obj, n)
-            if v is not None:
-                return v
-    return default
-
-def first_related(obj: Any, names: Iterable[str]):
-    for n in names:
-        if hasattr(obj, n):
-            return getattr(obj, n)
-    return None
+# ---------- field resolution ----------
+# Candidate field names per role, in order of preference. Builders resolve a
+# role against Model._meta once (cached per model) and project it in SQL, so
+# rows arrive as plain tuples with no per-row hasattr/getattr probing.
+FIELD_CANDIDATES = {
+    "title":     ("name", "title", "doc_name"),
+    "doc_type":  ("doc_type", "type", "category"),
+    "expires":   ("expiration_date", "expiry_date", "expire_on", "valid_to", "end_date"),
+    "label":     ("name", "title", "label"),
+    "quantity":  ("quantity", "qty", "stock", "on_hand"),
+    "cost":      ("cost", "unit_cost", "purchase_price", "unit_price"),
+    "amount":    ("amount", "total", "grand_total"),
+    "reference": ("reference", "ref", "code"),
+    "date":      ("date", "created", "created_at", "paid_at", "issued_at", "due_date"),
+}
 
-def person_name(p):
-    if not p:
-        return ""
-    return (
-        first_attr(p, ["name"])
-        or " ".join([first_attr(p, ["first_name", "given_name"], ""), first_attr(p, ["last_name", "family_name"], "")]).strip()
-        or first_attr(p, ["username"])
-        or str(p)
-    )
 
-def _coerce_date(obj) -> Optional[date]:
-    for f in ["date", "created", "created_at", "paid_at", "issued_at", "due_date"]:
-        if hasattr(obj, f) and getattr(obj, f):
-            v = getattr(obj, f)
-            return v.date() if isinstance(v, datetime) else v
-    return None
+@lru_cache(maxsize=None)
+def _concrete_fields(model) -> frozenset:
+    return frozenset(f.name for f in model._meta.get_fields() if f.concrete)
+
+
+@lru_cache(maxsize=None)
+def resolve_field(model, role: str) -> Optional[str]:
+    """Name of the first concrete field of `model` matching `role`, or None."""
+    fields = _concrete_fields(model)
+    return next((n for n in FIELD_CANDIDATES[role] if n in fields), None)
+
+
+def field_expr(model, role: str, default=None, prefix: str = ""):
+    """F() for the resolved field, or a constant when the model has none."""
+    name = resolve_field(model, role)
+    if name:
+        return F(f"{prefix}{name}")
+    return Value(default)
+
+
+@lru_cache(maxsize=None)
+def _name_parts(model) -> tuple:
+    fields = _concrete_fields(model)
+    if "name" in fields:
+        return ("name",)
+    first = next((n for n in ("first_name", "given_name") if n in fields), None)
+    last = next((n for n in ("last_name", "family_name") if n in fields), None)
+    parts = tuple(n for n in (first, last) if n)
+    return parts or (("username",) if "username" in fields else ())
+
+
+def person_name_expr(model, prefix: str = ""):
+    """SQL expression for a person's display name (name, or first + last)."""
+    parts = _name_parts(model)
+    if not parts:
+        return Value("")
+    if len(parts) == 1:
+        return Coalesce(F(f"{prefix}{parts[0]}"), Value(""))
+    return Concat(F(f"{prefix}{parts[0]}"), Value(" "), F(f"{prefix}{parts[1]}"))
+
+
+def document_title_expr(model):
+    """Document title falling back to its type, both resolved once per model."""
+    title, doc_type = resolve_field(model, "title"), resolve_field(model, "doc_type")
+    if title and doc_type:
+        return Coalesce(NullIf(title, Value("")), doc_type, Value(""))
+    return Coalesce(F(title or doc_type), Value("")) if (title or doc_type) else Value("")
+
+
+# ---------- Streaming Excel writer ----------
+# Workbooks stay in memory up to this size, then spill to a temp file.
+XLSX_SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+
+def write_xlsx(rows: Iterable[Iterable[Any]], headers: Iterable[str], sheet_name: str, filename: str):
+    """
+    Streams `rows` (typically a queryset .iterator()) into an openpyxl
+    write-only workbook saved to a spooled temp file. Returns a File that
+    can go straight to job.file.save, or None when there were no rows.
+    Memory use is bounded regardless of the row count.
+    """
+    # Peek first: a write-only workbook that is never saved leaves its row
+    # writer pending, which fails noisily when the workbook is discarded.
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return None
+
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=sheet_name[:31])
+    ws.append(list(headers))
+    for row in chain([first], rows):
+        ws.append(list(row))
+
+    out = tempfile.SpooledTemporaryFile(max_size=XLSX_SPOOL_MAX_BYTES)
+    wb.save(out)
+    out.seek(0)
+    return File(out, name=filename)
+
+
+# ---------- Paged PDF writer ----------
+def _chunks(rows: Iterable, size: int) -> Iterator[tuple[list, bool, bool]]:
+    """Splits rows into lists of `size`, flagging the first and the last one."""
+    it = iter(rows)
+    chunk, first = list(islice(it, size)), True
+    while chunk:
+        following = list(islice(it, size))
+        yield chunk, first, not following
+        chunk, first = following, False
+
+
+def render_paged(rows: Iterable, chunk_html: Callable[[list, bool, bool], str], pdf_name: str, html_name: str):
+    """
+    Renders a long table as independent documents of REPORT_PDF_CHUNK_ROWS
+    rows each (spread over the PDF pool), merged into one PDF with
+    continuous page numbers, so layout memory is bounded by the chunk size.
+    `chunk_html(rows, first, last)` returns a complete document: title on
+    the first chunk, totals on the last, the table header on every one.
+    Returns None when there are no rows.
+    """
+    if not (WEASY and CAN_MERGE):
+        rows = list(rows)
+        if not rows:
+            return None
+        html = chunk_html(rows, True, True)
+        if not WEASY:
+            return ContentFile(html.encode(), name=html_name)
+        return ContentFile(render_pdf(html), name=pdf_name)
+
+    size = getattr(settings, "REPORT_PDF_CHUNK_ROWS", 1000)
+    parts = render_stream((chunk_html(c, first, last), ()) for c, first, last in _chunks(rows, size))
+    head = next(parts, None)
+    if head is None:
+        return None
+    return ContentFile(merge_pdfs(chain([head], parts), number_pages=True), name=pdf_name)
 
 
 # ---------- A) Expiring Documents (Excel) ----------
-def _date_attr(model, candidates):
-    for n in candidates:
-        if hasattr(model, n):
-            return n
-    return None
+def _expiring_doc_rows(model, owner: str, label: str, cutoff: date):
+    expires = resolve_field(model, "expires")
+    qs = model.objects.all()
+    if expires:
+        qs = qs.filter(**{f"{expires}__lte": cutoff})
+    owner_model = model._meta.get_field(owner).related_model
+    return (
+        qs.annotate(
+            _owner=person_name_expr(owner_model, prefix=f"{owner}__"),
+            _type=Value(label),
+            _document=document_title_expr(model),
+            _expires=F(expires) if expires else Value(None, output_field=DateField()),
+        )
+        .order_by("_owner", F("_expires").asc(nulls_last=True), "pk")
+        .values_list("_owner", "_type", "_document", "_expires")
+        .iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+    )
 
-def generate_expiring_docs_excel(days_ahead: int = 30, **kwargs):
+def generate_expiring_docs_excel(days_ahead: int = 30, progress: Optional[JobProgress] = None, **kwargs):
     StudentDocument = get_model("student", "StudentDocument")
     StaffDocument   = get_model("hr", "StaffDocument")
 
     cutoff = date.today() + timedelta(days=int(days_ahead or 30))
-    rows = []
-
-    if StudentDocument:
-        date_field = _date_attr(StudentDocument, ["expiration_date", "expiry_date", "expire_on", "valid_to", "end_date"])
-        name_field = _date_attr(StudentDocument, ["name", "title", "doc_name"])
-        type_field = _date_attr(StudentDocument, ["doc_type", "type", "category"])
-        qs = StudentDocument.objects.all()
-        if date_field:
-            qs = qs.filter(**{f"{date_field}__lte": cutoff})
-        for d in qs.select_related("student"):
-            rows.append({
-                "Owner": person_name(getattr(d, "student", None)),
-                "Type": "Student",
-                "Document": getattr(d, name_field, None) or getattr(d, type_field, ""),
-                "Expires On": getattr(d, date_field, None),
-            })
 
+    # Sorted by Type, Owner, Expires On: each source is ordered in SQL and
+    # "Staff" sorts before "Student", so the streams are simply chained.
+    sources = []
     if StaffDocument:
-        date_field = _date_attr(StaffDocument, ["expiration_date", "expiry_date", "expire_on", "valid_to", "end_date"])
-        name_field = _date_attr(StaffDocument, ["name", "title", "doc_name"])
-        type_field = _date_attr(StaffDocument, ["doc_type", "type", "category"])
-        qs = StaffDocument.objects.all()
-        if date_field:
-            qs = qs.filter(**{f"{date_field}__lte": cutoff})
-        for d in qs.select_related("staff"):
-            rows.append({
-                "Owner": person_name(getattr(d, "staff", None)),
-                "Type": "Staff",
-                "Document": getattr(d, name_field, None) or getattr(d, type_field, ""),
-                "Expires On": getattr(d, date_field, None),
-            })
-
-    if not rows:
-        return None
+        sources.append(_expiring_doc_rows(StaffDocument, "staff", "Staff", cutoff))
+    if StudentDocument:
+        sources.append(_expiring_doc_rows(StudentDocument, "student", "Student", cutoff))
 
-    df = pd.DataFrame(rows).sort_values(["Type", "Owner", "Expires On"], na_position="last")
-    buf = BytesIO()
-    with pd.ExcelWriter(buf, engine="openpyxl") as w:
-        df.to_excel(w, index=False, sheet_name="Expiring Documents")
-    return ContentFile(buf.getvalue(), name=f"expiring_docs_{int(days_ahead)}d.xlsx")
+    return write_xlsx(
+        track(chain.from_iterable(sources), progress),
+        ["Owner", "Type", "Document", "Expires On"],
+        "Expiring Documents",
+        f"expiring_docs_{int(days_ahead or 30)}d.xlsx",
+    )
 
 
 # ---------- B) Enrollment Summary (PDF) ----------
-def generate_enroll_summary_pdf(**kwargs):
+ENROLL_BREAKDOWNS = ("enrollment_status", "gender", "is_active")
+
+
+def _breakdown_columns(model, fields):
+    """(field, value, label) for every choice of every requested breakdown field."""
+    cols = []
+    for name in fields:
+        field = model._meta.get_field(name)
+        choices = field.choices or ([(True, "Is Active"), (False, "Not Active")] if name == "is_active" else [])
+        cols.extend((name, value, label) for value, label in choices)
+    return cols
+
+
+def enrollment_summary(breakdown: Optional[Iterable[str]] = ENROLL_BREAKDOWNS):
+    """
+    One GROUP BY classroom query; every breakdown bucket is a filtered Count
+    in the same SELECT, so the summary costs a single round trip.
+    Returns (columns, rows) where each row is {"group", "count", <col keys>...}.
+    """
     Student = get_model("student", "Student")
     if not Student:
-        return None
+        return [], []
+
+    if isinstance(breakdown, str):
+        breakdown = [b.strip() for b in breakdown.split(",") if b.strip()]
+    fields = [b for b in (breakdown or []) if b in ENROLL_BREAKDOWNS]
+    columns = _breakdown_columns(Student, fields)
 
-    groups = defaultdict(int)
-    for s in Student.objects.all():
-        key = first_attr(s, ["classroom", "room", "level", "grade", "group"])
-        label = getattr(key, "name", None) or str(key) if key else "All Students"
-        groups[label] += 1
+    annotations = {"count": Count("id")}
+    for i, (name, value, _label) in enumerate(columns):
+        annotations[f"c{i}"] = Count("id", filter=Q(**{name: value}))
 
+    rows = list(
+        Student.objects.values("classroom__name")
+        .annotate(**annotations)
+        .order_by(F("classroom__name").asc(nulls_last=True))
+    )
+    for r in rows:
+        r["group"] = r.pop("classroom__name") or "Unassigned"
+    return columns, rows
+
+
+def generate_enroll_summary_pdf(breakdown=ENROLL_BREAKDOWNS, **kwargs):
+    columns, groups = enrollment_summary(breakdown)
     if not groups:
         return None
 
+    th = 'style="text-align:right;border-bottom:1px solid #ddd;padding:6px 10px;"'
+    td = 'style="padding:6px 10px;text-align:right;"'
+    head = "".join(f"<th {th}>{label}</th>" for _n, _v, label in columns)
     rows = "\n".join(
-        f'<tr><td style="padding:6px 10px;">{grp}</td><td style="padding:6px 10px;text-align:right;">{cnt}</td></tr>'
-        for grp, cnt in sorted(groups.items())
+        f'<tr><td style="padding:6px 10px;">{r["group"]}</td><td {td}>{r["count"]}</td>'
+        + "".join(f"<td {td}>{r[f'c{i}']}</td>" for i in range(len(columns)))
+        + "</tr>"
+        for r in groups
+    )
+    totals = (
+        f'<tr><th style="text-align:left;padding:6px 10px;">Total</th><th {th}>{sum(r["count"] for r in groups)}</th>'
+        + "".join(f"<th {th}>{sum(r[f'c{i}'] for r in groups)}</th>" for i in range(len(columns)))
+        + "</tr>"
     )
     html = f"""
     <html><body>
       <h2 style="margin:0 0 8px 0;">Enrollment Summary</h2>
       <table style="border-collapse:collapse;font-family:system-ui,Segoe UI,Roboto,sans-serif;">
         <thead><tr><th style="text-align:left;border-bottom:1px solid #ddd;padding:6px 10px;">Group</th>
-        <th style="text-align:right;border-bottom:1px solid #ddd;padding:6px 10px;">Count</th></tr></thead>
+        <th {th}>Count</th>{head}</tr></thead>
         <tbody>{rows}</tbody>
+        <tfoot>{totals}</tfoot>
       </table>
     </body></html>
     """
     if not WEASY:
         return ContentFile(html.encode(), name="enrollment_summary.html")
-    pdf = HTML(string=html, base_url=str(settings.BASE_DIR)).write_pdf()
+    pdf = render_pdf(html)
     return ContentFile(pdf, name="enrollment_summary.pdf")
 
 
 # ---------- C) Cash Flow (PDF) ----------
-def generate_cash_flow_pdf(start: Optional[str|date]=None, end: Optional[str|date]=None, **kwargs):
+def _as_date(value, default: date) -> date:
+    if isinstance(value, str):
+        return date.fromisoformat(value)
+    if isinstance(value, datetime):
+        return value.date()
+    return value or default
+
+
+def cash_flow_entries(start: date, end: date):
+    """
+    Cash flow engine: everything is filtered, signed and summed in SQL.
+
+    Returns (rows, totals) where `rows` is a lazy, date-ordered iterator of
+    (date, reference, signed_amount, "IN"/"OUT") tuples merged from one
+    values-projected query per source, and `totals` holds count/total_in/
+    total_out/net computed with Sum. Memory stays flat for any window size.
+    """
     Payment = get_model("finance", "Payment")
     Expense = get_model("finance", "Expense")
 
-    if isinstance(start, str): start = date.fromisoformat(start)
-    if isinstance(end, str):   end   = date.fromisoformat(end)
-    start = start or date.today().replace(day=1)
-    end   = end or date.today()
+    sources = []
+    totals = {"count": 0, "total_in": ZERO, "total_out": ZERO}
 
-    rows = []
     if Payment:
-        for p in Payment.objects.all():
-            d = _coerce_date(p)
-            if d and start <= d <= end:
-                amt = float(first_attr(p, ["amount", "paid", "total_paid"], 0) or 0)
-                rows.append({"date": d, "ref": f"PAY-{p.id}", "amount": amt, "type": "IN"})
+        qs = Payment.objects.filter(date__range=(start, end))
+        agg = qs.aggregate(n=Count("id"), total=Sum("amount"))
+        totals["count"] += agg["n"]
+        totals["total_in"] = agg["total"] or ZERO
+        sources.append(
+            qs.annotate(
+                ref=Concat(Value("PAY-"), Cast("id", output_field=CharField())),
+                signed=F("amount"),
+                kind=Value("IN"),
+            )
+            .order_by("date", "id")
+            .values_list("date", "ref", "signed", "kind")
+            .iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+        )
+
     if Expense:
-        for e in Expense.objects.all():
-            d = _coerce_date(e)
-            if d and start <= d <= end:
-                amt = float(first_attr(e, ["amount", "total", "grand_total"], 0) or 0)
-                ref = first_attr(e, ["reference", "ref", "code"], f"EXP-{e.id}")
-                rows.append({"date": d, "ref": ref, "amount": -abs(amt), "type": "OUT"})
-
-    if not rows:
+        qs = Expense.objects.filter(date__range=(start, end))
+        agg = qs.aggregate(n=Count("id"), total=Sum(Abs("amount")))
+        totals["count"] += agg["n"]
+        totals["total_out"] = agg["total"] or ZERO
+        sources.append(
+            qs.annotate(
+                ref=Coalesce(
+                    NullIf("reference", Value("")),
+                    Concat(Value("EXP-"), Cast("id", output_field=CharField())),
+                ),
+                signed=ExpressionWrapper(-Abs("amount"), output_field=DecimalField()),
+                kind=Value("OUT"),
+            )
+            .order_by("date", "id")
+            .values_list("date", "ref", "signed", "kind")
+            .iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+        )
+
+    totals["net"] = totals["total_in"] - totals["total_out"]
+    rows: Iterator[tuple] = heapq.merge(*sources, key=itemgetter(0))
+    return rows, totals
+
+
+# Bump the version when the memoized row or summary format changes.
+CASH_MEMO_KEY = "CASH:v1"
+CASH_SOURCES = (("finance", "Payment", "date"), ("finance", "Expense", "date"))
+
+
+def _cash_flow_month(first: date, last: date):
+    rows, totals = cash_flow_entries(first, last)
+    return (
+        {k: str(v) for k, v in totals.items()},
+        [[d.isoformat(), ref, str(amount), kind] for d, ref, amount, kind in rows],
+    )
+
+
+def _cash_flow_row_totals(rows: list) -> dict:
+    total_in = sum((Decimal(a) for _d, _r, a, kind in rows if kind == "IN"), ZERO)
+    total_out = sum((-Decimal(a) for _d, _r, a, kind in rows if kind == "OUT"), ZERO)
+    return {"count": len(rows), "total_in": total_in, "total_out": total_out}
+
+
+def cash_flow_memoized(start: date, end: date):
+    """
+    Same (rows, totals) as cash_flow_entries, assembled from per-month
+    blocks: closed months are read from the period memo, the open month and
+    invalidated months are recomputed, edge months are sliced to the range.
+    """
+    totals = {"count": 0, "total_in": ZERO, "total_out": ZERO}
+    loaders = []
+    for block in memo.monthly(CASH_MEMO_KEY, start, end, CASH_SOURCES, _cash_flow_month):
+        if block.month < start or block.end > end:
+            lo, hi = start.isoformat(), end.isoformat()
+            rows = [r for r in block.load_rows() if lo <= r[0] <= hi]
+            part = _cash_flow_row_totals(rows)
+            loaders.append(lambda rows=rows: rows)
+        else:
+            part = block.summary
+            if int(part["count"]):
+                loaders.append(block.load_rows)
+        totals["count"] += int(part["count"])
+        totals["total_in"] += Decimal(part["total_in"])
+        totals["total_out"] += Decimal(part["total_out"])
+    totals["net"] = totals["total_in"] - totals["total_out"]
+
+    # Month blocks are disjoint and date-ordered, so chaining keeps the order.
+    rows = (
+        (date.fromisoformat(d), ref, Decimal(amount), kind)
+        for load in loaders for d, ref, amount, kind in load()
+    )
+    return rows, totals
+
+
+def _cash_flow_window(start, end) -> tuple[date, date]:
+    return _as_date(start, date.today().replace(day=1)), _as_date(end, date.today())
+
+
+def generate_cash_flow_pdf(start: Optional[str|date]=None, end: Optional[str|date]=None,
+                           progress: Optional[JobProgress] = None, **kwargs):
+    start, end = _cash_flow_window(start, end)
+    rows, totals = cash_flow_memoized(start, end)
+    if not totals["count"]:
         return None
+    if progress:
+        progress.phase("rows", total=totals["count"])
+    return _render_cash_flow(start, end, track(rows, progress), totals)
 
-    rows.sort(key=lambda r: r["date"])
-    total_in  = sum(r["amount"] for r in rows if r["type"] == "IN")
-    total_out = -sum(r["amount"] for r in rows if r["type"] == "OUT")
-    net = total_in - total_out
 
-    body = "\n".join(
-        f'<tr><td style="padding:6px 10px;">{r["date"].strftime("%b %d, %Y")}</td>'
-        f'<td style="padding:6px 10px;">{r["ref"]}</td>'
-        f'<td style="padding:6px 10px;text-align:right;">{r["amount"]:.2f}</td></tr>'
-        for r in rows
+def _render_cash_flow(start: date, end: date, rows: Iterable[tuple], totals: dict):
+    return render_paged(
+        rows, partial(_cash_flow_html, start=start, end=end, totals=totals),
+        pdf_name=f"cash_flow_{start}_{end}.pdf", html_name="cash_flow.html",
     )
-    html = f"""
+
+
+def _cash_flow_html(rows: Iterable[tuple], first: bool, last: bool, *, start: date, end: date, totals: dict) -> str:
+    # Rows are written straight from the cursors into the document buffer.
+    body = StringIO()
+    for d, ref, amount, _kind in rows:
+        body.write(
+            f'<tr><td style="padding:6px 10px;">{d.strftime("%b %d, %Y")}</td>'
+            f'<td style="padding:6px 10px;">{ref}</td>'
+            f'<td style="padding:6px 10px;text-align:right;">{amount:.2f}</td></tr>\n'
+        )
+
+    title = f'<h2 style="margin:0 0 8px 0;">Cash Flow ({start} to {end})</h2>' if first else ""
+    summary = f"""
+      <hr/>
+      <p style="font-family:system-ui,Segoe UI,Roboto,sans-serif;">
+        <strong>Total In:</strong> {totals["total_in"]:.2f} &nbsp;&nbsp;
+        <strong>Total Out:</strong> {totals["total_out"]:.2f} &nbsp;&nbsp;
+        <strong>Net:</strong> {totals["net"]:.2f}
+      </p>""" if last else ""
+    return f"""
     <html><body>
-      <h2 style="margin:0 0 8px 0;">Cash Flow ({start} to {end})</h2>
+      {title}
       <table style="border-collapse:collapse;font-family:system-ui,Segoe UI,Roboto,sans-serif;">
         <thead><tr><th style="text-align:left;border-bottom:1px solid #ddd;padding:6px 10px;">Date</th>
         <th style="text-align:left;border-bottom:1px solid #ddd;padding:6px 10px;">Reference</th>
         <th style="text-align:right;border-bottom:1px solid #ddd;padding:6px 10px;">Amount</th></tr></thead>
-        <tbody>{body}</tbody>
-      </table>
-      <hr/>
-      <p style="font-family:system-ui,Segoe UI,Roboto,sans-serif;">
-        <strong>Total In:</strong> {total_in:.2f} &nbsp;&nbsp;
-        <strong>Total Out:</strong> {total_out:.2f} &nbsp;&nbsp;
-        <strong>Net:</strong> {net:.2f}
-      </p>
+        <tbody>{body.getvalue()}</tbody>
+      </table>{summary}
     </body></html>
     """
-    if not WEASY:
-        return ContentFile(html.encode(), name="cash_flow.html")
-    pdf = HTML(string=html, base_url=str(settings.BASE_DIR)).write_pdf()
-    return ContentFile(pdf, name=f"cash_flow_{start}_{end}.pdf")
-
-
-# ---------- D) AP Aging (PDF) ----------
-def generate_ap_aging_pdf(**kwargs):
-    VendorBill = (
-        get_model("finance", "VendorBill")
-        or get_model("inventory", "VendorBill")
-        or get_model("purchase", "VendorBill")
-        or get_model("finance", "SupplierBill")
-        or get_model("finance", "Bill")
+
+
+# ---------- D) Aging engine + AP Aging (PDF) ----------
+# (key, label, lower bound in days overdue); the first bucket also holds
+# balances that are not yet due.
+AGING_BUCKETS = (
+    ("b0_30", "0-30", 0),
+    ("b31_60", "31-60", 31),
+    ("b61_90", "61-90", 61),
+    ("b90p", "90+", 91),
+)
+
+def _paid_subquery(model, fk: str, amount: str = "amount", **filters):
+    """Correlated SUM(amount) of `model` rows pointing at the outer row through `fk` (narrowed by `filters`)."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{fk: OuterRef("pk")}, **filters)
+            .order_by()
+            .values(fk)
+            .annotate(s=Sum(amount))
+            .values("s")[:1],
+            output_field=MONEY,
+        ),
+        Value(ZERO),
+        output_field=MONEY,
     )
-    if not VendorBill:
-        return None
 
-    today = date.today()
-    buckets = [(0, 30), (31, 60), (61, 90), (91, 99999)]
-    lines = []
-
-    for b in VendorBill.objects.all():
-        total = float(first_attr(b, ["total", "amount", "grand_total"], 0) or 0)
-        paid  = float(first_attr(b, ["paid", "amount_paid", "total_paid"], 0) or 0)
-        bal   = max(0.0, total - paid)
-        if bal <= 0: continue
-
-        due = first_attr(b, ["due_date", "due", "deadline", "date"]) or today
-        if isinstance(due, datetime): due = due.date()
-        age = (today - due).days
-
-        bucket_lbl = "Unknown"
-        for lo, hi in buckets:
-            if lo <= age <= hi:
-                bucket_lbl = f"{lo}-{hi if hi < 99999 else '+'}"
-                break
-
-        vendor = first_related(b, ["vendor", "supplier"])
-        lines.append({
-            "vendor": getattr(vendor, "name", None) or str(vendor or "Unknown"),
-            "ref": first_attr(b, ["number", "code", "ref", "reference"], f"BILL-{b.pk}"),
-            "due": due, "age": age, "balance": bal, "bucket": bucket_lbl,
-        })
 
-    if not lines: return None
-    lines.sort(key=lambda x: (x["vendor"], x["due"]))
-    rows = []
-    for x in lines:
-        due_str = x["due"].strftime("%Y-%m-%d") if isinstance(x["due"], (date, datetime)) else str(x["due"])
-        rows.append(
-            f'<tr><td style="padding:6px 10px;">{x["vendor"]}</td>'
-            f'<td style="padding:6px 10px;">{x["ref"]}</td>'
-            f'<td style="padding:6px 10px;">{due_str}</td>'
-            f'<td style="padding:6px 10px;text-align:right;">{x["age"]}</td>'
-            f'<td style="padding:6px 10px;text-align:right;">{x["balance"]:.2f}</td>'
-            f'<td style="padding:6px 10px;">{x["bucket"]}</td></tr>'
-        )
-    html = f"""
-    <html><body>
-      <h2 style="margin:0 0 8px 0;">Accounts Payable Aging</h2>
-      <table style="border-collapse:collapse;font-family:system-ui,Segoe UI,Roboto,sans-serif;">
-        <thead><tr><th style="text-align:left;border-bottom:1px solid #ddd;padding:6px 10px;">Vendor</th>
-        <th style="text-align:left;border-bottom:1px solid #ddd;padding:6px 10px;">Bill #</th>
-        <th style="text-align:left;border-bottom:1px solid #ddd;padding:6px 10px;">Due</th>
-        <th style="text-align:right;border-bottom:1px solid #ddd;padding:6px 10px;">Age</th>
-        <th style="text-align:right;border-bottom:1px solid #ddd;padding:6px 10px;">Balance</th>
-        <th style="text-align:left;border-bottom:1px solid #ddd;padding:6px 10px;">Bucket</th></tr></thead>
-        <tbody>{''.join(rows)}</tbody>
-      </table>
-    </body></html>
+def aging_report(qs, *, party, ref, total, paid, due: str, as_of: date, due_offset: int = 0):
     """
+    Shared AR/AP aging engine. Balance, days overdue and bucket label are
+    computed in SQL (Case/When on the due date), open items only.
+
+    `due` is a date field name; `due_offset` shifts it by a number of days
+    (payment terms) without doing date arithmetic in the database.
+    Returns (rows, parties, totals): detail rows ordered by party and due
+    date, per-party bucket subtotals from one GROUP BY query, and grand
+    totals folded from those subtotals.
+    """
+    def cutoff(days):
+        return as_of - timedelta(days=days + due_offset)
+
+    # Oldest bucket first: an item is in the first bucket whose lower bound it reaches.
+    bucket = Case(
+        *[When(**{f"{due}__lt": cutoff(lo - 1)}, then=Value(key)) for key, _l, lo in reversed(AGING_BUCKETS[1:])],
+        default=Value(AGING_BUCKETS[0][0]),
+        output_field=CharField(),
+    )
+    open_items = (
+        qs.annotate(
+            _party=party,
+            _ref=ref,
+            _total=ExpressionWrapper(total, output_field=MONEY),
+            _paid=paid,
+        )
+        .annotate(
+            _balance=ExpressionWrapper(F("_total") - F("_paid"), output_field=MONEY),
+            _overdue=ExpressionWrapper(Value(as_of, output_field=DateField()) - F(due), output_field=DurationField()),
+            _bucket=bucket,
+        )
+        .filter(_balance__gt=0)
+    )
+
+    labels = {key: label for key, label, _lo in AGING_BUCKETS}
+    rows = (
+        {
+            "name": r["_party"],
+            "ref": r["_ref"],
+            "due_date": r[due] + timedelta(days=due_offset),
+            "total": r["_total"],
+            "paid": r["_paid"],
+            "balance": r["_balance"],
+            "age": r["_overdue"].days - due_offset,
+            "bucket": labels[r["_bucket"]],
+        }
+        for r in open_items.order_by("_party", due, "pk")
+        .values("_party", "_ref", due, "_total", "_paid", "_balance", "_overdue", "_bucket")
+        .iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+    )
+
+    sums = {"total": Sum("_total"), "paid": Sum("_paid"), "balance": Sum("_balance")}
+    sums.update({key: Sum("_balance", filter=Q(_bucket=key)) for key, _l, _lo in AGING_BUCKETS})
+    parties = list(open_items.values("_party").annotate(**sums).order_by("_party"))
+
+    keys = list(sums)
+    totals = {k: ZERO for k in keys}
+    for p in parties:
+        p["name"] = p.pop("_party")
+        for k in keys:
+            p[k] = p[k] or ZERO
+            totals[k] += p[k]
+    return rows, parties, totals
+
+
+REPORT_STYLESHEET = "reports/report.css"
+
+
+def _render_report(template_name: str, context: dict, filename: str):
+    html = render_to_string(template_name, {"now": timezone.now(), "pdf": WEASY, **context})
     if not WEASY:
-        return ContentFile(html.encode(), name="ap_aging.html")
-    pdf = HTML(string=html, base_url=str(settings.BASE_DIR)).write_pdf()
-    return ContentFile(pdf, name="ap_aging.pdf")
+        return ContentFile(html.encode(), name=f"{filename}.html")
+    pdf = render_pdf(html, stylesheets=[REPORT_STYLESHEET])
+    return ContentFile(pdf, name=f"{filename}.pdf")
+
+
+def generate_ap_aging_pdf(as_of: Optional[str|date]=None, terms_days: int = 30,
+                          progress: Optional[JobProgress] = None, **kwargs):
+    """
+    Payables are received purchase orders not yet settled by the expenses
+    linked to them; they fall due `terms_days` after the order date.
+    """
+    PurchaseOrder = get_model("finance", "PurchaseOrder")
+    Expense = get_model("finance", "Expense")
+    if not PurchaseOrder or not Expense:
+        return None
+
+    as_of = _as_date(as_of, date.today())
+    rows, parties, totals = aging_report(
+        PurchaseOrder.objects.filter(received=True),
+        party=Coalesce("vendor__name", Value("Unknown")),
+        ref=F("po_number"),
+        total=F("unit_price") * F("quantity"),
+        paid=_paid_subquery(Expense, "purchase_order"),
+        due="order_date",
+        due_offset=int(terms_days or 0),
+        as_of=as_of,
+    )
+    if not parties:
+        return None
+    return _render_report(
+        "reports/ap_aging.html",
+        {"title": "Accounts Payable Aging", "as_of": as_of, "rows": track(rows, progress), "parties": parties, "totals": totals},
+        "ap_aging",
+    )
 
 
 # ---------- E) Student Documents (PDF) ----------
-def generate_student_docs_pdf(**kwargs):
+def _student_doc_rows(classroom: Any = ...):
+    """(student, document, expires) tuples; `classroom` narrows to one class (None = unassigned)."""
     StudentDocument = get_model("student", "StudentDocument")
-    if not StudentDocument:
-        return None
+    Student = StudentDocument._meta.get_field("student").related_model
+    qs = StudentDocument.objects.all()
+    if classroom is not ...:
+        qs = qs.filter(student__classroom=classroom)
+    return (
+        (owner, title, exp.strftime("%Y-%m-%d") if isinstance(exp, (date, datetime)) else (exp or ""))
+        for owner, title, exp in qs.annotate(
+            _owner=person_name_expr(Student, prefix="student__"),
+            _title=document_title_expr(StudentDocument),
+            _expires=field_expr(StudentDocument, "expires"),
+        )
+        # Class by class, matching the partitioned build's merge order.
+        .order_by(F("student__classroom__name").asc(nulls_last=True), "student__classroom", "-issue_date", "pk")
+        .values_list("_owner", "_title", "_expires")
+        .iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+    )
 
-    rows = []
-    for d in StudentDocument.objects.select_related("student").all():
-        owner = person_name(getattr(d, "student", None))
-        title = first_attr(d, ["name", "title", "doc_name"], "") or first_attr(d, ["doc_type", "type"], "")
-        exp   = first_attr(d, ["expiration_date", "expiry_date", "expire_on", "valid_to", "end_date"])
-        exp   = exp.strftime("%Y-%m-%d") if isinstance(exp, (date, datetime)) else (exp or "")
-        rows.append((owner, title, exp))
 
-    if not rows:
+def generate_student_docs_pdf(progress: Optional[JobProgress] = None, **kwargs):
+    if not get_model("student", "StudentDocument"):
         return None
+    return _render_student_docs(track(_student_doc_rows(), progress))
+
 
+def _render_student_docs(rows: Iterable[tuple]):
+    return render_paged(rows, _student_docs_html, pdf_name="student_documents.pdf", html_name="student_docs.html")
+
+
+def _student_docs_html(rows: Iterable[tuple], first: bool, last: bool) -> str:
     body = "\n".join(
         f'<tr><td style="padding:6px 10px;">{o}</td><td style="padding:6px 10px;">{t}</td>'
         f'<td style="padding:6px 10px;">{e}</td></tr>'
         for o, t, e in rows
     )
-    html = f"""
+    title = '<h2 style="margin:0 0 8px 0;">Student Documents</h2>' if first else ""
+    return f"""
     <html><body>
-      <h2 style="margin:0 0 8px 0;">Student Documents</h2>
+      {title}
       <table style="border-collapse:collapse;font-family:system-ui,Segoe UI,Roboto,sans-serif;">
         <thead><tr><th style="text-align:left;border-bottom:1px solid #ddd;padding:6px 10px;">Student</th>
         <th style="text-align:left;border-bottom:1px solid #ddd;padding:6px 10px;">Document</th>
@@ -313,23 +648,36 @@ def generate_student_docs_pdf(**kwargs):
       </table>
     </body></html>
     """
-    if not WEASY:
-        return ContentFile(html.encode(), name="student_docs.html")
-    pdf = HTML(string=html, base_url=str(settings.BASE_DIR)).write_pdf()
-    return ContentFile(pdf, name="student_documents.pdf")
 
 
-# ---------- F) Accounts Receivable Aging (PDF) — stub for now ----------
-def generate_ar_aging_pdf(**kwargs):
-    """
-    Placeholder: returns None so UI shows 'no data found' instead of failing.
-    If you share your AR model (e.g., StudentFee/Invoice), I'll wire it up.
-    """
-    return None
+# ---------- F) Accounts Receivable Aging (PDF) ----------
+def generate_ar_aging_pdf(as_of: Optional[str|date]=None, progress: Optional[JobProgress] = None, **kwargs):
+    """Receivables are invoices net of their payments, aged on the invoice due date."""
+    Invoice = get_model("finance", "Invoice")
+    if not Invoice:
+        return None
+
+    as_of = _as_date(as_of, date.today())
+    rows, parties, totals = aging_report(
+        Invoice.objects.exclude(status="DRAFT"),
+        party=Concat("student__first_name", Value(" "), "student__last_name"),
+        ref=F("invoice_number"),
+        total=F("amount"),
+        paid=F("paid_total"),
+        due="due_date",
+        as_of=as_of,
+    )
+    if not parties:
+        return None
+    return _render_report(
+        "reports/ar_aging.html",
+        {"title": "Accounts Receivable Aging", "as_of": as_of, "rows": track(rows, progress), "parties": parties, "totals": totals},
+        "ar_aging",
+    )
 
 
 # ---------- G) Inventory Valuation (Excel) — best-effort ----------
-def generate_inventory_valuation(**kwargs):
+def generate_inventory_valuation(progress: Optional[JobProgress] = None, **kwargs):
     """
     Attempts to value inventory as qty * cost using common model names/fields.
     Returns None if no recognizable model/fields are found.
@@ -338,55 +686,633 @@ def generate_inventory_valuation(**kwargs):
     if not Product:
         return None
 
-    rows = []
-    for p in Product.objects.all():
-        name = first_attr(p, ["name", "title", "label"], f"Item-{p.pk}")
-        qty  = float(first_attr(p, ["quantity", "qty", "stock", "on_hand"], 0) or 0)
-        cost = float(first_attr(p, ["cost", "unit_cost", "purchase_price"], 0) or 0)
-        rows.append({"Item": name, "Qty": qty, "Cost": cost, "Value": qty * cost})
+    name = field_expr(Product, "label")
+    qty  = Coalesce(field_expr(Product, "quantity", 0), Value(0))
+    cost = Coalesce(field_expr(Product, "cost", ZERO), Value(ZERO))
 
-    if not rows:
-        return None
+    rows = (
+        Product.objects.annotate(
+            _name=name if isinstance(name, F) else Concat(Value("Item-"), Cast("pk", output_field=CharField())),
+            _qty=qty,
+            _cost=ExpressionWrapper(cost, output_field=MONEY),
+            _value=ExpressionWrapper(qty * cost, output_field=MONEY),
+        )
+        .order_by("_name", "pk")
+        .values_list("_name", "_qty", "_cost", "_value")
+        .iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+    )
+    return write_xlsx(track(rows, progress), ["Item", "Qty", "Cost", "Value"], "Inventory Valuation",
+                      "inventory_valuation.xlsx")
+
+
+# ---------- H) Profit & Loss (PDF) ----------
+PNL_COMPARE = {"previous_period": "Previous period", "previous_year": "Previous year"}
+PNL_BASES = ("accrual", "cash")
+PNL_PERIODS = {"month": TruncMonth, "quarter": TruncQuarter, "year": TruncYear}
+PNL_MAX_COLUMNS = 12
 
-    df = pd.DataFrame(rows).sort_values(["Item"])
-    buf = BytesIO()
-    with pd.ExcelWriter(buf, engine="openpyxl") as w:
-        df.to_excel(w, index=False, sheet_name="Inventory Valuation")
-    return ContentFile(buf.getvalue(), name="inventory_valuation.xlsx")
 
+class PnlSource(NamedTuple):
+    """One grouped query feeding the statement: a line per `line` value (or the fixed `label`)."""
+    section: str
+    label: str
+    model: tuple[str, str]
+    date_field: str
+    amount: Any
+    filters: Q = Q()
+    exclude: Q = Q()
+    line: Optional[str] = None
 
-# ---------- H) Profit & Loss (PDF) — needs implementation ----------
-def generate_pnl_pdf(start: date, end: date, **kwargs):
+
+def pnl_sources(basis: str = "accrual") -> list[PnlSource]:
     """
-    Profit & Loss report - needs implementation based on your financial models
+    Revenue is invoiced (accrual) or collected (cash); cost of sales is
+    received purchase orders, so expenses that settle a purchase order are
+    left out of operating costs to avoid counting them twice.
     """
-    # TODO: Implement P&L logic using your financial models
-    # Example: Query Revenue, Expenses, COGS models and calculate profit
+    if basis == "cash":
+        revenue = PnlSource("revenue", "Fees collected", ("finance", "Payment"), "date", F("amount"))
+    else:
+        revenue = PnlSource("revenue", "Fees invoiced", ("finance", "Invoice"), "issue_date", F("amount"),
+                            exclude=Q(status="DRAFT"))
+    return [
+        revenue,
+        PnlSource("cogs", "Purchases received", ("finance", "PurchaseOrder"), "order_date",
+                  ExpressionWrapper(F("unit_price") * F("quantity"), output_field=MONEY), filters=Q(received=True)),
+        PnlSource("opex", "", ("finance", "Expense"), "date", Abs("amount"),
+                  filters=Q(purchase_order__isnull=True), line="category"),
+        PnlSource("opex", "Payroll", ("finance", "SalaryPayment"), "date", F("amount")),
+    ]
+
+
+def _shift_year(d: date, years: int) -> date:
+    try:
+        return d.replace(year=d.year + years)
+    except ValueError:  # Feb 29
+        return d.replace(year=d.year + years, day=28)
+
+
+def pnl_comparison_window(start: date, end: date, compare: Optional[str]) -> Optional[tuple[date, date]]:
+    if compare == "previous_year":
+        return _shift_year(start, -1), _shift_year(end, -1)
+    if compare == "previous_period":
+        prev_end = start - timedelta(days=1)
+        return prev_end - (end - start), prev_end
     return None
 
 
-# ---------- I) Balance Sheet (PDF) — needs implementation ----------
-def generate_balance_sheet_pdf(**kwargs):
+def _pnl_period(start: date, end: date, period: Optional[str]) -> str:
+    """Explicit `period`, else the finest of month/quarter/year that fits PNL_MAX_COLUMNS."""
+    if period in PNL_PERIODS:
+        return period
+    months = (end.year - start.year) * 12 + end.month - start.month + 1
+    if months <= PNL_MAX_COLUMNS:
+        return "month"
+    if months <= PNL_MAX_COLUMNS * 3:
+        return "quarter"
+    return "year"
+
+
+def _pnl_columns(start: date, end: date, period: str) -> list[tuple[date, str]]:
+    """(bucket start, label) for every bucket overlapping [start, end]."""
+    step = {"month": 1, "quarter": 3, "year": 12}[period]
+    month = start.month - (start.month - 1) % step
+    lo = date(start.year, month, 1)
+    columns = []
+    while lo <= end:
+        if period == "month":
+            label = lo.strftime("%b %Y")
+        elif period == "quarter":
+            label = f"Q{(lo.month - 1) // 3 + 1} {lo.year}"
+        else:
+            label = str(lo.year)
+        columns.append((lo, label))
+        n = lo.month - 1 + step
+        lo = date(lo.year + n // 12, n % 12 + 1, 1)
+    return columns
+
+
+def pnl_statement(start: date, end: date, compare: Optional[str] = None, basis: str = "accrual",
+                  period: Optional[str] = None) -> dict:
     """
-    Balance Sheet report - needs implementation based on your financial models
+    Category x period P&L matrix from one grouped aggregate query per source
+    (four in all, whatever the range). The comparison window is folded into
+    the same queries: a Case tags each row with its window, so the database
+    returns (window, bucket, line, total) groups and Python only pivots them.
+
+    Returns {"columns", "sections", "net", "compare"} where each section holds
+    {"key", "title", "lines", "total"} and every line/total is
+    {"label", "cells", "total", "previous", "change", "change_pct"}.
     """
-    # TODO: Implement balance sheet logic using Assets, Liabilities, Equity models
-    return None
+    period = _pnl_period(start, end, period)
+    columns = _pnl_columns(start, end, period)
+    index = {lo: i for i, (lo, _label) in enumerate(columns)}
+    previous = pnl_comparison_window(start, end, compare)
+
+    # (section, label) -> [cells, previous total], in first-seen order
+    lines: dict[tuple[str, str], list] = {}
+    for source in pnl_sources(basis):
+        model = get_model(*source.model)
+        if not model:
+            continue
+        field = source.date_field
+        current = Q(**{f"{field}__range": (start, end)})
+        window = current | Q(**{f"{field}__range": previous}) if previous else current
+        group = [source.line] if source.line else []
+        qs = (
+            model.objects.filter(window, source.filters).exclude(source.exclude)
+            .annotate(
+                _current=Case(When(current, then=Value(True)), default=Value(False)),
+                _bucket=PNL_PERIODS[period](field),
+            )
+            .order_by()
+            .values("_current", "_bucket", *group)
+            .annotate(_total=Sum(source.amount, output_field=MONEY))
+        )
+        choices = dict(model._meta.get_field(source.line).choices or ()) if source.line else {}
+        for row in qs:
+            value = row.get(source.line) if source.line else None
+            label = choices.get(value, value or "Other") if source.line else source.label
+            cells = lines.setdefault((source.section, label), [[ZERO] * len(columns), ZERO])
+            amount = row["_total"] or ZERO
+            if row["_current"]:
+                bucket = row["_bucket"]
+                cells[0][index[bucket.date() if isinstance(bucket, datetime) else bucket]] += amount
+            else:
+                cells[1] += amount
+
+    def line(label, cells, prev):
+        total = sum(cells, ZERO)
+        change = total - prev if previous else None
+        pct = (change / abs(prev) * 100).quantize(Decimal("0.1")) if previous and prev else None
+        return {"label": label, "cells": cells, "total": total, "previous": prev if previous else None,
+                "change": change, "change_pct": pct}
+
+    def combine(label, parts, signs):
+        cells = [sum((s * p["cells"][i] for p, s in zip(parts, signs)), ZERO) for i in range(len(columns))]
+        prev = sum((s * (p["previous"] or ZERO) for p, s in zip(parts, signs)), ZERO)
+        return line(label, cells, prev)
+
+    sections = []
+    for key, title in (("revenue", "Revenue"), ("cogs", "Cost of Sales"), ("opex", "Operating Expenses")):
+        rows = [line(label, c[0], c[1]) for (section, label), c in lines.items() if section == key]
+        if key == "opex":
+            rows.sort(key=itemgetter("label"))
+        sections.append({"key": key, "title": title, "lines": rows,
+                         "total": combine(f"Total {title.lower()}", rows, [1] * len(rows))})
 
+    revenue, cogs, opex = (s["total"] for s in sections)
+    gross = combine("Gross profit", [revenue, cogs], [1, -1])
+    net = combine("Net profit", [gross, opex], [1, -1])
+    sections[1]["after"] = gross
+    return {
+        "columns": [label for _lo, label in columns],
+        "sections": sections,
+        "net": net,
+        "compare": {"window": previous, "label": PNL_COMPARE.get(compare)},
+        "has_data": bool(lines),
+    }
 
-# ---------- J) Payroll vs Attendance (Excel) — needs implementation ----------
-def generate_payroll_vs_att_excel(start: date, end: date, **kwargs):
+
+def generate_pnl_pdf(start: Optional[str|date]=None, end: Optional[str|date]=None, compare: Optional[str] = None,
+                     basis: str = "accrual", period: Optional[str] = None, **kwargs):
+    start = _as_date(start, date.today().replace(month=1, day=1))
+    end = _as_date(end, date.today())
+    if compare not in PNL_COMPARE:
+        compare = None
+    if basis not in PNL_BASES:
+        basis = "accrual"
+    statement = pnl_statement(start, end, compare=compare, basis=basis, period=period)
+    if not statement.pop("has_data"):
+        return None
+    return _render_report(
+        "reports/pnl.html",
+        {"title": "Profit & Loss", "start": start, "end": end, "basis": basis, **statement},
+        f"pnl_{start}_{end}",
+    )
+
+
+# ---------- I) Balance Sheet (PDF) ----------
+def _open_balance(qs, total, paid, **extra):
+    """Count and sum of positive (total - paid) balances over `qs` in one aggregate query."""
+    open_items = qs.annotate(
+        _balance=ExpressionWrapper(total - paid, output_field=MONEY),
+    ).filter(_balance__gt=0)
+    sums = open_items.aggregate(count=Count("pk"), balance=Sum("_balance"), **extra)
+    return {k: v if v is not None else ZERO for k, v in sums.items()}
+
+
+def balance_sheet(as_of: date) -> dict:
     """
-    Payroll vs Attendance report - needs implementation
+    Point-in-time position: treasury cash from the daily snapshots (see
+    finance.balances) plus open receivables, payables and unpaid salaries,
+    each one aggregate query with payments counted only up to `as_of`.
     """
-    # TODO: Implement payroll vs attendance comparison logic
-    return None
+    from finance.balances import balances_as_of
+
+    Invoice = get_model("finance", "Invoice")
+    Payment = get_model("finance", "Payment")
+    PurchaseOrder = get_model("finance", "PurchaseOrder")
+    Expense = get_model("finance", "Expense")
+    SalaryRecord = get_model("hr", "SalaryRecord")
+    SalaryPayment = get_model("finance", "SalaryPayment")
+
+    treasuries = balances_as_of(as_of)
+    assets = [{"label": t["name"], "amount": t["balance"]} for t in treasuries]
+    liabilities = []
+
+    if Invoice and Payment:
+        ar = _open_balance(
+            Invoice.objects.filter(issue_date__lte=as_of).exclude(status="DRAFT"),
+            F("amount"), _paid_subquery(Payment, "invoice", date__lte=as_of),
+            overdue=Sum("_balance", filter=Q(due_date__lt=as_of)),
+        )
+        assets.append({"label": "Accounts receivable", "amount": ar["balance"], "count": ar["count"],
+                       "note": f"{ar['overdue']:.2f} overdue"})
+    if PurchaseOrder and Expense:
+        ap = _open_balance(
+            PurchaseOrder.objects.filter(received=True, order_date__lte=as_of),
+            F("unit_price") * F("quantity"), _paid_subquery(Expense, "purchase_order", date__lte=as_of),
+        )
+        liabilities.append({"label": "Accounts payable", "amount": ap["balance"], "count": ap["count"]})
+    if SalaryRecord and SalaryPayment:
+        sp = _open_balance(
+            SalaryRecord.objects.filter(month__lte=as_of),
+            F("net"), _paid_subquery(SalaryPayment, "salary_record", date__lte=as_of),
+        )
+        liabilities.append({"label": "Salaries payable", "amount": sp["balance"], "count": sp["count"]})
+
+    total_assets = sum((a["amount"] for a in assets), ZERO)
+    total_liabilities = sum((l["amount"] for l in liabilities), ZERO)
+    return {
+        "assets": assets,
+        "liabilities": liabilities,
+        "total_assets": total_assets,
+        "total_liabilities": total_liabilities,
+        "equity": total_assets - total_liabilities,
+        "snapshot": min((t["snapshot"] for t in treasuries if t["snapshot"]), default=None),
+    }
 
 
-# ---------- K) Low Stock (Excel) — needs implementation ----------
-def generate_low_stock_excel(**kwargs):
+def generate_balance_sheet_pdf(as_of: Optional[str|date]=None, **kwargs):
+    as_of = _as_date(as_of, date.today())
+    sheet = balance_sheet(as_of)
+    if not sheet["assets"] and not sheet["liabilities"]:
+        return None
+    return _render_report(
+        "reports/balance_sheet.html",
+        {"title": "Balance Sheet", "as_of": as_of, **sheet},
+        f"balance_sheet_{as_of}",
+    )
+
+
+# ---------- J) Payroll vs Attendance (Excel) ----------
+PAYROLL_ATT_HEADERS = [
+    "Staff", "Month", "Working Days", "Present", "Absent", "Sick", "Leave", "Vacation Days",
+    "Gross", "Deduct", "Net", "Expected Net", "Variance", "Flag",
+]
+
+
+def _weekend() -> frozenset:
+    return frozenset(int(d) for d in getattr(settings, "PAYROLL_WEEKEND_DAYS", (5, 6)))
+
+
+@lru_cache(maxsize=None)
+def _working_days(month: date, start: date, end: date, weekend: frozenset) -> int:
+    """Working days of `month` inside [start, end], the window attendance is counted over."""
+    lo, hi = memo.month_bounds(month, month)[0]
+    lo, hi = max(lo, start), min(hi, end)
+    return sum(1 for i in range((hi - lo).days + 1) if (lo + timedelta(days=i)).weekday() not in weekend)
+
+
+def _vacation_days(start: date, end: date, weekend: frozenset) -> dict[tuple[int, date], int]:
+    """Approved vacation working days per (staff_id, month), clipped to [start, end]."""
+    Vacation = get_model("hr", "Vacation")
+    days: dict[tuple[int, date], int] = {}
+    if not Vacation:
+        return days
+    for staff_id, lo, hi in (
+        Vacation.objects.filter(approved=True, start_date__lte=end, end_date__gte=start)
+        .values_list("staff_id", "start_date", "end_date")
+        .iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+    ):
+        d, hi = max(lo, start), min(hi, end)
+        while d <= hi:
+            if d.weekday() not in weekend:
+                key = (staff_id, d.replace(day=1))
+                days[key] = days.get(key, 0) + 1
+            d += timedelta(days=1)
+    return days
+
+
+def payroll_vs_attendance(start: date, end: date, tolerance: Decimal = Decimal("1.00")) -> list[dict]:
     """
-    Low Stock report - needs implementation
+    Reconciles salary records with attendance per (staff, month).
+
+    Attendance counts by status and salary figures each come from one
+    grouped query over the whole range; approved vacations are one more.
+    The three are joined in a dict keyed by (staff_id, month). Expected net
+    pro-rates gross by the days covered (present plus approved vacation) over
+    the month's working days, both counted inside [start, end] so a range
+    that starts or ends mid-month compares like with like; rows whose net
+    differs by more than `tolerance`, or that lack either side, are flagged.
     """
-    # TODO: Implement low stock alert logic
-    return None
+    StaffAttendance = get_model("hr", "StaffAttendance")
+    SalaryRecord = get_model("hr", "SalaryRecord")
+    if not StaffAttendance or not SalaryRecord:
+        return []
+
+    weekend = _weekend()
+    frame: dict[tuple[int, date], dict] = {}
+
+    def row(staff_id, month, first, last):
+        return frame.setdefault((staff_id, month), {
+            "staff": f"{first} {last}", "month": month,
+            "present": 0, "absent": 0, "sick": 0, "leave": 0, "recorded": 0, "salary": None,
+        })
+
+    statuses = {"present": "PRESENT", "absent": "ABSENT", "sick": "SICK", "leave": "LEAVE"}
+    for a in (
+        StaffAttendance.objects.filter(date__range=(start, end))
+        .annotate(_month=TruncMonth("date"))
+        .order_by()
+        .values("staff_id", "_month", "staff__first_name", "staff__last_name")
+        .annotate(recorded=Count("pk"), **{k: Count("pk", filter=Q(status=v)) for k, v in statuses.items()})
+        .iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+    ):
+        r = row(a["staff_id"], a["_month"], a["staff__first_name"], a["staff__last_name"])
+        r.update({k: a[k] for k in (*statuses, "recorded")})
+
+    for staff_id, month, first, last, gross, deduct, net in (
+        SalaryRecord.objects.filter(month__range=(start.replace(day=1), end))
+        .values_list("staff_id", "month", "staff__first_name", "staff__last_name", "gross", "deduct", "net")
+        .iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+    ):
+        row(staff_id, month.replace(day=1), first, last)["salary"] = (gross, deduct, net)
+
+    vacations = _vacation_days(start, end, weekend)
+    tolerance = Decimal(str(tolerance))
+    out = []
+    for (staff_id, month), r in frame.items():
+        working = _working_days(month, start, end, weekend)
+        vacation = vacations.get((staff_id, month), 0)
+        covered = min(r["present"] + vacation, working)
+        salary = r.pop("salary")
+        gross, deduct, net = salary or (None, None, None)
+        expected = variance = None
+        if salary is None:
+            flag = "No salary record"
+        elif not r["recorded"] and not vacation:
+            flag = "No attendance"
+        else:
+            expected = (gross * covered / working).quantize(Decimal("0.01")) if working else gross
+            variance = net - expected
+            flag = "Mismatch" if abs(variance) > tolerance else ""
+        out.append({
+            **r, "working": working, "vacation": vacation, "gross": gross, "deduct": deduct, "net": net,
+            "expected": expected, "variance": variance, "flag": flag,
+        })
+    out.sort(key=lambda r: (r["staff"].lower(), r["month"]))
+    return out
+
+
+def generate_payroll_vs_att_excel(start: Optional[str|date]=None, end: Optional[str|date]=None,
+                                  tolerance="1.00", only_flagged: bool = False,
+                                  progress: Optional[JobProgress] = None, **kwargs):
+    start = _as_date(start, date.today().replace(day=1))
+    end = _as_date(end, date.today())
+    rows = payroll_vs_attendance(start, end, Decimal(str(tolerance or 0)))
+    if only_flagged:
+        rows = [r for r in rows if r["flag"]]
+    if progress:
+        progress.phase("rows", total=len(rows))
+    return write_xlsx(
+        (
+            [r["staff"], r["month"].strftime("%Y-%m"), r["working"], r["present"], r["absent"], r["sick"],
+             r["leave"], r["vacation"], r["gross"], r["deduct"], r["net"], r["expected"], r["variance"], r["flag"]]
+            for r in track(rows, progress)
+        ),
+        PAYROLL_ATT_HEADERS,
+        "Payroll vs Attendance",
+        f"payroll_vs_attendance_{start}_{end}.xlsx",
+    )
+
+
+# ---------- K) Low Stock (Excel / PDF) ----------
+LOW_STOCK_FIELDS = ("name", "sku", "vendor_name", "quantity", "reorder_level", "restocked_on", "suggested_qty", "unit_price")
+
+
+def low_stock_items(threshold=None) -> list[dict]:
+    """
+    The low-stock list shared by the LOW_STOCK reports and the alert email:
+    one query (Item.objects.low_stock), evaluated once.
+    """
+    Item = get_model("inventory", "Item")
+    if not Item:
+        return []
+    if threshold in ("", None):
+        threshold = None
+    return list(
+        Item.objects.low_stock(threshold).with_reorder_info()
+        .order_by("name", "pk")
+        .values(*LOW_STOCK_FIELDS)
+    )
+
+
+def generate_low_stock_excel(threshold=None, progress: Optional[JobProgress] = None, **kwargs):
+    items = low_stock_items(threshold)
+    return write_xlsx(
+        (
+            [i["name"], i["sku"], i["vendor_name"] or "", i["quantity"], i["reorder_level"], i["restocked_on"],
+             i["suggested_qty"], i["suggested_qty"] * i["unit_price"]]
+            for i in track(items, progress)
+        ),
+        ["Item", "SKU", "Vendor", "Qty", "Reorder Level", "Last Restock", "Suggested Qty", "Est. Cost"],
+        "Low Stock",
+        "low_stock.xlsx",
+    )
+
+
+def generate_low_stock_pdf(threshold=None, progress: Optional[JobProgress] = None, **kwargs):
+    items = low_stock_items(threshold)
+    if not items:
+        return None
+    for i in items:
+        i["est_cost"] = i["suggested_qty"] * i["unit_price"]
+    return _render_report(
+        "reports/inventory_low_stock.html",
+        {"title": "Inventory — Low Stock", "items": track(items, progress), "threshold": threshold,
+         "total_cost": sum((i["est_cost"] for i in items), ZERO)},
+        "low_stock",
+    )
+
+
+# ---------- L) Invoice PDFs (ZIP / merged PDF) ----------
+INVOICE_TEMPLATE = "finance/invoice_template.html"
+INVOICE_STYLESHEET = "finance/invoice.css"
+
+
+def invoice_batch(start=None, end=None, status=None, classroom=None):
+    """
+    Invoices issued in [start, end], optionally by status (a code or a list)
+    and the student's classroom id. One query: the student comes along and
+    paid_total/balance are stored on the invoice.
+    """
+    Invoice = get_model("finance", "Invoice")
+    if not Invoice:
+        return []
+    qs = Invoice.objects.select_related("student")
+    if start:
+        qs = qs.filter(issue_date__gte=_as_date(start, None))
+    if end:
+        qs = qs.filter(issue_date__lte=_as_date(end, None))
+    if status:
+        qs = qs.filter(status__in=[status] if isinstance(status, str) else status)
+    if classroom:
+        qs = qs.filter(student__classroom_id=classroom)
+    return list(qs.order_by("issue_date", "invoice_number"))
+
+
+def _invoice_pdfs(invoices, progress: Optional[JobProgress]):
+    """Renders invoices lazily through the PDF pool with one compiled template."""
+    from finance.documents import invoice_context
+
+    template = get_template(INVOICE_TEMPLATE)
+    documents = (
+        (template.render({**invoice_context(invoice), "pdf": True}), [INVOICE_STYLESHEET])
+        for invoice in invoices
+    )
+    if progress:
+        progress.phase("rendering", total=len(invoices))
+    return track(render_stream(documents), progress)
+
+
+def generate_invoices_zip(start=None, end=None, status=None, classroom=None,
+                          progress: Optional[JobProgress] = None, **kwargs):
+    """One PDF per invoice, written into the archive as each one is rendered."""
+    invoices = invoice_batch(start, end, status, classroom)
+    if not invoices:
+        return None
+    out = tempfile.TemporaryFile()
+    # PDFs are already compressed; storing them keeps the archive cheap to write.
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_STORED) as archive:
+        for invoice, pdf in zip(invoices, _invoice_pdfs(invoices, progress)):
+            archive.writestr(f"Invoice-{invoice.invoice_number}.pdf", pdf)
+    out.seek(0)
+    return File(out, name="invoices.zip")
+
+
+def generate_invoices_pdf(start=None, end=None, status=None, classroom=None,
+                          progress: Optional[JobProgress] = None, **kwargs):
+    """All matching invoices in one PDF, ready to print; the ZIP export instead without pypdf."""
+    if not CAN_MERGE:
+        return generate_invoices_zip(start, end, status, classroom, progress=progress)
+    invoices = invoice_batch(start, end, status, classroom)
+    if not invoices:
+        return None
+    merged = merge_pdfs(_invoice_pdfs(invoices, progress))
+    return ContentFile(merged, name="invoices.pdf")
+
+
+# ---------- Partitioned builds ----------
+class Partitioned(NamedTuple):
+    """
+    How a report splits into independent slices that workers build in parallel.
+
+    partitions(**params) -> list of JSON-serializable partition keys
+    build(partition, first, last, **params) -> (rendered part bytes | None, JSON-serializable summary)
+    merge(parts, summaries, **params) -> ContentFile | None; parts (an iterator of
+        bytes) and summaries are in partition order, empty parts left out
+
+    Parts go to storage rather than through the result backend, so only the
+    summaries travel with the chord.
+    """
+    partitions: Callable[..., list]
+    build: Callable[..., tuple[Optional[bytes], Any]]
+    merge: Callable[..., Any]
+
+
+def render_part(rows: Iterable, chunk_html: Callable[[list, bool, bool], str], first: bool, last: bool):
+    """
+    One partition's slice of a render_paged document, as (pdf, row count).
+    Only the first partition gets the title and only the last the totals,
+    so those two render even without rows; other empty slices give None.
+    Pages are numbered when merge_parts joins the slices.
+    """
+    count = 0
+
+    def documents():
+        nonlocal count
+        seen = False
+        for chunk, head, tail in _chunks(rows, getattr(settings, "REPORT_PDF_CHUNK_ROWS", 1000)):
+            seen = True
+            count += len(chunk)
+            yield chunk_html(chunk, first and head, last and tail), ()
+        if not seen and (first or last):
+            yield chunk_html([], first, last), ()
+
+    parts = render_stream(documents())
+    head = next(parts, None)
+    if head is None:
+        return None, 0
+    return merge_pdfs(chain([head], parts)), count
+
+
+def merge_parts(parts: Iterable[bytes], summaries: list, pdf_name: str):
+    """Joins rendered slices into one page-numbered PDF; None when no slice had rows."""
+    if not sum(s["count"] for s in summaries):
+        return None
+    return ContentFile(merge_pdfs(parts, number_pages=True), name=pdf_name)
+
+
+def month_windows(start: date, end: date) -> list[tuple[date, date]]:
+    """Calendar months covering [start, end], clipped to the range."""
+    windows = []
+    lo = start
+    while lo <= end:
+        nxt = (lo.replace(day=1) + timedelta(days=32)).replace(day=1)
+        hi = min(nxt - timedelta(days=1), end)
+        windows.append((lo, hi))
+        lo = nxt
+    return windows
+
+
+# Cash flow: one partition per calendar month.
+def _cash_flow_partitions(start=None, end=None, **kwargs):
+    return [[lo.isoformat(), hi.isoformat()] for lo, hi in month_windows(*_cash_flow_window(start, end))]
+
+
+def _cash_flow_partial(partition, first, last, start=None, end=None, **kwargs):
+    start, end = _cash_flow_window(start, end)
+    lo, hi = (date.fromisoformat(d) for d in partition)
+    rows, _totals = cash_flow_memoized(lo, hi)
+    # The last slice prints the totals of the whole range; closed months come from the memo.
+    totals = cash_flow_memoized(start, end)[1] if last else {}
+    pdf, count = render_part(rows, partial(_cash_flow_html, start=start, end=end, totals=totals), first, last)
+    return pdf, {"count": count}
+
+
+def _cash_flow_merge(parts, summaries, start=None, end=None, **kwargs):
+    start, end = _cash_flow_window(start, end)
+    return merge_parts(parts, summaries, f"cash_flow_{start}_{end}.pdf")
+
+
+# Student documents: one partition per classroom, plus unassigned students.
+def _student_docs_partitions(**kwargs):
+    Classroom = get_model("student", "Classroom")
+    if not Classroom or not get_model("student", "StudentDocument"):
+        return []
+    return list(Classroom.objects.order_by("name", "pk").values_list("pk", flat=True)) + [None]
+
+
+def _student_docs_partial(partition, first, last, **kwargs):
+    pdf, count = render_part(_student_doc_rows(classroom=partition), _student_docs_html, first, last)
+    return pdf, {"count": count}
+
+
+def _student_docs_merge(parts, summaries, **kwargs):
+    return merge_parts(parts, summaries, "student_documents.pdf")
+
+
+CASH_FLOW_PARTITIONS = Partitioned(_cash_flow_partitions, _cash_flow_partial, _cash_flow_merge)
+STUDENT_DOCS_PARTITIONS = Partitioned(_student_docs_partitions, _student_docs_partial, _student_docs_merge)